@@ -1,7 +1,6 @@
 # action_recorder.py
 
 import os
-import json
 import threading
 import time
 from datetime import datetime
@@ -13,6 +12,15 @@ import ctypes
 from ctypes import wintypes
 import pyautogui
 from storage import StorageManager
+from config import ConfigService
+from event_bus import EventBus
+from events import ClickEvent, DragEvent, ScrollEvent, KeyEvent
+from settle import SettleCapture
+from capture_profiles import UNKNOWN_APP
+from tracing import span, traced
+from trajectory import TrajectoryBuffer
+from scroll_gesture import ScrollAccumulator
+from input_process import InputProcess, MOVE, CLICK, SCROLL, PRESS
 from frozen_dir import app_path
 import platform
 import string
@@ -21,7 +29,6 @@ from threading import Timer
 
 
 class ActionRecorder(QtCore.QObject):
-    action_recorded = QtCore.pyqtSignal(str)
 
     def __init__(self, log_file='log/user_actions.log', save_path='screenshots'):
         super().__init__()
@@ -30,31 +37,34 @@ class ActionRecorder(QtCore.QObject):
         self.save_path = os.path.join(base_path, save_path)
         # os.makedirs(self.save_path, exist_ok=True)
         self.storage_manager = StorageManager(self.save_path)
+        self.storage_manager.foreground_app = self.get_active_app
+        self.event_bus = EventBus()  # 向界面批量传递事件记录
         self.running = False
-        self.data = []
+        self.data = []  # 本次运行已记录事件的 JSONL 行（字节），结束时汇总写出
         self.lock = threading.Lock()
+        self.event_seq = 0  # 会话内递增的事件编号，与会话日志中的记录对应
 
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
         filename = f"user_actions_real_time_{timestamp}.jsonl"
         self.log_filename = filename
 
-        # 获取屏幕宽度和高度（用于计算相对位置）
-        self.screen_width, self.screen_height = pyautogui.size()
+        # 显示器布局缓存（用于计算相对位置，不再每次查询系统）
+        self.display = self.storage_manager.display
 
         # ---------- 拖拽相关 ----------
         self.dragging = False
         self.drag_start_x = None
         self.drag_start_y = None
+        self.drag_start_time = None
+
+        # ---------- 鼠标轨迹 ----------
+        # 鼠标移动只写入轨迹缓冲区，当前光标位置也从这里读取，不再查询系统
+        self.trajectory = TrajectoryBuffer()
 
         # ---------- 滚动累积相关 ----------
-        self.scroll_accumulator = {
-            "direction": None,
-            "acc_dy": 0,
-            "x": None,
-            "y": None,
-            "last_time": 0.0
-        }
+        self.scroll = ScrollAccumulator()
         self.scroll_timeout = 2.0
+        self.key_debounce = 1.5        # 停止输入多久后视为一次完整输入
 
         # ---------- 键盘连续输入相关 ----------
         self.current_action = ""       # 用于累计用户连续输入的字符串
@@ -62,7 +72,26 @@ class ActionRecorder(QtCore.QObject):
         self.last_key_time = time.time()
         self.max_action_length = 50    # 单次动作最大长度，可自行调整
 
-        self.mouse_listener = mouse.Listener(on_click=self.on_click, on_scroll=self.on_scroll)
+        # ---------- 操作后稳定画面 ----------
+        # 可选：事件记录后在独立线程中等画面稳定，再截取一张记录操作结果
+        self.settle = SettleCapture(self.storage_manager)
+
+        # 滚动超时与按键合并间隔可在运行中通过配置文件调整
+        config_service = ConfigService()
+        self.apply_config(config_service)
+        config_service.subscribe(self.apply_config)
+
+        # 默认在独立子进程中监听输入，子进程无法启动时退回进程内监听
+        self.input_process = None
+        if config_service.get_bool('recorder.input_process'):
+            # 事件时间使用子进程回调中的时间戳，不含主进程分发的延迟
+            self.input_process = InputProcess({
+                MOVE: lambda t, x, y: self.on_move(x, y, t),
+                CLICK: lambda t, x, y, button, pressed: self.on_click(x, y, button, pressed, t),
+                SCROLL: lambda t, x, y, dx, dy: self.on_scroll(x, y, dx, dy, t),
+                PRESS: lambda t, key: self.on_press(key, t),
+            }, on_failure=self._on_input_process_failed)
+        self.mouse_listener = mouse.Listener(on_move=self.on_move, on_click=self.on_click, on_scroll=self.on_scroll)
         self.keyboard_listener = keyboard.Listener(on_press=self.on_press)
 
         # 启动一个线程来监控滚动超时
@@ -169,41 +198,80 @@ class ActionRecorder(QtCore.QObject):
         # ---------- 键盘press前截图 ----------
         self.is_press_start = True
         self.press_start_screenshot = None
+        self.press_active_app = None  # 连续输入开始时的前台应用，决定截图规则
 
         # ---------- 鼠标press前截图 ----------
         self.is_click_press_start = True
         self.click_press_start_screenshot = None
 
-        # ---------- 鼠标scroll前截图 ----------
-        self.is_scroll_press_start = True
-        self.scroll_press_start_screenshot = None
+    @property
+    def screen_width(self):
+        return self.display.primary_size()[0]
+
+    @property
+    def screen_height(self):
+        return self.display.primary_size()[1]
+
+    def apply_config(self, service, changed=None):
+        self.scroll_timeout = service.get_float('recorder.scroll_timeout')
+        self.scroll.configure(idle_timeout=self.scroll_timeout,
+                              move_threshold=service.get_float('recorder.scroll_move_threshold'))
+        self.key_debounce = service.get_float('recorder.key_debounce')
+        self.path_tolerance = service.get_float('recorder.path_tolerance')
+        self.drag_threshold = service.get_float('recorder.drag_threshold')
+        self.trajectory.configure(min_distance=service.get_float('recorder.move_min_distance'))
+        self.settle.configure(service.section('settle'))
+        if changed:
+            thread_safe_logging('info', f"记录器已应用新配置: 滚动超时 {self.scroll_timeout}s，"
+                                        f"按键合并间隔 {self.key_debounce}s")
 
     def start_recording(self):
         if not self.running:
             self.running = True
-            self.mouse_listener.start()
-            self.keyboard_listener.start()
+            if self.input_process is not None:
+                try:
+                    self.input_process.start()
+                except Exception as e:
+                    thread_safe_logging('error', f"启动输入监听子进程失败，改为进程内监听: {e}")
+                    self.input_process = None
+            if self.input_process is None:
+                self.mouse_listener.start()
+                self.keyboard_listener.start()
             thread_safe_logging('info', "用户操作记录器已启动。")
             thread_safe_logging('debug', "开启事件监听器。")
 
+    def _on_input_process_failed(self):
+        """输入监听子进程多次意外退出：与启动失败时一样改为进程内监听，避免录制继续却没有输入。"""
+        self.input_process = None
+        if self.running:
+            thread_safe_logging('error', "输入监听子进程不可用，改为进程内监听")
+            self.mouse_listener.start()
+            self.keyboard_listener.start()
+
     def stop_recording(self):
         if self.running:
             self.running = False
 
             # 停止前，先把滚动的累积事件结算
-            self.finalize_scroll_accumulation(self.scroll_press_start_screenshot)
+            self.finalize_scroll_accumulation()
 
             # 停止前，也需要把最后一次的键盘输入保存
             if self.action_timer:
                 self.action_timer.cancel()
             self.finish_action()
+            # 最后一个事件的操作后截图立即使用当前画面
+            self.settle.stop()
 
-            self.mouse_listener.stop()
-            self.keyboard_listener.stop()
+            if self.input_process is not None:
+                self.input_process.stop()
+            else:
+                self.mouse_listener.stop()
+                self.keyboard_listener.stop()
             thread_safe_logging('info', "用户操作记录器已停止。")
             thread_safe_logging('debug', "关闭事件监听器。")
             self.save_data()
 
+    @traced('get_active_app')
     def get_active_app(self):
         """获取当前前台进程名称"""
         try:
@@ -226,16 +294,28 @@ class ActionRecorder(QtCore.QObject):
                 return front_app
             else:
                 # 对于其他系统，可以使用 psutil 或其他方法
-                return "未知应用"
+                return UNKNOWN_APP
         except Exception as e:
             thread_safe_logging('error', f"获取活动应用程序时出错: {e}")
-            return "未知应用"
+            return UNKNOWN_APP
 
-    def on_click(self, x, y, button, pressed):
+    def cursor_position(self):
+        """当前光标位置：优先使用轨迹缓冲区，尚未收到移动事件时才查询系统。"""
+        position = self.trajectory.position()
+        if position is None:
+            position = pyautogui.position()
+        return position
+
+    def on_move(self, x, y, t=None):
+        if self.running:
+            self.trajectory.add(x, y, t)
+
+    @traced('on_click', 'listener')
+    def on_click(self, x, y, button, pressed, t=None):
         # 都用press之前的截图
         if self.running:
             # 若有未完成的滚动事件，先结算
-            self.finalize_scroll_accumulation(self.scroll_press_start_screenshot)
+            self.finalize_scroll_accumulation()
 
             active_app = self.get_active_app()
 
@@ -243,34 +323,53 @@ class ActionRecorder(QtCore.QObject):
             position_x = f"{x}/{self.screen_width}"
             position_y = f"{y}/{self.screen_height}"
 
-
-            self.click_press_start_screenshot = pyautogui.screenshot()
-            event_data = {
-                "timestamp": time.time(),
-                "event": "mouse_click",
-                "button": f"{button}.press" if pressed else f"{button}.release",
-                "position": {"x": x, "y": y},
-                "active_app": active_app
-            }
+            # 输入发生的时间：子进程监听时为回调中的时间戳，也是本段轨迹的终点
+            now = t or time.time()
+            self.trajectory.add(x, y, now)
+            # 按下时附带按下前的移动轨迹；松开时距离超过阈值则记录为拖拽，附带拖拽路径
+            path = self.trajectory.take(self.path_tolerance)
+            event_type = "mouse_click"
+            if pressed:
+                self.dragging = True
+                self.drag_start_x, self.drag_start_y, self.drag_start_time = x, y, now
+            elif self.dragging:
+                self.dragging = False
+                distance = ((x - self.drag_start_x) ** 2 + (y - self.drag_start_y) ** 2) ** 0.5
+                if distance >= self.drag_threshold:
+                    event_type = "mouse_drag"
+
+            self.click_press_start_screenshot = self.storage_manager.capture_frame(x, y, active_app)
+            if event_type == "mouse_drag":
+                event_data = DragEvent(now, x, y, active_app, str(button),
+                                       self.drag_start_x, self.drag_start_y, self.drag_start_time, path)
+            else:
+                event_data = ClickEvent(now, x, y, active_app,
+                                        f"{button}.press" if pressed else f"{button}.release", path)
 
             thread_safe_logging('debug', f"捕获到鼠标按下事件: {event_data}")
             self.handle_event(event_data, screenshot=self.click_press_start_screenshot)
+            self._release_frame('click_press_start_screenshot')
 
-    def on_scroll(self, x, y, dx, dy):
+    @traced('on_scroll', 'listener')
+    def on_scroll(self, x, y, dx, dy, t=None):
         if self.running:
-            self.handle_vertical_scroll(x, y, dy)
+            self.handle_scroll(x, y, dx, dy, t)
 
-    def on_press(self, key):
+    @traced('on_press', 'listener')
+    def on_press(self, key, t=None):
         """键盘按下时，将当前按键加入连续输入的缓冲区。"""
         if not self.running:
             return
+        self.last_key_time = t or time.time()
 
         # 若有未完成的滚动事件，先结算
-        self.finalize_scroll_accumulation(self.scroll_press_start_screenshot)
+        self.finalize_scroll_accumulation()
 
         # 键盘序列的第一个press截图
         if self.is_press_start is True:
-            self.press_start_screenshot = pyautogui.screenshot()
+            self.press_active_app = self.get_active_app()
+            self.press_start_screenshot = self.storage_manager.capture_frame(*self.cursor_position(),
+                                                                             self.press_active_app)
             print("[*] press_start_screenshot")
         self.is_press_start = False
 
@@ -282,10 +381,10 @@ class ActionRecorder(QtCore.QObject):
 
         self.current_action += key_pressed + " "
 
-        # 重置/启动定时器：1.5 秒后若无新的按键按下，则视为一次完整输入
+        # 重置/启动定时器：key_debounce 秒后若无新的按键按下，则视为一次完整输入
         if self.action_timer:
             self.action_timer.cancel()
-        self.action_timer = Timer(1.5, self.finish_action)
+        self.action_timer = Timer(self.key_debounce, self.finish_action)
         self.action_timer.start()
 
     def _get_key_name(self, key_name):
@@ -335,99 +434,53 @@ class ActionRecorder(QtCore.QObject):
         """当用户停止输入超过 1 秒，或长度超标时，将本段输入合并为一次事件。"""
         if not self.current_action.strip():
             return
-        mouse_x, mouse_y = pyautogui.position()
-        active_app = self.get_active_app()
-        event_data = {
-            "timestamp": time.time(),
-            "event": "key_press",
-            "key": self.current_action.strip(),
-            "position": {"x": mouse_x, "y": mouse_y},
-            "active_app": active_app
-        }
+        mouse_x, mouse_y = self.cursor_position()
+        active_app = self.press_active_app or self.get_active_app()
+        event_data = KeyEvent(self.last_key_time, mouse_x, mouse_y, active_app, self.current_action.strip())
         self.handle_event(event_data, self.press_start_screenshot)
         self.current_action = ""
         self.is_press_start = True
-        self.press_start_screenshot = None
-
-    def handle_vertical_scroll(self, x, y, dy):
-        """累加垂直滚动事件。若方向改变或超时则生成一次 mouse_scroll 事件并截图。"""
-        now = time.time()
-        old_dir = self.scroll_accumulator["direction"]
-        old_time = self.scroll_accumulator["last_time"]
+        self.press_active_app = None
+        self._release_frame('press_start_screenshot')
 
-        if self.is_scroll_press_start is True:
-            self.scroll_press_start_screenshot = pyautogui.screenshot()
-            self.is_scroll_press_start = False
-
-        if dy == 0:
-            return
-
-        new_dir = "up" if dy > 0 else "down"
-
-        if old_dir is None:
-            self.scroll_accumulator["direction"] = new_dir
-            self.scroll_accumulator["acc_dy"] = dy
-            self.scroll_accumulator["x"] = x
-            self.scroll_accumulator["y"] = y
-            self.scroll_accumulator["last_time"] = now
-        else:
-            # 超时，变向 检测；删掉
-            # time_diff = now - old_time
-            # if new_dir != old_dir or time_diff > self.scroll_timeout:
-            #     self.finalize_scroll_accumulation()
-            #     self.scroll_accumulator["direction"] = new_dir
-            #     self.scroll_accumulator["acc_dy"] = dy
-            #     self.scroll_accumulator["x"] = x
-            #     self.scroll_accumulator["y"] = y
-            #     self.scroll_accumulator["last_time"] = now
-            # else:
-
-            # 鼠标位置改变，结束这次连续滚动，结算
-            now_x, now_y = pyautogui.position()
-            if abs(now_x - self.scroll_accumulator["x"]) > 20 or abs(now_y - self.scroll_accumulator["y"] > 20):
-                self.finalize_scroll_accumulation()
-            else:
-                self.scroll_accumulator["acc_dy"] += dy
-                self.scroll_accumulator["x"] = x
-                self.scroll_accumulator["y"] = y
-                self.scroll_accumulator["last_time"] = now
-
-    def finalize_scroll_accumulation(self, screenshot=None):
-        """结算滚动累积，生成一次 mouse_scroll 事件并截图。"""
-        direction = self.scroll_accumulator["direction"]
-        if direction is None:
-            return
-
-        acc_dy = self.scroll_accumulator["acc_dy"]
-        x = self.scroll_accumulator["x"]
-        y = self.scroll_accumulator["y"]
-
-        position_x = f"{x}/{self.screen_width}"
-        position_y = f"{y}/{self.screen_height}"
-
-        active_app = self.get_active_app()
-        event_data = {
-            "timestamp": time.time(),
-            "event": "mouse_scroll",
-            "delta_x": 0,
-            "delta_y": acc_dy,
-            "position": {"x": x, "y": y},
-            "active_app": active_app
-        }
-        self.handle_event(event_data, screenshot)
-
-        self.is_scroll_press_start = True
-        self.scroll_press_start_screenshot = None
-
-        thread_safe_logging('debug', f"结算滚动事件: {event_data}")
-
-        self.scroll_accumulator = {
-            "direction": None,
-            "acc_dy": 0,
-            "x": None,
-            "y": None,
-            "last_time": 0.0
-        }
+    def handle_scroll(self, x, y, dx, dy, t=None):
+        """
+        累积滚动事件（含水平方向）。每次滚动只更新累积器，不调用系统接口；
+        新手势开始时截取一次手势前的画面，手势结束时生成一次 mouse_scroll 事件。
+        """
+        finished, started = self.scroll.feed(x, y, dx, dy, t or time.time())
+        if finished is not None:
+            self._emit_scroll(finished)
+        if started is not None:
+            started.active_app = self.get_active_app()
+            frame = self.storage_manager.capture_frame(x, y, started.active_app)
+            if frame is not None and not self.scroll.attach_frame(started, frame):
+                frame.release()
+
+    def finalize_scroll_accumulation(self):
+        """结算当前的滚动手势（点击、按键或停止录制前调用）。"""
+        gesture = self.scroll.flush()
+        if gesture is not None:
+            self._emit_scroll(gesture)
+
+    def _emit_scroll(self, gesture):
+        """为一次结束的滚动手势生成 mouse_scroll 事件，并释放手势前的截图。"""
+        event_data = ScrollEvent(gesture.last_time, gesture.x, gesture.y, gesture.active_app or self.get_active_app(),
+                                 gesture.dx, gesture.dy, gesture.summary())
+        try:
+            self.handle_event(event_data, gesture.frame)
+        finally:
+            if gesture.frame is not None:
+                gesture.frame.release()
+                gesture.frame = None
+        thread_safe_logging('debug', f"结算滚动手势: {event_data}")
+
+    def _release_frame(self, attr):
+        """释放事件前截图占用的帧缓冲槽位。"""
+        frame = getattr(self, attr)
+        setattr(self, attr, None)
+        if frame is not None:
+            frame.release()
 
     def monitor_scroll_timeout(self):
         """
@@ -438,122 +491,59 @@ class ActionRecorder(QtCore.QObject):
             if not self.running:
                 time.sleep(0.1)
                 continue
-            now = time.time()
-            last_time = self.scroll_accumulator["last_time"]
-            if self.scroll_accumulator["direction"] is not None and (now - last_time) > self.scroll_timeout:
-                self.finalize_scroll_accumulation()
+            gesture = self.scroll.expire(time.time())
+            if gesture is not None:
+                self._emit_scroll(gesture)
             time.sleep(0.1)
 
+    @traced('handle_event')
     def handle_event(self, event, screenshot=None):
-        """对录制的事件进行截图并保存，再写入数据队列。"""
+        """对录制的事件进行截图并保存，序列化一次后写入实时日志、事件总线与汇总数据。"""
         try:
-            action_type = event.get('event')  # 获取事件类型
-
-            if action_type in ['mouse_click', 'mouse_scroll', 'key_press']:
-                # 创建 action_content 字典，用于存储详细事件内容
-                action_content = {}
-
-                if action_type in ['mouse_click', 'mouse_scroll']:
-                    x = event['position']['x']
-                    y = self.screen_height - event['position']['y']
-                    button = event.get('button')
-
-                    if action_type == 'mouse_scroll':
-                        # 获取水平和垂直滚动量
-                        dx = event.get('delta_x', 0)  # 水平方向的滚动量
-                        dy = event.get('delta_y', 0)  # 垂直方向的滚动量
-                        screenshot_path = self.storage_manager.save_screenshot(x=x, y=y, dx=dx, dy=dy,
-                                                                               screenshot=screenshot)
-                        action_content = {
-                            "position": {
-                                "x": x,
-                                "y": y,
-                                "max_x": self.screen_width,
-                                "max_y": self.screen_height
-                            },
-                            "button": None,
-                            "delta": {
-                                "dx": dx,
-                                "dy": dy
-                            },
-                            "key": None  # 对于鼠标事件，key 设置为 None
-                        }
-                    else:  # mouse_click
-                        screenshot_path = self.storage_manager.save_screenshot(x=x, y=y, screenshot=screenshot, button=button)
-                        action_content = {
-                            "position": {
-                                "x": x,
-                                "y": y,
-                                "max_x": self.screen_width,
-                                "max_y": self.screen_height
-                            },
-                            "button": button,
-                            "delta": None,  # 对于非滚动事件，delta 设置为 None
-                            "key": None  # 对于鼠标事件，key 设置为 None
-                        }
-
-                elif action_type == 'key_press':
-                    key_name = event['key']
-                    if screenshot is not None:
-                        screenshot_path = self.storage_manager.save_screenshot(key_name=key_name, screenshot=screenshot)
-                    else:
-                        screenshot_path = self.storage_manager.save_screenshot(key_name=key_name)
-                    x = event['position']['x']
-                    y = self.screen_height - event['position']['y']
-
-                    action_content = {
-                        "position": {
-                            "x": x,
-                            "y": y,
-                            "max_x": pyautogui.size().width,
-                            "max_y": pyautogui.size().height
-                        },  # 记录鼠标位置
-                        "button": None,
-                        "delta": None,  # 对于键盘事件，delta 设置为 None
-                        "key": key_name  # 键盘按键
-                    }
-
-                # 获取鼠标位置
-                mouse_x, mouse_y = pyautogui.position()
-
-                # 将 position 字段处理并移除
-                if 'position' in event:
-                    x = event['position']['x']
-                    y = self.screen_height - event['position']['y']
-
-                    # 设置 mouse_position 字段
-                    mouse_position = {
-                        "x": x,
-                        "y": y,
-                        "max_x": self.screen_width,
-                        "max_y": self.screen_height
-                    }
-
-                    del event['position']  # 移除原有的 position 字段
-
-                # 组装最终的事件结构
-                new_event = {
-                    "timestamp": time.time(),  # 保存时间戳
-                    "action_type": action_type,  # 保存事件类型
-                    "action_content": action_content,  # 保存事件内容
-                    "active_app": event['active_app'],  # 活动应用
-                    "screenshots_path": self.get_relative_screenshot_path(screenshot_path),  # 独立保存截图路径
-                    "mouse_position": mouse_position  # 独立保存鼠标位置
-                }
-
-                # 实时保存事件到 JSONL 文件
-                filename = self.storage_manager.getLogPath()
-                filename = os.path.join(filename, self.log_filename)
-                with open(filename, 'a', encoding='utf-8') as f:
-                    json.dump(new_event, f, ensure_ascii=False)
-                    f.write('\n')  # 每条事件一行
-
-                self.action_recorded.emit(json.dumps(new_event))
-
-                with self.lock:
-                    self.data.append(new_event)
-
-                thread_safe_logging('info', f"记录事件并保存截图: {new_event}")
+            # 先分配事件编号，截图写盘时随哈希记入完整性清单
+            with self.lock:
+                self.event_seq += 1
+                event_id = self.event_seq
+            event.event_id = event_id
+            event.max_x = self.screen_width
+            event.max_y = self.screen_height
+
+            x = event.x
+            y = self.screen_height - event.y
+            if isinstance(event, ScrollEvent):
+                screenshot_path = self.storage_manager.save_screenshot(x=x, y=y, dx=event.dx, dy=event.dy,
+                                                                       screenshot=screenshot,
+                                                                       active_app=event.active_app, event_id=event_id)
+            elif isinstance(event, KeyEvent):
+                screenshot_path = self.storage_manager.save_screenshot(key_name=event.key, screenshot=screenshot,
+                                                                       active_app=event.active_app, event_id=event_id)
+            else:  # mouse_click / mouse_drag
+                screenshot_path = self.storage_manager.save_screenshot(x=x, y=y, screenshot=screenshot,
+                                                                       button=event.button,
+                                                                       active_app=event.active_app, event_id=event_id)
+
+            # 记录事件所在显示器内的坐标
+            event.monitor = self.display.local_position(event.x, event.y)
+            # 记录输入发生的时间（子进程打的时间戳），而不是分发到这里的时间
+            event.timestamp = event.captured_at if event.captured_at is not None else time.time()
+            event.screenshots_path = self.get_relative_screenshot_path(screenshot_path)
+            event.frame_hash = self.storage_manager.frame_hash(screenshot_path)  # 共享截图存储中的像素哈希
+
+            # 实时保存事件到 JSONL 文件，每条事件一行
+            line = event.encode()
+            filename = os.path.join(self.storage_manager.getLogPath(), self.log_filename)
+            with span('jsonl_write', 'recorder', event_id), open(filename, 'ab') as f:
+                f.write(line)
+            self.storage_manager.journal_event(event_id, filename, line)
+
+            self.event_bus.publish(event)
+            self.settle.watch(event)
+
+            # 汇总数据只保留已序列化的行
+            with self.lock:
+                self.data.append(line)
+
+            thread_safe_logging('info', f"记录事件 {event_id}: {event.action_type}，截图: {event.screenshots_path}")
 
         except Exception as e:
             thread_safe_logging('error', f"处理事件时出错: {e}")
@@ -568,8 +558,11 @@ class ActionRecorder(QtCore.QObject):
             filepath = self.storage_manager.getLogPath()
             filepath = os.path.join(filepath, filename)
             # print(filepath)
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(self.data, f, indent=4, ensure_ascii=False)
+            # 复用实时日志中已序列化的行拼成 JSON 数组，不再重新序列化
+            data = b'[\n' + b',\n'.join(line.rstrip(b'\n') for line in self.data) + b'\n]\n'
+            with open(filepath, 'wb') as f:
+                f.write(data)
+            self.storage_manager.journal_file(filepath, data)
             thread_safe_logging('info', f"用户操作数据已保存至: {filepath}")
             self.data.clear()
         except Exception as e:
@@ -579,6 +572,9 @@ class ActionRecorder(QtCore.QObject):
         """
         从绝对路径中提取相对路径，从\\records\\开始
         """
+        if not absolute_path:
+            # 截图被磁盘配额拒绝时没有路径
+            return None
 
         # 查找关键词位置
         if '/records/' in absolute_path:
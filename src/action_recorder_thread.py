@@ -5,12 +5,9 @@ from action_recorder import ActionRecorder
 from logger import thread_safe_logging
 
 class ActionRecorderThread(QtCore.QThread):
-    action_recorded = QtCore.pyqtSignal(str)
-
     def __init__(self, log_file='log/user_actions.log', save_path='screenshots'):
         super().__init__()
         self.recorder = ActionRecorder(log_file, save_path)
-        self.recorder.action_recorded.connect(self.action_recorded.emit)
 
     def run(self):
         self.recorder.start_recording()
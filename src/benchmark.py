@@ -0,0 +1,402 @@
+# benchmark.py
+#
+# 存储与录制热点路径的微基准，可在无图形界面的 Linux 上运行：
+#
+#     python benchmark.py [--quick] [--output results.json] [--compare baseline.json] [--threshold 0.1]
+#     python benchmark.py --capture [--repeat 20]
+#
+# 图形界面、输入监听与上传相关的依赖（PyQt5、pyautogui、pynput、modelscope）在导入项目模块前
+# 替换为桩模块，截图使用合成的 UI 画面（1080p / 1440p / 4K / 5K），会话文件夹使用合成文件。
+# 结果以 JSON 输出；--compare 与保存的基线比较中位数，超过阈值的回退以非零状态码退出。
+# --capture 在真实屏幕上测量各截屏后端（不替换 pyautogui，需要图形界面），不可用的后端跳过。
+
+import os
+import sys
+import json
+import time
+import types
+import random
+import shutil
+import platform
+import argparse
+import statistics
+import tempfile
+
+RESOLUTIONS = {
+    '1080p': (1920, 1080),
+    '1440p': (2560, 1440),
+    '4k': (3840, 2160),
+    '5k': (5120, 2880),
+}
+SESSION_SIZES = [1000, 10000, 50000]
+QUICK_RESOLUTIONS = ['1080p', '4k']
+QUICK_SESSION_SIZES = [1000]
+PNG_APP = 'benchmark-png'  # 命中 PNG 截图规则的前台应用名
+
+# 桩模块共享的“屏幕”：当前分辨率与当前合成画面
+_screen = {'size': RESOLUTIONS['1080p'], 'image': None, 'position': (100, 100)}
+
+
+# ---------- 桩模块 ----------
+def _module(name, **attrs):
+    module = types.ModuleType(name)
+    module.__dict__.update(attrs)
+    sys.modules[name] = module
+    return module
+
+
+class _Signal:
+    def __init__(self, *args):
+        pass
+
+    def emit(self, *args):
+        pass
+
+    def connect(self, *args):
+        pass
+
+
+class _QObject:
+    def __init__(self, *args, **kwargs):
+        pass
+
+
+class _Listener:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+class _Key:
+    def __init__(self, name):
+        self.name = name
+
+    def __str__(self):
+        return f"Key.{self.name}"
+
+
+class _KeyCode:
+    def __init__(self, char=None):
+        self.char = char
+
+
+def install_stubs():
+    """替换图形界面与上传依赖；psutil 等系统库仅在缺失时替换。"""
+    def screenshot(region=None):
+        img = _screen['image']
+        if region is not None:
+            left, top, width, height = region
+            img = img.crop((left, top, left + width, top + height))
+        return img
+
+    _module('pyautogui', size=lambda: _screen['size'], screenshot=screenshot,
+            position=lambda: _screen['position'])
+
+    _module('pynput')
+    sys.modules['pynput'].mouse = _module('pynput.mouse', Listener=_Listener, Button=types.SimpleNamespace())
+    sys.modules['pynput'].keyboard = _module('pynput.keyboard', Listener=_Listener, Key=_Key, KeyCode=_KeyCode)
+
+    qtcore = _module('PyQt5.QtCore', QObject=_QObject, QThread=_QObject, pyqtSignal=_Signal,
+                     QTimer=_QObject, Qt=types.SimpleNamespace())
+    _module('PyQt5', QtCore=qtcore, QtWidgets=_module('PyQt5.QtWidgets'), QtGui=_module('PyQt5.QtGui'))
+
+    class HubApi:
+        def login(self, *args, **kwargs):
+            pass
+
+        def upload_file(self, *args, **kwargs):
+            pass
+
+    _module('modelscope')
+    _module('modelscope.hub')
+    _module('modelscope.hub.api', HubApi=HubApi)
+    # 流式上传在上传线程中按需导入这些内部模块，基准不上传，只保证导入可用
+    _module('modelscope.utils')
+    _module('modelscope.utils.file_utils', get_file_hash=lambda *args, **kwargs: {})
+    _module('modelscope.utils.repo_utils', CommitOperationAdd=types.SimpleNamespace)
+
+    try:
+        import psutil  # noqa: F401
+    except ImportError:
+        _module('psutil',
+                Process=lambda pid=None: types.SimpleNamespace(
+                    name=lambda: 'benchmark', children=lambda recursive=False: [],
+                    cpu_times=lambda: types.SimpleNamespace(user=time.process_time(), system=0.0)),
+                sensors_battery=lambda: None, cpu_percent=lambda interval=None: 0.0)
+
+
+# ---------- 合成数据 ----------
+def synthetic_frame(width, height, seed=0):
+    """生成类似桌面应用的画面：菜单栏、侧边栏、窗口、文字行、按钮和一块照片区域。"""
+    import numpy as np
+    from PIL import Image, ImageDraw
+    rng = random.Random(seed)
+    img = Image.new('RGB', (width, height), (236, 239, 244))
+    draw = ImageDraw.Draw(img)
+    scale = width / 1920
+    bar = int(28 * scale)
+    draw.rectangle((0, 0, width, bar), fill=(250, 250, 250))
+    sidebar = int(260 * scale)
+    draw.rectangle((0, bar, sidebar, height), fill=(44, 49, 58))
+    for i in range(int(height / (32 * scale))):
+        y = bar + int(i * 32 * scale) + 8
+        draw.text((int(20 * scale), y), f"Item {i} - project folder", fill=(200, 205, 215))
+
+    for w in range(3):
+        x0 = sidebar + rng.randint(20, width // 4)
+        y0 = bar + rng.randint(20, height // 4)
+        x1 = min(width - 10, x0 + rng.randint(width // 3, width // 2))
+        y1 = min(height - 10, y0 + rng.randint(height // 3, height // 2))
+        draw.rectangle((x0, y0, x1, y1), fill=(255, 255, 255), outline=(180, 180, 180))
+        draw.rectangle((x0, y0, x1, y0 + int(30 * scale)), fill=(220, 224, 230))
+        line_height = int(18 * scale) or 1
+        for line in range((y1 - y0 - int(40 * scale)) // line_height):
+            words = ' '.join(rng.choice(['def', 'return', 'self', 'value', 'config', 'frame', '=', '(', ')'])
+                             for _ in range(rng.randint(3, 12)))
+            draw.text((x0 + 12, y0 + int(40 * scale) + line * line_height), words, fill=(30, 30, 30))
+        for b in range(3):
+            bx = x1 - (b + 1) * int(90 * scale)
+            draw.rectangle((bx, y1 - int(40 * scale), bx + int(80 * scale), y1 - int(12 * scale)),
+                           fill=(59, 130, 246))
+
+    # 照片区域：带噪声的渐变，模拟网页图片或视频
+    pw, ph = width // 5, height // 4
+    gradient = np.linspace(0, 255, pw, dtype=np.float32)[None, :, None].repeat(ph, 0).repeat(3, 2)
+    noise = np.random.default_rng(seed).normal(0, 24, (ph, pw, 3))
+    photo = Image.fromarray(np.clip(gradient + noise, 0, 255).astype(np.uint8), 'RGB')
+    img.paste(photo, (width - pw - int(40 * scale), height - ph - int(40 * scale)))
+    return img
+
+
+def synthetic_session(folder, file_count, file_kb):
+    """生成与会话目录结构一致的合成文件，截图内容为不可压缩数据（与 JPEG 接近）。"""
+    original = os.path.join(folder, 'screenshots', 'original')
+    log_dir = os.path.join(folder, 'log')
+    os.makedirs(original, exist_ok=True)
+    os.makedirs(log_dir, exist_ok=True)
+    payload = os.urandom(file_kb * 1024 * 2)
+    with open(os.path.join(log_dir, 'user_actions_real_time_benchmark.jsonl'), 'w', encoding='utf-8') as log:
+        for i in range(file_count):
+            offset = (i * 7919) % (file_kb * 1024)
+            with open(os.path.join(original, f"screenshot_{i:06d}_no_info.jpg"), 'wb') as f:
+                f.write(payload[offset:offset + file_kb * 1024])
+            log.write(json.dumps({"event_id": i, "action_type": "mouse_click"}) + '\n')
+
+
+# ---------- 计时 ----------
+def measure(fn, repeat, warmup=1, setup=None):
+    """执行 warmup + repeat 次，返回以毫秒计的统计结果。"""
+    samples = []
+    for i in range(warmup + repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        elapsed = (time.perf_counter() - start) * 1000
+        if i >= warmup:
+            samples.append(elapsed)
+    samples.sort()
+    return {
+        "runs": len(samples),
+        "min_ms": samples[0],
+        "median_ms": statistics.median(samples),
+        "mean_ms": statistics.mean(samples),
+        "p95_ms": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+    }
+
+
+def set_screen(storage, name):
+    _screen['size'] = RESOLUTIONS[name]
+    _screen['image'] = synthetic_frame(*RESOLUTIONS[name])
+    storage.display.invalidate()
+
+
+# ---------- 基准 ----------
+def run_benchmarks(args, workdir):
+    from PIL import ImageDraw
+    from storage import StorageManager, compress_image
+    from action_recorder import ActionRecorder
+    from events import ClickEvent
+
+    storage = StorageManager()
+    storage.start_session()
+    recorder = ActionRecorder()
+    results = {}
+    resolutions = QUICK_RESOLUTIONS if args.quick else list(RESOLUTIONS)
+    repeat = 3 if args.quick else args.repeat
+
+    def record(name, stats):
+        results[name] = stats
+        print(f"{name:<40} median {stats['median_ms']:10.2f}ms  p95 {stats['p95_ms']:10.2f}ms")
+
+    for res in resolutions:
+        set_screen(storage, res)
+        img = _screen['image']
+        png_path = os.path.join(workdir, f"frame_{res}.png")
+        img.save(png_path)
+        jpg_path = os.path.join(workdir, f"frame_{res}.jpg")
+        w, h = img.size
+
+        record(f"compress_image[{res}]", measure(lambda: compress_image(png_path, jpg_path), repeat))
+
+        copies = {}
+        record(f"draw_star[{res}]", measure(
+            lambda: storage.draw_star(ImageDraw.Draw(copies['img']), w / 2, h / 2, 60, 20, (255, 0, 0)),
+            repeat * 10, setup=lambda: copies.update(img=img.copy())))
+
+        def save():
+            storage.save_screenshot(x=w // 3, y=h // 3, button='left', screenshot=img)
+            storage.flush_frames()
+        record(f"save_screenshot[{res}]", measure(save, repeat))
+
+        def save_png():
+            # 不提供 screenshot，经 capture_frame 截屏：帧来自帧缓冲池（RGBX）
+            path = storage.save_screenshot(x=w // 3, y=h // 3, button='left', active_app=PNG_APP)
+            storage.flush_frames()
+            if not path or not os.path.exists(os.path.join(workdir, path)):
+                raise RuntimeError(f"PNG 截图未写盘: {path}")
+        record(f"save_screenshot_png[{res}]", measure(save_png, repeat))
+
+        def handle_click():
+            recorder.handle_event(ClickEvent(time.time(), w // 2, h // 2, "benchmark", "left"), screenshot=img)
+            storage.flush_frames()
+        record(f"handle_event[{res}]", measure(handle_click, repeat))
+
+    # on_press 逐键传入单个可打印字符或控制字符（如 Cmd+C 产生的 \x03），连续输入以空格连接
+    key_input = ' '.join('helloWorld\x03\x16' * 4)
+    record("_get_key_name", measure(lambda: recorder._get_key_name(key_input), repeat * 100))
+
+    key = storage.config.get('encryption', {}).get('key', '16byteslongkey!!')
+    iv = storage.config.get('encryption', {}).get('iv', '16byteslongiv!!!')
+    for count in (QUICK_SESSION_SIZES if args.quick else SESSION_SIZES):
+        folder = os.path.join(workdir, f"session_{count}")
+        synthetic_session(folder, count, args.file_kb)
+        zip_path = os.path.join(workdir, f"session_{count}.zip")
+        session_repeat = max(1, repeat // 2) if count > 1000 else repeat
+        record(f"zip_folder[{count}]", measure(lambda: storage.zip_folder(folder, zip_path), session_repeat,
+                                               warmup=0, setup=lambda: os.path.exists(zip_path) and os.remove(zip_path)))
+        record(f"encrypt_file[{count}]", measure(lambda: storage.encrypt_file(zip_path, zip_path + '.enc', key, iv),
+                                                 session_repeat, warmup=0))
+        shutil.rmtree(folder, ignore_errors=True)
+
+    storage.encoder.shutdown()
+    storage.frame_pool.close()
+    return results
+
+
+def run_capture_benchmarks(args):
+    """测量每个截屏后端截取整个主屏幕与 800x600 区域的耗时。"""
+    from capture import BACKENDS
+    from display import Monitor
+
+    results = {}
+    region = Monitor(0, 0, 0, 800, 600, 1.0)
+    for name, cls in BACKENDS.items():
+        try:
+            backend = cls()
+            first = measure(backend.grab, 1, warmup=0)
+        except Exception as e:
+            print(f"capture[{name}]{'':<30} 不可用: {e}")
+            continue
+        try:
+            size = backend.grab().size
+            for label, fn in ((f"capture[{name}]", backend.grab),
+                              (f"capture_region[{name}]", lambda: backend.grab(region))):
+                stats = measure(fn, args.repeat)
+                results[label] = stats
+                print(f"{label:<40} median {stats['median_ms']:10.2f}ms  p95 {stats['p95_ms']:10.2f}ms")
+            print(f"{'':<40} 首次 {first['median_ms']:.2f}ms，整屏 {size[0]}x{size[1]}")
+        finally:
+            backend.close()
+    return results
+
+
+def compare(results, baseline, threshold):
+    """与基线比较中位数，返回回退的基准名称列表。"""
+    regressions = []
+    print(f"\n{'基准':<40} {'基线':>12} {'当前':>12} {'变化':>9}")
+    for name, stats in results.items():
+        base = baseline.get('results', {}).get(name)
+        if base is None:
+            print(f"{name:<40} {'-':>12} {stats['median_ms']:10.2f}ms {'新增':>9}")
+            continue
+        change = stats['median_ms'] / base['median_ms'] - 1 if base['median_ms'] else 0.0
+        flag = ' 回退' if change > threshold else (' 提升' if change < -threshold else '')
+        print(f"{name:<40} {base['median_ms']:10.2f}ms {stats['median_ms']:10.2f}ms {change:+8.1%}{flag}")
+        if change > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="存储与录制热点路径的微基准")
+    parser.add_argument('--quick', action='store_true', help="只运行较小的分辨率与会话规模")
+    parser.add_argument('--repeat', type=int, default=10, help="每项基准的重复次数")
+    parser.add_argument('--file-kb', type=int, default=16, help="合成会话中每个文件的大小（KB）")
+    parser.add_argument('--output', help="将结果写入 JSON 文件（可作为之后的基线）")
+    parser.add_argument('--compare', help="与之前保存的基线 JSON 比较")
+    parser.add_argument('--threshold', type=float, default=0.1, help="判定回退的中位数变化比例")
+    parser.add_argument('--capture', action='store_true', help="在真实屏幕上测量各截屏后端的延迟")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix='begleiter-bench-')
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    with open(os.path.join(src_dir, 'config.json'), 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    config.setdefault('capture_profiles', {})['rules'] = [
+        {"name": "benchmark-png", "apps": [PNG_APP], "mode": "full", "format": "png"}]
+    with open(os.path.join(workdir, 'config.json'), 'w', encoding='utf-8') as f:
+        json.dump(config, f, ensure_ascii=False, indent=4)
+
+    # 让 app_path() 指向临时目录：会话、日志与配置都写在这里，不影响真实数据。
+    # 在导入其他项目模块前替换；不能伪装成打包程序（sys.frozen），否则 multiprocessing 的
+    # 资源跟踪进程与子进程会按不存在的可执行文件启动
+    sys.path.insert(0, src_dir)
+    import frozen_dir
+    frozen_dir.app_path = lambda: workdir
+
+    try:
+        if args.capture:
+            results = run_capture_benchmarks(args)
+        else:
+            install_stubs()
+            results = run_benchmarks(args, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "time": time.time(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "quick": args.quick,
+            "file_kb": args.file_kb,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存至: {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} 项基准回退超过 {args.threshold:.0%}: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,324 @@
+# capture.py
+
+import ctypes
+import ctypes.util
+import platform
+import threading
+from PIL import Image, ImageDraw
+from logger import thread_safe_logging
+
+
+class CaptureBackend:
+    """
+    截屏后端。grab(monitor) 返回 RGB 的 PIL 图像：
+    monitor 为 display.Monitor（逻辑坐标与缩放比例），None 表示整个主屏幕（与 pyautogui.screenshot() 一致）。
+    native 为 True 的后端还提供 grab_into，把原生像素缓冲直接交给帧缓冲池，不创建 PIL 图像。
+    """
+
+    name = 'base'
+    native = False
+
+    def grab(self, monitor=None):
+        raise NotImplementedError
+
+    def grab_into(self, store, monitor=None):
+        """
+        截图并调用 store(宽, 高, 像素缓冲, 每行字节数) 写入（BGRX 布局），返回 store 的结果。
+        像素缓冲只在 store 调用期间有效。
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class PyAutoGUIBackend(CaptureBackend):
+    """兜底后端。macOS 上调用 screencapture 并读取临时 PNG，单次约 100ms。"""
+
+    name = 'pyautogui'
+
+    def __init__(self):
+        import pyautogui
+        self.pyautogui = pyautogui
+
+    def grab(self, monitor=None):
+        if monitor is None:
+            return self.pyautogui.screenshot()
+        # pyautogui 的 region 以截图像素为单位，需要乘以缩放比例
+        region = (int(monitor.left * monitor.scale), int(monitor.top * monitor.scale),
+                  int(monitor.width * monitor.scale), int(monitor.height * monitor.scale))
+        return self.pyautogui.screenshot(region=region)
+
+
+class MssBackend(CaptureBackend):
+    """mss 后端，mss 实例不能跨线程使用，每个线程各持有一个。"""
+
+    name = 'mss'
+    native = True
+
+    def __init__(self):
+        import mss
+        self.mss = mss
+        self.local = threading.local()
+        self._instance().monitors  # 尽早暴露初始化错误
+
+    def _instance(self):
+        sct = getattr(self.local, 'sct', None)
+        if sct is None:
+            sct = self.local.sct = self.mss.mss()
+        return sct
+
+    def _shot(self, monitor):
+        sct = self._instance()
+        if monitor is None:
+            area = sct.monitors[1] if len(sct.monitors) > 1 else sct.monitors[0]
+        else:
+            area = {'left': monitor.left, 'top': monitor.top, 'width': monitor.width, 'height': monitor.height}
+        return sct.grab(area)
+
+    def grab(self, monitor=None):
+        shot = self._shot(monitor)
+        return Image.frombuffer('RGB', shot.size, shot.bgra, 'raw', 'BGRX', 0, 1)
+
+    def grab_into(self, store, monitor=None):
+        shot = self._shot(monitor)
+        width, height = shot.size
+        return store(width, height, shot.raw, width * 4)
+
+
+class QuartzBackend(CaptureBackend):
+    """macOS 原生后端：CGWindowListCreateImage 直接返回像素缓冲，不经过临时文件。"""
+
+    name = 'quartz'
+    native = True
+
+    def __init__(self):
+        import Quartz
+        self.Quartz = Quartz
+
+    def _image_data(self, monitor):
+        """返回 (宽, 高, 每行字节数, CFData)，CFData 支持缓冲协议，可直接读取而不复制。"""
+        Q = self.Quartz
+        if monitor is None:
+            rect = Q.CGDisplayBounds(Q.CGMainDisplayID())
+        else:
+            # Quartz 全局坐标以主屏左上角为原点、单位为点，与 Monitor 的逻辑坐标一致
+            rect = Q.CGRectMake(monitor.left, monitor.top, monitor.width, monitor.height)
+        image = Q.CGWindowListCreateImage(rect, Q.kCGWindowListOptionOnScreenOnly,
+                                          Q.kCGNullWindowID, Q.kCGWindowImageDefault)
+        if image is None:
+            raise RuntimeError("CGWindowListCreateImage 返回空图像（可能缺少屏幕录制权限）")
+        width = Q.CGImageGetWidth(image)
+        height = Q.CGImageGetHeight(image)
+        stride = Q.CGImageGetBytesPerRow(image)
+        data = Q.CGDataProviderCopyData(Q.CGImageGetDataProvider(image))
+        return width, height, stride, data
+
+    def grab(self, monitor=None):
+        width, height, stride, data = self._image_data(monitor)
+        return Image.frombuffer('RGB', (width, height), bytes(data), 'raw', 'BGRX', stride, 1)
+
+    def grab_into(self, store, monitor=None):
+        width, height, stride, data = self._image_data(monitor)
+        return store(width, height, memoryview(data), stride)
+
+
+class _XImage(ctypes.Structure):
+    # 只声明用到的前缀字段
+    _fields_ = [
+        ('width', ctypes.c_int), ('height', ctypes.c_int), ('xoffset', ctypes.c_int), ('format', ctypes.c_int),
+        ('data', ctypes.c_void_p), ('byte_order', ctypes.c_int), ('bitmap_unit', ctypes.c_int),
+        ('bitmap_bit_order', ctypes.c_int), ('bitmap_pad', ctypes.c_int), ('depth', ctypes.c_int),
+        ('bytes_per_line', ctypes.c_int), ('bits_per_pixel', ctypes.c_int),
+    ]
+
+
+class _XShmSegmentInfo(ctypes.Structure):
+    _fields_ = [('shmseg', ctypes.c_ulong), ('shmid', ctypes.c_int),
+                ('shmaddr', ctypes.c_void_p), ('readOnly', ctypes.c_int)]
+
+
+class XShmBackend(CaptureBackend):
+    """
+    X11 共享内存后端：XShmGetImage 由 X 服务器直接把像素写入共享内存段，
+    不经过套接字传输。每种截取尺寸分配一个共享内存图像并复用。
+    """
+
+    name = 'xshm'
+    native = True
+
+    ZPIXMAP = 2
+    IPC_PRIVATE = 0
+    IPC_CREAT = 0o1000
+    IPC_RMID = 0
+
+    def __init__(self):
+        x11 = ctypes.util.find_library('X11')
+        xext = ctypes.util.find_library('Xext')
+        if not x11 or not xext:
+            raise RuntimeError("未找到 libX11 / libXext")
+        self.x11 = ctypes.CDLL(x11)
+        self.xext = ctypes.CDLL(xext)
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._declare()
+
+        self.display = self.x11.XOpenDisplay(None)
+        if not self.display:
+            raise RuntimeError("无法连接 X 服务器")
+        if not self.xext.XShmQueryExtension(self.display):
+            self.x11.XCloseDisplay(self.display)
+            raise RuntimeError("X 服务器不支持 MIT-SHM 扩展")
+        screen = self.x11.XDefaultScreen(self.display)
+        self.root = self.x11.XDefaultRootWindow(self.display)
+        self.visual = self.x11.XDefaultVisual(self.display, screen)
+        self.depth = self.x11.XDefaultDepth(self.display, screen)
+        self.screen_size = (self.x11.XDisplayWidth(self.display, screen),
+                            self.x11.XDisplayHeight(self.display, screen))
+        self.lock = threading.Lock()
+        self.images = {}  # (宽, 高) -> (XImage 指针, 共享内存段信息)
+
+    def _declare(self):
+        x11, xext, libc = self.x11, self.xext, self.libc
+        x11.XOpenDisplay.restype = ctypes.c_void_p
+        x11.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        x11.XDefaultRootWindow.restype = ctypes.c_ulong
+        x11.XDefaultRootWindow.argtypes = [ctypes.c_void_p]
+        x11.XDefaultScreen.argtypes = [ctypes.c_void_p]
+        x11.XDefaultVisual.restype = ctypes.c_void_p
+        x11.XDefaultVisual.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        x11.XDefaultDepth.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        x11.XDisplayWidth.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        x11.XDisplayHeight.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        x11.XSync.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        x11.XCloseDisplay.argtypes = [ctypes.c_void_p]
+        xext.XShmQueryExtension.argtypes = [ctypes.c_void_p]
+        xext.XShmCreateImage.restype = ctypes.POINTER(_XImage)
+        xext.XShmCreateImage.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int,
+                                         ctypes.c_char_p, ctypes.POINTER(_XShmSegmentInfo),
+                                         ctypes.c_uint, ctypes.c_uint]
+        xext.XShmAttach.argtypes = [ctypes.c_void_p, ctypes.POINTER(_XShmSegmentInfo)]
+        xext.XShmDetach.argtypes = [ctypes.c_void_p, ctypes.POINTER(_XShmSegmentInfo)]
+        xext.XShmGetImage.argtypes = [ctypes.c_void_p, ctypes.c_ulong, ctypes.POINTER(_XImage),
+                                      ctypes.c_int, ctypes.c_int, ctypes.c_ulong]
+        libc.shmget.argtypes = [ctypes.c_int, ctypes.c_size_t, ctypes.c_int]
+        libc.shmat.restype = ctypes.c_void_p
+        libc.shmat.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_int]
+        libc.shmdt.argtypes = [ctypes.c_void_p]
+        libc.shmctl.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_void_p]
+
+    def _image(self, width, height):
+        cached = self.images.get((width, height))
+        if cached is not None:
+            return cached
+        info = _XShmSegmentInfo()
+        image = self.xext.XShmCreateImage(self.display, self.visual, self.depth, self.ZPIXMAP,
+                                          None, ctypes.byref(info), width, height)
+        if not image:
+            raise RuntimeError("XShmCreateImage 失败")
+        size = image.contents.bytes_per_line * height
+        info.shmid = self.libc.shmget(self.IPC_PRIVATE, size, self.IPC_CREAT | 0o600)
+        if info.shmid < 0:
+            raise OSError(ctypes.get_errno(), "shmget 失败")
+        info.shmaddr = self.libc.shmat(info.shmid, None, 0)
+        image.contents.data = info.shmaddr
+        info.readOnly = 0
+        self.xext.XShmAttach(self.display, ctypes.byref(info))
+        self.x11.XSync(self.display, 0)
+        # 标记删除：所有进程分离后由系统回收，进程异常退出也不会泄漏
+        self.libc.shmctl(info.shmid, self.IPC_RMID, None)
+        self.images[(width, height)] = (image, info)
+        return image, info
+
+    def grab_into(self, store, monitor=None):
+        """X 服务器写入的共享内存段直接作为像素缓冲，store 返回前持有锁，下一次截图不会覆盖。"""
+        if monitor is None:
+            x, y, (width, height) = 0, 0, self.screen_size
+        else:
+            x, y, width, height = monitor.left, monitor.top, monitor.width, monitor.height
+        with self.lock:
+            image, info = self._image(width, height)
+            if not self.xext.XShmGetImage(self.display, self.root, image, x, y, 0xFFFFFFFF):
+                raise RuntimeError("XShmGetImage 失败")
+            stride = image.contents.bytes_per_line
+            data = (ctypes.c_char * (stride * height)).from_address(info.shmaddr)
+            return store(width, height, data, stride)
+
+    def grab(self, monitor=None):
+        return self.grab_into(
+            lambda width, height, data, stride: Image.frombuffer('RGB', (width, height), bytes(data),
+                                                                 'raw', 'BGRX', stride, 1),
+            monitor)
+
+    def close(self):
+        with self.lock:
+            for image, info in self.images.values():
+                self.xext.XShmDetach(self.display, ctypes.byref(info))
+                self.libc.shmdt(info.shmaddr)
+            self.images = {}
+            if self.display:
+                self.x11.XCloseDisplay(self.display)
+                self.display = None
+
+
+class SyntheticBackend(CaptureBackend):
+    """合成画面后端，用于测试与基准：每次截取时移动一个色块，画面内容随调用变化。"""
+
+    name = 'synthetic'
+
+    def __init__(self, width=1920, height=1080):
+        self.size = (width, height)
+        self.base = Image.new('RGB', self.size, (236, 239, 244))
+        draw = ImageDraw.Draw(self.base)
+        draw.rectangle((0, 0, width, 28), fill=(40, 44, 52))
+        for row in range(60, height, 24):
+            draw.line((240, row, width - 40, row), fill=(200, 204, 212))
+        self.counter = 0
+
+    def grab(self, monitor=None):
+        self.counter += 1
+        img = self.base.copy()
+        offset = (self.counter * 16) % max(1, self.size[0] - 120)
+        ImageDraw.Draw(img).rectangle((offset, 200, offset + 120, 280), fill=(66, 133, 244))
+        if monitor is not None:
+            img = img.crop((monitor.left, monitor.top, monitor.left + monitor.width, monitor.top + monitor.height))
+        return img
+
+
+BACKENDS = {
+    'quartz': QuartzBackend,
+    'xshm': XShmBackend,
+    'mss': MssBackend,
+    'pyautogui': PyAutoGUIBackend,
+    'synthetic': SyntheticBackend,
+}
+
+
+def auto_order():
+    """按平台排列的原生后端优先顺序，pyautogui 始终作为兜底。"""
+    system = platform.system()
+    if system == "Darwin":
+        return ['quartz', 'mss', 'pyautogui']
+    if system == "Linux":
+        return ['xshm', 'mss', 'pyautogui']
+    return ['mss', 'pyautogui']
+
+
+def create_backend(name='auto'):
+    """创建截屏后端；指定的后端不可用时按平台顺序退回，最终使用 pyautogui。"""
+    order = auto_order()
+    if name != 'auto':
+        order = [name] + [n for n in order if n != name]
+    last_error = None
+    for candidate in order:
+        cls = BACKENDS.get(candidate)
+        if cls is None:
+            thread_safe_logging('warning', f"未知的截屏后端: {candidate}")
+            continue
+        try:
+            backend = cls()
+            thread_safe_logging('info', f"截屏后端: {backend.name}")
+            return backend
+        except Exception as e:
+            last_error = e
+            thread_safe_logging('info', f"截屏后端 {candidate} 不可用: {e}")
+    raise RuntimeError(f"没有可用的截屏后端: {last_error}")
@@ -0,0 +1,153 @@
+# capture_profiles.py
+
+import re
+import time
+import fnmatch
+import threading
+from collections import namedtuple
+from logger import thread_safe_logging
+
+MODE_FULL = 'full'        # 截取整个主屏幕
+MODE_MONITOR = 'monitor'  # 只截取事件所在的显示器
+MODE_SKIP = 'skip'        # 不截图，只记录事件
+
+FORMATS = ('jpeg', 'png')
+
+UNKNOWN_APP = '未知应用'  # 无法获取前台应用时的名称
+
+# 一个应用的截图方式。max_fps 为每秒最多截图次数，0 表示不限制。
+CaptureProfile = namedtuple('CaptureProfile', [
+    'name', 'mode', 'scale', 'format', 'quality', 'target_size_kb', 'annotated', 'max_fps'
+])
+
+
+def _clamp(value, low, high):
+    return max(low, min(high, value))
+
+
+class CaptureProfiles:
+    """
+    按前台应用（active_app）选择截图方式的规则表。
+    规则按顺序匹配，apps 中的名称不区分大小写，可以是精确名称或通配符（如 "*Player*"）。
+    配置时把规则编译为精确名称字典与正则列表，并缓存每个应用的匹配结果，
+    截图前的查询只是一次字典查找。
+    """
+
+    def __init__(self, rules=None, defaults=None):
+        self.lock = threading.Lock()
+        self.default = None
+        self.exact = {}       # 小写应用名 -> 规则
+        self.exact_order = {} # 小写应用名 -> 规则序号
+        self.patterns = []    # [(编译后的正则, 规则, 规则序号)]，按规则顺序
+        self.cache = {}       # active_app -> 规则
+        self.last_capture = {}  # 规则名 -> 上次截图时间
+        self.unknown = None   # 前台应用未知时的规则：存在跳过规则时不截图，否则为默认规则
+        self.configure(rules, defaults)
+
+    def configure(self, rules=None, defaults=None):
+        """编译规则。defaults 为未命中任何规则时的截图参数。"""
+        defaults = defaults or {}
+        default = CaptureProfile(
+            name='default',
+            mode=defaults.get('mode', MODE_MONITOR),
+            scale=1.0,
+            format='jpeg',
+            quality=defaults.get('quality', 95),
+            target_size_kb=defaults.get('target_size_kb', 500),
+            annotated=True,
+            max_fps=0
+        )
+        # 精确名称按首次出现的规则登记；匹配时排在它之前的通配规则优先
+        exact = {}
+        order = {}
+        patterns = []
+        unknown = default
+        for index, rule in enumerate(rules or []):
+            profile = self._compile_rule(index, rule, default)
+            if profile is None:
+                continue
+            if profile.mode == MODE_SKIP:
+                unknown = default._replace(name='unknown', mode=MODE_SKIP)
+            for app in rule.get('apps', []):
+                key = str(app).lower()
+                if any(c in key for c in '*?['):
+                    patterns.append((re.compile(fnmatch.translate(key)), profile, index))
+                elif key not in exact:
+                    exact[key] = profile
+                    order[key] = index
+
+        with self.lock:
+            self.default = default
+            self.exact = exact
+            self.exact_order = order
+            self.patterns = patterns
+            self.cache = {}
+            self.unknown = unknown
+        if rules:
+            thread_safe_logging('info', f"已加载 {len(exact)} 个应用名称与 {len(patterns)} 个通配规则的截图配置")
+
+    @staticmethod
+    def _compile_rule(index, rule, default):
+        if not isinstance(rule, dict) or not rule.get('apps'):
+            thread_safe_logging('warning', f"忽略无效的截图规则 #{index}: {rule}")
+            return None
+        mode = rule.get('mode', default.mode)
+        if mode not in (MODE_FULL, MODE_MONITOR, MODE_SKIP):
+            thread_safe_logging('warning', f"截图规则 #{index} 的 mode 无效: {mode}，使用 {default.mode}")
+            mode = default.mode
+        image_format = rule.get('format', default.format)
+        if image_format not in FORMATS:
+            thread_safe_logging('warning', f"截图规则 #{index} 的 format 无效: {image_format}，使用 jpeg")
+            image_format = 'jpeg'
+        try:
+            return CaptureProfile(
+                name=rule.get('name') or f"rule{index}",
+                mode=mode,
+                scale=_clamp(float(rule.get('scale', default.scale)), 0.1, 1.0),
+                format=image_format,
+                quality=int(_clamp(int(rule.get('quality', default.quality)), 10, 100)),
+                target_size_kb=int(_clamp(int(rule.get('target_size_kb', default.target_size_kb)), 20, 10240)),
+                annotated=bool(rule.get('annotated', default.annotated)),
+                max_fps=_clamp(float(rule.get('max_fps', default.max_fps)), 0, 60)
+            )
+        except (TypeError, ValueError) as e:
+            thread_safe_logging('warning', f"忽略无效的截图规则 #{index}: {e}")
+            return None
+
+    def resolve(self, active_app=None):
+        """
+        返回应用对应的截图规则。active_app 为 None 表示前台应用未知，
+        此时只要存在跳过规则就不截图，避免在密码管理器等应用中截屏。
+        """
+        if active_app is None:
+            return self.unknown
+        profile = self.cache.get(active_app)
+        if profile is None:
+            profile = self._match(active_app)
+            self.cache[active_app] = profile
+        return profile
+
+    def _match(self, active_app):
+        key = active_app.lower()
+        profile = self.exact.get(key)
+        index = self.exact_order.get(key, float('inf'))
+        for pattern, candidate, pattern_index in self.patterns:
+            if pattern_index >= index:
+                break
+            if pattern.match(key):
+                return candidate
+        return profile or self.default
+
+    def admit(self, profile, now=None):
+        """是否允许按该规则截图：跳过模式或超过帧率上限时返回 False。"""
+        if profile.mode == MODE_SKIP:
+            return False
+        if profile.max_fps <= 0:
+            return True
+        now = now or time.time()
+        with self.lock:
+            last = self.last_capture.get(profile.name, 0)
+            if now - last < 1.0 / profile.max_fps:
+                return False
+            self.last_capture[profile.name] = now
+        return True
@@ -0,0 +1,202 @@
+# chunked_archive.py
+#
+# 分块加密归档格式（.bgca）：
+#
+#     头部    MAGIC(4) | 版本(1) | 明文块大小(4)
+#     数据块  每块: nonce(12) | 密文 | tag(16)，AES-GCM，附加数据为 头部 + 块序号
+#     索引    nonce(12) | 密文 | tag(16)，内容为成员名 -> 明文偏移与长度的 JSON
+#     尾部    索引偏移(8) | 索引长度(4) | MAGIC(4)
+#
+# 每个成员在明文流中连续存放，读取单个成员只需解密它覆盖的少数几个块。
+
+import os
+import json
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from Crypto.Cipher import AES
+from Crypto.Hash import SHA256
+from Crypto.Protocol.KDF import HKDF
+from Crypto.Random import get_random_bytes
+from logger import thread_safe_logging
+
+MAGIC = b'BGCA'
+VERSION = 1
+HEADER = struct.Struct('<4sBI')
+FOOTER = struct.Struct('<QI4s')
+CHUNK_INDEX = struct.Struct('<Q')
+NONCE_SIZE = 12
+TAG_SIZE = 16
+
+
+def derive_key(key):
+    """从配置中的 AES 密钥派生归档专用密钥，避免与 CBC 加密共用同一密钥。"""
+    if isinstance(key, str):
+        key = key.encode('utf-8')
+    return HKDF(key, 16, b'', SHA256, context=b'begleiter-chunked-archive')
+
+
+def _encrypt(key, plaintext, aad):
+    nonce = get_random_bytes(NONCE_SIZE)
+    cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
+    cipher.update(aad)
+    ciphertext, tag = cipher.encrypt_and_digest(plaintext)
+    return nonce + ciphertext + tag
+
+
+def _decrypt(key, blob, aad):
+    nonce, ciphertext, tag = blob[:NONCE_SIZE], blob[NONCE_SIZE:-TAG_SIZE], blob[-TAG_SIZE:]
+    cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
+    cipher.update(aad)
+    return cipher.decrypt_and_verify(ciphertext, tag)
+
+
+class ChunkedArchiveWriter:
+    """
+    将会话文件写入分块加密归档。明文按固定大小切块，
+    各块在线程池中并行加密（加密库在 C 代码中释放 GIL），按顺序写出。
+    """
+
+    def __init__(self, output_path, key, chunk_size=1024 * 1024, workers=None):
+        self.output_path = output_path
+        self.key = derive_key(key)
+        self.chunk_size = chunk_size
+        self.workers = workers or os.cpu_count() or 2
+        self.header = HEADER.pack(MAGIC, VERSION, chunk_size)
+        self.members = []
+        self.plain_size = 0
+        self.chunk_count = 0
+
+    def write_files(self, base_folder, files, arc_prefix='', verify=None, progress=None):
+        """
+        按列表写入文件（相对于 base_folder 的路径），返回写入的成员数。
+        verify(相对路径, 内容) 在文件读入后调用，用于按完整性清单校验。
+        progress 提供 check() 与 advance(n)，每个文件前检查取消并按文件数推进。
+        """
+        buffer = bytearray()
+        pending = []
+        max_pending = self.workers * 2
+
+        with open(self.output_path, 'wb') as out, ThreadPoolExecutor(max_workers=self.workers) as pool:
+            out.write(self.header)
+
+            def submit(chunk):
+                aad = self.header + CHUNK_INDEX.pack(self.chunk_count)
+                pending.append(pool.submit(_encrypt, self.key, bytes(chunk), aad))
+                self.chunk_count += 1
+                # 限制在途块数量，按提交顺序写出
+                while len(pending) >= max_pending:
+                    out.write(pending.pop(0).result())
+
+            for rel in files:
+                if progress is not None:
+                    progress.check()
+                    progress.advance()
+                path = os.path.join(base_folder, rel)
+                try:
+                    with open(path, 'rb') as f:
+                        data = f.read()
+                except OSError as e:
+                    thread_safe_logging('warning', f"归档时读取文件失败，跳过: {rel}, 错误: {e}")
+                    continue
+                if verify is not None:
+                    verify(rel, data)
+                name = os.path.join(arc_prefix, rel).replace(os.sep, '/')
+                self.members.append({"name": name, "offset": self.plain_size, "size": len(data)})
+                self.plain_size += len(data)
+                buffer += data
+                consumed = 0
+                while len(buffer) - consumed >= self.chunk_size:
+                    submit(buffer[consumed:consumed + self.chunk_size])
+                    consumed += self.chunk_size
+                del buffer[:consumed]
+
+            if buffer:
+                submit(buffer)
+            for future in pending:
+                out.write(future.result())
+
+            index = json.dumps({
+                "members": self.members,
+                "plain_size": self.plain_size,
+                "chunk_count": self.chunk_count
+            }, ensure_ascii=False).encode('utf-8')
+            index_offset = out.tell()
+            index_blob = _encrypt(self.key, index, self.header + b'index')
+            out.write(index_blob)
+            out.write(FOOTER.pack(index_offset, len(index_blob), MAGIC))
+
+        thread_safe_logging('info', f"分块归档完成: {self.output_path}，成员 {len(self.members)} 个，"
+                                    f"数据块 {self.chunk_count} 个，明文 {self.plain_size / (1024 * 1024):.2f}MB")
+        return len(self.members)
+
+
+class ChunkedArchiveReader:
+    """随机访问读取分块加密归档，读取成员时只解密其覆盖的数据块。"""
+
+    def __init__(self, path, key):
+        self.path = path
+        self.key = derive_key(key)
+        self.file = open(path, 'rb')
+        self.header = self.file.read(HEADER.size)
+        magic, version, self.chunk_size = HEADER.unpack(self.header)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"不是受支持的分块归档: {path}")
+        self.file.seek(-FOOTER.size, os.SEEK_END)
+        index_offset, index_length, magic = FOOTER.unpack(self.file.read(FOOTER.size))
+        if magic != MAGIC:
+            raise ValueError(f"归档尾部损坏: {path}")
+        self.file.seek(index_offset)
+        index = json.loads(_decrypt(self.key, self.file.read(index_length), self.header + b'index'))
+        self.members = {m['name']: m for m in index['members']}
+        self.plain_size = index['plain_size']
+        self.chunk_count = index['chunk_count']
+        self._cached_chunk = (None, None)  # 最近解密的块，相邻小文件常落在同一块中
+
+    def names(self):
+        return list(self.members)
+
+    def _read_chunk(self, chunk_index):
+        if self._cached_chunk[0] == chunk_index:
+            return self._cached_chunk[1]
+        stored_size = self.chunk_size + NONCE_SIZE + TAG_SIZE
+        offset = HEADER.size + chunk_index * stored_size
+        if chunk_index == self.chunk_count - 1:
+            length = (self.plain_size - chunk_index * self.chunk_size) + NONCE_SIZE + TAG_SIZE
+        else:
+            length = stored_size
+        self.file.seek(offset)
+        plaintext = _decrypt(self.key, self.file.read(length), self.header + CHUNK_INDEX.pack(chunk_index))
+        self._cached_chunk = (chunk_index, plaintext)
+        return plaintext
+
+    def read(self, name):
+        """读取并校验单个成员的内容。"""
+        member = self.members[name]
+        start, size = member['offset'], member['size']
+        if size == 0:
+            return b''
+        first = start // self.chunk_size
+        last = (start + size - 1) // self.chunk_size
+        data = b''.join(self._read_chunk(i) for i in range(first, last + 1))
+        skip = start - first * self.chunk_size
+        return data[skip:skip + size]
+
+    def extract_all(self, output_dir):
+        """顺序解密整个归档并还原全部成员。"""
+        root = os.path.abspath(output_dir)
+        for name in self.members:
+            path = os.path.abspath(os.path.join(root, *name.split('/')))
+            if not path.startswith(root + os.sep):
+                raise ValueError(f"归档成员路径非法: {name}")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(self.read(name))
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
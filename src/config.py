@@ -1,6 +1,10 @@
 import os
+import sys
+import copy
 import json
+import threading
 from logger import thread_safe_logging
+from frozen_dir import app_path
 
 DEFAULT_CONFIG = {
     "screenshot_interval": 20,  # 截屏间隔（秒）修改为20秒
@@ -8,6 +12,94 @@ DEFAULT_CONFIG = {
     "record_user_actions": True,  # 是否记录用户操作
     "user_actions_log": os.path.join(os.path.dirname(os.path.abspath(__file__)), 'log', 'user_actions.log'),  # 用户操作日志文件路径
         # 新增配置项开始
+    "config_reload_interval": 2,       # 检查配置文件变化的间隔（秒）
+    "capture": {
+        "jpeg_quality": 95,            # 截图初始 JPEG 质量
+        "target_size_kb": 500,         # 单张截图目标大小
+        "frame_storage": "files",      # files: 每帧写入会话目录；cas: 按像素哈希去重的共享截图存储；pack: 追加写入会话内的段文件
+        "pack_segment_mb": 64,         # pack 模式下单个段文件的大小上限（MB）
+        "backend": "auto"              # 截屏后端: auto / quartz / xshm / mss / pyautogui / synthetic
+    },
+    "capture_profiles": {
+        # 按前台应用（active_app）选择截图方式，按顺序匹配第一条规则，未命中时使用 capture 中的默认值。
+        # apps 为应用名或通配符（不区分大小写）；mode: full / monitor / skip（只记录事件不截图）；
+        # scale: 缩放比例；format: jpeg / png；annotated: 是否保存带信息的截图；max_fps: 每秒最多截图次数。
+        # 例如：{"apps": ["Terminal", "iTerm2"], "format": "png", "annotated": False}
+        #       {"apps": ["*VLC*", "IINA"], "scale": 0.5, "quality": 70, "max_fps": 0.2}
+        #       {"apps": ["1Password*", "Keychain Access"], "mode": "skip"}
+        "rules": []
+    },
+    "recorder": {
+        "input_process": True,         # 在独立子进程中监听键盘鼠标，避免编码和上传拖慢事件回调
+        "scroll_timeout": 2.0,         # 滚动停止多久后结算一次滚动事件（秒）
+        "scroll_move_threshold": 20,   # 滚动位置离手势起点超过该距离时开始新手势（像素）
+        "key_debounce": 1.5,           # 停止输入多久后合并为一次按键事件（秒）
+        "move_min_distance": 3,        # 鼠标轨迹中相邻保留点的最小距离（像素）
+        "path_tolerance": 2.0,         # 轨迹 RDP 简化容差（像素）
+        "drag_threshold": 10           # 按下与松开距离超过该值时记录为拖拽（像素）
+    },
+    "display": {
+        "capture_monitor_only": True,  # 只截取事件所在的显示器
+        "refresh_interval": 30         # 显示器布局缓存的最长有效期（秒）
+    },
+    "periodic_capture": {
+        "min_interval": 2,            # 画面变化时的最短截屏间隔（秒）
+        "max_interval": 60,           # 画面静止时退避的最长间隔（秒）
+        "backoff": 1.5,               # 每次未变化时间隔的放大倍数
+        "change_threshold": 0.01,     # 缩略图中变化像素比例超过该值才保存
+        "downsample": 16              # 变化检测时的缩小倍数
+    },
+    "settle": {
+        "enabled": False,             # 每个事件后等画面稳定再截取一张，记录到 log/settled_frames.jsonl
+        "min_delay": 0.1,             # 事件后开始检测前的等待（秒）
+        "poll_interval": 0.1,         # 检测间隔（秒）
+        "timeout": 2.0,               # 最长等待，超时使用最后一帧（秒）
+        "stable_polls": 2,            # 连续多少次变化低于阈值视为稳定
+        "change_threshold": 0.002,    # 缩略图中变化像素比例低于该值视为未变化
+        "downsample": 16              # 变化检测时的缩小倍数
+    },
+    "tracing": {
+        "enabled": False,             # 记录流水线各环节的起止时间，会话结束时写出 log/trace.json（Chrome trace 格式）
+        "max_events": 200000          # 内存中最多保留的区间数，超出时丢弃最早的记录
+    },
+    "storage_budget": {
+        "low_watermark_mb": 2048,     # 超过低水位后降低截图质量
+        "high_watermark_mb": 4096,    # 超过高水位后拒绝新截图
+        "retention_days": 7,          # 未上传会话的保留天数
+        "degraded_quality": 60,
+        "degraded_target_size_kb": 200
+    },
+    "archive": {
+        "format": "zip",               # zip: 整体加密的 .zip.enc；chunked: 可随机访问的分块加密归档 .bgca
+        "chunk_size_kb": 1024,         # 分块归档的明文块大小
+        "workers": 0                   # 并行加密线程数，0 表示使用全部 CPU 核心
+    },
+    "upload": {
+        "workers": 2,                  # 后台上传并发数（调大后需重启生效）
+        "bandwidth_kbps": 0,           # 上传带宽上限（KB/s），0 表示不限速
+        "retry_base": 30,              # 上传失败后首次重试的等待秒数，之后按指数退避
+        "retry_max": 3600              # 重试等待的上限（秒）
+    },
+    "governor": {
+        "enabled": True,               # 根据电源与系统负载限制后台编码与上传
+        "interval": 2.0,               # 采样间隔（秒）
+        "battery_cpu_share": 0.15,     # 限制模式下截图编码允许占用单核的比例
+        "ac_cpu_share": 0,             # 接通电源时的编码 CPU 份额，0 表示不限制
+        "busy_system_percent": 85,     # 系统 CPU 占用超过该值时也进入限制模式（%）
+        "throttled_workers": 1,        # 限制模式下同时编码的截图数
+        "throttled_quality_step": 15,  # 限制模式下 JPEG 逐步降质的步长，减少重复编码
+        "battery_bandwidth_kbps": 256, # 限制模式下的上传带宽上限（KB/s），0 表示不限制
+        "nice": 10                     # 编码与上传工作线程的 nice 值（启动时生效）
+    },
+    "frame_encoder": {
+        "workers": 2,                 # 截图编码工作线程/进程数，0 表示同步编码
+        "use_processes": False,       # 是否使用子进程编码（通过共享内存读取帧）
+        "pool_slots": 8               # 共享内存帧缓冲槽位上限，按需创建
+    },
+    "ui": {
+        "refresh_interval_ms": 500,   # 界面取走事件批次并刷新会话统计的间隔
+        "behind_threshold": 8         # 待编码截图达到该数量时提示录制落后
+    },
     "encryption": {
         "key": "16byteslongkey!!",  # AES加密密钥（16字节）
         "iv": "16byteslongiv!!!"    # AES初始化向量（16字节）
@@ -26,20 +118,8 @@ DEFAULT_CONFIG = {
 class Config:
     @staticmethod
     def load_config(config_file='config.json'):
-        config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), config_file)
-        if os.path.exists(config_path):
-            try:
-                with open(config_path, 'r', encoding='utf-8') as f:
-                    config = json.load(f)
-                thread_safe_logging('info', "配置文件已加载。")
-                return config
-            except Exception as e:
-                thread_safe_logging('error', f"加载配置文件失败: {e}")
-                return DEFAULT_CONFIG
-        else:
-            Config.save_config(DEFAULT_CONFIG, config_path)
-            thread_safe_logging('info', "默认配置已创建。")
-            return DEFAULT_CONFIG
+        """读取配置；实际解析与校验由 ConfigService 完成，这里返回其快照。"""
+        return ConfigService(config_file).snapshot()
 
     @staticmethod
     def save_config(config, config_file='config.json'):
@@ -49,4 +129,247 @@ class Config:
                 json.dump(config, f, indent=4)
             thread_safe_logging('info', "配置文件已保存。")
         except Exception as e:
-            thread_safe_logging('error', f"保存配置文件失败: {e}")
\ No newline at end of file
+            thread_safe_logging('error', f"保存配置文件失败: {e}")
+
+
+# 性能相关配置的校验规则：路径 -> (类型, 默认值, 最小值, 最大值)
+PERFORMANCE_SCHEMA = {
+    "screenshot_interval": (float, 20, 1, 3600),
+    "config_reload_interval": (float, 2, 0.5, 60),
+    "capture.jpeg_quality": (int, 95, 10, 100),
+    "capture.target_size_kb": (int, 500, 20, 10240),
+    "capture.frame_storage": (str, "files", None, None),
+    "capture.pack_segment_mb": (int, 64, 1, 2048),
+    "capture.backend": (str, "auto", None, None),
+    "recorder.input_process": (bool, True, None, None),
+    "recorder.scroll_timeout": (float, 2.0, 0.1, 30),
+    "recorder.scroll_move_threshold": (float, 20, 1, 1000),
+    "recorder.key_debounce": (float, 1.5, 0.1, 30),
+    "recorder.move_min_distance": (float, 3, 0, 100),
+    "recorder.path_tolerance": (float, 2.0, 0, 50),
+    "recorder.drag_threshold": (float, 10, 1, 500),
+    "display.capture_monitor_only": (bool, True, None, None),
+    "display.refresh_interval": (float, 30, 1, 3600),
+    "periodic_capture.min_interval": (float, 2, 0.5, 3600),
+    "periodic_capture.max_interval": (float, 60, 1, 3600),
+    "periodic_capture.backoff": (float, 1.5, 1.0, 10),
+    "periodic_capture.change_threshold": (float, 0.01, 0.0, 1.0),
+    "periodic_capture.downsample": (int, 16, 1, 64),
+    "settle.enabled": (bool, False, None, None),
+    "settle.min_delay": (float, 0.1, 0, 5),
+    "settle.poll_interval": (float, 0.1, 0.02, 5),
+    "settle.timeout": (float, 2.0, 0.1, 30),
+    "settle.stable_polls": (int, 2, 1, 20),
+    "settle.change_threshold": (float, 0.002, 0.0, 1.0),
+    "settle.downsample": (int, 16, 1, 64),
+    "tracing.enabled": (bool, False, None, None),
+    "tracing.max_events": (int, 200000, 1000, 5000000),
+    "storage_budget.low_watermark_mb": (float, 2048, 1, None),
+    "storage_budget.high_watermark_mb": (float, 4096, 1, None),
+    "storage_budget.retention_days": (float, 7, 0, 3650),
+    "storage_budget.degraded_quality": (int, 60, 10, 100),
+    "storage_budget.degraded_target_size_kb": (int, 200, 20, 10240),
+    "archive.format": (str, "zip", None, None),
+    "archive.chunk_size_kb": (int, 1024, 64, 65536),
+    "archive.workers": (int, 0, 0, 64),
+    "upload.workers": (int, 2, 1, 16),
+    "upload.bandwidth_kbps": (float, 0, 0, None),
+    "upload.retry_base": (float, 30, 1, 3600),
+    "upload.retry_max": (float, 3600, 1, 86400),
+    "governor.enabled": (bool, True, None, None),
+    "governor.interval": (float, 2.0, 0.5, 60),
+    "governor.battery_cpu_share": (float, 0.15, 0, 1),
+    "governor.ac_cpu_share": (float, 0, 0, 1),
+    "governor.busy_system_percent": (float, 85, 10, 100),
+    "governor.throttled_workers": (int, 1, 1, 32),
+    "governor.throttled_quality_step": (int, 15, 1, 50),
+    "governor.battery_bandwidth_kbps": (float, 256, 0, None),
+    "governor.nice": (int, 10, 0, 19),
+    "frame_encoder.workers": (int, 2, 0, 32),
+    "frame_encoder.use_processes": (bool, False, None, None),
+    "frame_encoder.pool_slots": (int, 8, 2, 64),
+    "ui.refresh_interval_ms": (int, 500, 100, 5000),
+    "ui.behind_threshold": (int, 8, 1, 1000),
+}
+
+# 字符串配置项的可选值，拼写错误时记录警告并使用默认值
+SCHEMA_CHOICES = {
+    "capture.frame_storage": ("files", "cas", "pack"),
+    "capture.backend": ("auto", "quartz", "xshm", "mss", "pyautogui", "synthetic"),
+    "archive.format": ("zip", "chunked"),
+}
+
+# 需要满足 前者 < 后者 的配置项，不满足时两者都使用默认值
+SCHEMA_ORDERED = (
+    ("storage_budget.low_watermark_mb", "storage_budget.high_watermark_mb"),
+)
+
+
+def config_file_path(config_file='config.json'):
+    """
+    配置文件路径：优先使用应用目录下的配置（可在运行时修改），
+    打包后不存在时退回到随程序打包的配置。
+    """
+    path = os.path.join(app_path(), config_file)
+    if os.path.exists(path) or not getattr(sys, 'frozen', False):
+        return path
+    bundled = os.path.join(sys._MEIPASS, config_file)
+    return bundled if os.path.exists(bundled) else path
+
+
+class ConfigService:
+    """
+    全局唯一的配置服务。
+    配置文件只解析一次并按 PERFORMANCE_SCHEMA 校验，通过类型化访问器读取；
+    后台线程检测文件变化后重新加载，并把变化的配置项推送给订阅者，无需重启即可调整采集开销。
+    """
+
+    _instance = None
+    _initialized = False
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super(ConfigService, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self, config_file='config.json'):
+        if ConfigService._initialized:
+            return
+        self.path = config_file_path(config_file)
+        self.lock = threading.Lock()
+        self.subscribers = []
+        self.data = {}
+        self._mtime = None
+        self.reload()
+        self._stop_event = threading.Event()
+        self._watcher = threading.Thread(target=self._watch, daemon=True)
+        self._watcher.start()
+        ConfigService._initialized = True
+
+    # ---------- 加载与校验 ----------
+    def _read(self):
+        if not os.path.exists(self.path):
+            Config.save_config(DEFAULT_CONFIG, self.path)
+            thread_safe_logging('info', "默认配置已创建。")
+            return copy.deepcopy(DEFAULT_CONFIG)
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    @staticmethod
+    def _lookup(data, path):
+        node = data
+        for part in path.split('.'):
+            if not isinstance(node, dict) or part not in node:
+                return None
+            node = node[part]
+        return node
+
+    @staticmethod
+    def _assign(data, path, value):
+        parts = path.split('.')
+        node = data
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        node[parts[-1]] = value
+
+    def _validate(self, data):
+        """按 schema 转换类型并限制范围，非法值记录警告后使用默认值。"""
+        for path, (kind, default, minimum, maximum) in PERFORMANCE_SCHEMA.items():
+            raw = self._lookup(data, path)
+            if raw is None:
+                value = default
+            else:
+                try:
+                    if kind is bool:
+                        if not isinstance(raw, bool):
+                            raise ValueError(f"需要布尔值，实际为 {raw!r}")
+                        value = raw
+                    else:
+                        value = kind(raw)
+                        if minimum is not None and value < minimum:
+                            raise ValueError(f"小于最小值 {minimum}")
+                        if maximum is not None and value > maximum:
+                            raise ValueError(f"大于最大值 {maximum}")
+                        choices = SCHEMA_CHOICES.get(path)
+                        if choices is not None and value not in choices:
+                            raise ValueError(f"可选值为 {' / '.join(choices)}")
+                except (TypeError, ValueError) as e:
+                    thread_safe_logging('warning', f"配置项 {path} 无效（{e}），使用默认值 {default}")
+                    value = default
+            self._assign(data, path, value)
+        for lower, upper in SCHEMA_ORDERED:
+            if self._lookup(data, lower) >= self._lookup(data, upper):
+                thread_safe_logging('warning', f"配置项 {lower} 应小于 {upper}，两者都使用默认值")
+                self._assign(data, lower, PERFORMANCE_SCHEMA[lower][1])
+                self._assign(data, upper, PERFORMANCE_SCHEMA[upper][1])
+        return data
+
+    def reload(self):
+        """重新读取配置文件；返回发生变化的性能配置项列表。"""
+        try:
+            mtime = os.path.getmtime(self.path) if os.path.exists(self.path) else None
+            data = self._validate(self._read())
+        except Exception as e:
+            thread_safe_logging('error', f"加载配置文件失败，保留当前配置: {e}")
+            if not self.data:
+                self.data = self._validate(copy.deepcopy(DEFAULT_CONFIG))
+            return []
+
+        with self.lock:
+            old = self.data
+            self.data = data
+            self._mtime = mtime
+        changed = [path for path in PERFORMANCE_SCHEMA
+                   if self._lookup(old, path) != self._lookup(data, path)]
+        thread_safe_logging('info', f"配置文件已加载: {self.path}")
+        return changed
+
+    def _watch(self):
+        while not self._stop_event.wait(self.get_float('config_reload_interval')):
+            try:
+                mtime = os.path.getmtime(self.path)
+            except OSError:
+                continue
+            if mtime == self._mtime:
+                continue
+            changed = self.reload()
+            if changed:
+                thread_safe_logging('info', f"配置已热更新: {', '.join(changed)}")
+                self._notify(changed)
+
+    def _notify(self, changed):
+        for callback in list(self.subscribers):
+            try:
+                callback(self, changed)
+            except Exception as e:
+                thread_safe_logging('error', f"推送配置更新失败: {e}")
+
+    def subscribe(self, callback):
+        """注册配置更新回调 callback(service, changed_paths)，在配置监视线程中调用。"""
+        self.subscribers.append(callback)
+
+    def stop(self):
+        self._stop_event.set()
+
+    # ---------- 访问器 ----------
+    def get(self, path, default=None):
+        value = self._lookup(self.data, path)
+        return default if value is None else value
+
+    def section(self, name):
+        """返回某个配置分组的副本，供仍以字典方式读取配置的组件使用。"""
+        return dict(self.get(name, {}))
+
+    def get_int(self, path):
+        return int(self.get(path, PERFORMANCE_SCHEMA[path][1]))
+
+    def get_float(self, path):
+        return float(self.get(path, PERFORMANCE_SCHEMA[path][1]))
+
+    def get_bool(self, path):
+        return bool(self.get(path, PERFORMANCE_SCHEMA[path][1]))
+
+    def snapshot(self):
+        """返回完整配置的深拷贝。"""
+        return copy.deepcopy(self.data)
+
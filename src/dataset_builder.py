@@ -0,0 +1,233 @@
+# dataset_builder.py
+#
+# 将录制的会话转换为 WebDataset 风格的 tar 分片：
+#
+#     python dataset_builder.py <会话目录> <输出目录> [--shard-size 1000] [--max-side 1280] [--workers N]
+#
+# <会话目录> 可以是 records/，也可以是 decrypt_tool.py 的输出目录，会递归查找包含
+# log/user_actions_real_time_*.jsonl 的会话文件夹。每个样本在分片中占两个成员：
+#     <key>.jpg   截图（不带信息的原始截图；按应用规则保存为 PNG 的截图为 <key>.png）
+#     <key>.json  动作记录，坐标按 max_x / max_y 归一化到 [0, 1]
+# 分片按会话并行生成，全部完成后写出 manifest.json。以段文件（screenshots/packs）保存截图的会话
+# 直接从段文件读取，无需先导出为散文件。
+
+import io
+import os
+import sys
+import glob
+import fnmatch
+import json
+import time
+import tarfile
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from PIL import Image
+from packstore import PackReader, read_screenshot
+
+EVENT_LOG_PATTERN = 'user_actions_real_time_*.jsonl'
+MANIFEST_FILE = 'manifest.json'
+
+
+def find_sessions(input_dir):
+    """返回包含实时事件日志的会话文件夹列表。"""
+    sessions = set()
+    for root, dirs, names in os.walk(input_dir):
+        if os.path.basename(root) == 'log' and any(fnmatch.fnmatch(n, EVENT_LOG_PATTERN) for n in names):
+            sessions.add(os.path.dirname(root))
+    return sorted(sessions)
+
+
+def resolve_screenshot(session_folder, screenshots_path):
+    """
+    将事件中的 screenshots_path（records/<会话>/screenshots/...，可能为 Windows 分隔符）
+    映射到当前会话文件夹下的实际文件。
+    """
+    if not screenshots_path:
+        return None
+    parts = screenshots_path.replace('\\', '/').split('/')
+    if 'screenshots' not in parts:
+        return None
+    rel = parts[parts.index('screenshots'):]
+    return os.path.join(session_folder, *rel)
+
+
+def _normalize_point(point):
+    if not point:
+        return point
+    normalized = dict(point)
+    max_x, max_y = point.get('max_x'), point.get('max_y')
+    if max_x and max_y:
+        normalized['rel_x'] = point['x'] / max_x
+        normalized['rel_y'] = point['y'] / max_y
+    return normalized
+
+
+def normalize_event(event):
+    """生成样本的动作记录：保留原始字段，为各坐标补充归一化的 rel_x / rel_y。"""
+    content = dict(event.get('action_content') or {})
+    if content.get('position'):
+        content['position'] = _normalize_point(content['position'])
+    if content.get('monitor'):
+        content['monitor'] = _normalize_point(content['monitor'])
+    return {
+        "event_id": event.get('event_id'),
+        "timestamp": event.get('timestamp'),
+        "action_type": event.get('action_type'),
+        "action_content": content,
+        "active_app": event.get('active_app'),
+        "mouse_position": _normalize_point(event.get('mouse_position'))
+    }
+
+
+def load_frame(data, max_side, quality):
+    """处理截图字节；指定 max_side 时按比例缩小并重新编码，否则直接使用原始 JPEG，不做解码。"""
+    if not max_side:
+        return data
+    img = Image.open(io.BytesIO(data))
+    if max(img.size) <= max_side:
+        return data
+    img.thumbnail((max_side, max_side), Image.LANCZOS)
+    out = io.BytesIO()
+    img.convert('RGB').save(out, format='JPEG', quality=quality)
+    return out.getvalue()
+
+
+class ShardWriter:
+    """按样本数或字节数滚动写出 tar 分片。"""
+
+    def __init__(self, output_dir, prefix, max_samples, max_bytes):
+        self.output_dir = output_dir
+        self.prefix = prefix
+        self.max_samples = max_samples
+        self.max_bytes = max_bytes
+        self.shards = []
+        self.tar = None
+
+    def _open(self):
+        name = f"{self.prefix}-{len(self.shards):05d}.tar"
+        self.tar = tarfile.open(os.path.join(self.output_dir, name), 'w')
+        self.shards.append({"name": name, "samples": 0, "bytes": 0})
+
+    def _add_member(self, name, data, mtime):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = mtime
+        self.tar.addfile(info, io.BytesIO(data))
+
+    def write(self, key, image_bytes, record):
+        current = self.shards[-1] if self.shards else None
+        if current is None or current['samples'] >= self.max_samples or current['bytes'] >= self.max_bytes:
+            self.close()
+            self._open()
+            current = self.shards[-1]
+        payload = json.dumps(record, ensure_ascii=False).encode('utf-8')
+        mtime = int(record.get('timestamp') or 0)
+        extension = 'png' if image_bytes[:4] == b'\x89PNG' else 'jpg'
+        self._add_member(f"{key}.{extension}", image_bytes, mtime)
+        self._add_member(f"{key}.json", payload, mtime)
+        current['samples'] += 1
+        current['bytes'] += len(image_bytes) + len(payload)
+
+    def close(self):
+        if self.tar is not None:
+            self.tar.close()
+            self.tar = None
+
+
+def build_session(session_folder, session_name, output_dir, max_samples, max_bytes, max_side, quality):
+    """将单个会话写成若干分片，返回分片信息与统计。"""
+    writer = ShardWriter(output_dir, session_name, max_samples, max_bytes)
+    packs = PackReader(session_folder)
+    # WebDataset 在第一个 '.' 处拆分键与扩展名，用户名或会话名中的 '.' 会打乱样本分组
+    key_prefix = session_name.replace('.', '_')
+    samples = skipped = 0
+    try:
+        for log_path in sorted(glob.glob(os.path.join(session_folder, 'log', EVENT_LOG_PATTERN))):
+            with open(log_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        skipped += 1
+                        continue
+                    frame_path = resolve_screenshot(session_folder, event.get('screenshots_path'))
+                    data = None if frame_path is None else read_screenshot(
+                        session_folder, os.path.relpath(frame_path, session_folder), packs)
+                    if data is None:
+                        skipped += 1
+                        continue
+                    # 同一会话可能有多个实时日志，键使用会话内样本序号
+                    key = f"{key_prefix}/{samples:08d}"
+                    writer.write(key, load_frame(data, max_side, quality), normalize_event(event))
+                    samples += 1
+    finally:
+        writer.close()
+        packs.close()
+    for shard in writer.shards:
+        shard['session'] = session_name
+    return {"session": session_name, "shards": writer.shards, "samples": samples, "skipped": skipped}
+
+
+def session_name(input_dir, session_folder):
+    rel = os.path.relpath(session_folder, input_dir)
+    if rel == os.curdir:
+        rel = os.path.basename(os.path.abspath(session_folder))
+    return rel.replace(os.sep, '_')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="将录制会话转换为 tar 分片训练数据集")
+    parser.add_argument('input_dir', help="会话所在目录，递归查找")
+    parser.add_argument('output_dir', help="分片输出目录")
+    parser.add_argument('--shard-size', type=int, default=1000, help="每个分片最多样本数")
+    parser.add_argument('--shard-mb', type=int, default=512, help="每个分片最大字节数（MB）")
+    parser.add_argument('--max-side', type=int, default=0, help="截图最长边，0 表示不缩放")
+    parser.add_argument('--quality', type=int, default=90, help="缩放后重新编码的 JPEG 质量")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2, help="并行进程数")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.makedirs(args.output_dir, exist_ok=True)
+    sessions = find_sessions(args.input_dir)
+    print(f"发现会话 {len(sessions)} 个，使用 {args.workers} 个进程")
+
+    started = time.time()
+    results = []
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {
+            # 解密输出中不同用户可能有同名会话，分片前缀使用相对路径
+            pool.submit(build_session, session, session_name(args.input_dir, session), args.output_dir, args.shard_size,
+                        args.shard_mb * 1024 * 1024, args.max_side, args.quality): session
+            for session in sessions
+        }
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"会话处理失败: {futures[future]}, 错误: {e}", file=sys.stderr)
+                continue
+            results.append(result)
+            print(f"{result['session']}: 样本 {result['samples']} 个，跳过 {result['skipped']} 个，"
+                  f"分片 {len(result['shards'])} 个")
+
+    results.sort(key=lambda r: r['session'])
+    manifest = {
+        "created": time.time(),
+        "max_side": args.max_side or None,
+        "samples": sum(r['samples'] for r in results),
+        "skipped": sum(r['skipped'] for r in results),
+        "sessions": [r['session'] for r in results],
+        "shards": [shard for r in results for shard in r['shards']]
+    }
+    with open(os.path.join(args.output_dir, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    print(f"完成: 样本 {manifest['samples']} 个，分片 {len(manifest['shards'])} 个，"
+          f"用时 {time.time() - started:.1f} 秒")
+    return 0 if len(results) == len(sessions) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,262 @@
+# decrypt_tool.py
+#
+# 批量解密并解压上传的会话归档：
+#
+#     python decrypt_tool.py <归档目录> <输出目录> [--workers N] [--config config.json] [--verify] [--unpack]
+#
+# 支持 StorageManager.encrypt_file 生成的 .zip.enc（IV 前缀 + AES-CBC + PKCS7）
+# 以及分块加密归档 .bgca。每个归档在进程池中独立处理：流式解密到临时 ZIP，
+# 校验 CRC 后解压到 <输出目录>/<归档名>/。已成功处理的归档记录在状态文件中，重复运行时跳过。
+# 使用共享截图存储上传的会话，全部解压后按 frames_index.json 把截图还原到原路径。
+# 指定 --verify 时按会话中的 manifest.jsonl 校验还原后的每个文件。
+# 截图保存在段文件（screenshots/packs）中的会话，指定 --unpack 时导出为原路径下的散文件。
+
+import os
+import sys
+import json
+import time
+import shutil
+import zipfile
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from Crypto.Cipher import AES
+from frame_store import FRAME_STORE_DIR, FRAME_INDEX_FILE, materialize_frames
+from manifest import MANIFEST_FILE, verify_folder
+from packstore import PACK_DIR, export_loose
+
+STATE_FILE = '.decrypt_state.json'
+READ_SIZE = 4 * 1024 * 1024
+ARCHIVE_SUFFIXES = ('.zip.enc', '.bgca')
+
+
+def archive_stem(filename):
+    for suffix in ARCHIVE_SUFFIXES:
+        if filename.endswith(suffix):
+            return filename[:-len(suffix)]
+    return None
+
+
+def decrypt_stream(input_path, output_path, key):
+    """流式解密 .zip.enc：首 16 字节为 IV，其余为 CBC 密文，最后一块去除 PKCS7 填充。"""
+    with open(input_path, 'rb') as src, open(output_path, 'wb') as dst:
+        iv = src.read(AES.block_size)
+        if len(iv) != AES.block_size:
+            raise ValueError("文件过短，缺少 IV")
+        cipher = AES.new(key, AES.MODE_CBC, iv)
+        pending = b''
+        while True:
+            block = src.read(READ_SIZE)
+            if not block:
+                break
+            data = pending + block
+            # 保留最后一个分组，待读完后再去除填充
+            keep = len(data) % AES.block_size or AES.block_size
+            dst.write(cipher.decrypt(data[:-keep]))
+            pending = data[-keep:]
+        if len(pending) != AES.block_size:
+            raise ValueError("密文长度不是分组大小的整数倍")
+        last = cipher.decrypt(pending)
+        padding = last[-1]
+        if not 1 <= padding <= AES.block_size or last[-padding:] != bytes([padding]) * padding:
+            raise ValueError("PKCS7 填充无效，密钥错误或文件损坏")
+        dst.write(last[:-padding])
+
+
+def _safe_extract(archive, target):
+    """解压 ZIP，拒绝指向目标目录之外的成员路径。"""
+    root = os.path.abspath(target)
+    for member in archive.infolist():
+        path = os.path.abspath(os.path.join(root, member.filename))
+        if path != root and not path.startswith(root + os.sep):
+            raise ValueError(f"归档成员路径非法: {member.filename}")
+    archive.extractall(root)
+
+
+def process_archive(input_path, output_dir, key):
+    """
+    解密、校验并解压单个归档，返回 (输入字节数, 输出文件数)。
+    先解压到临时目录，全部成功后再重命名，中途失败不会留下不完整的结果。
+    """
+    filename = os.path.basename(input_path)
+    stem = archive_stem(filename)
+    target = os.path.join(output_dir, stem)
+    staging = target + '.part'
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    try:
+        if filename.endswith('.bgca'):
+            from chunked_archive import ChunkedArchiveReader
+            with ChunkedArchiveReader(input_path, key) as reader:
+                reader.extract_all(staging)
+                count = len(reader.names())
+        else:
+            zip_path = staging + '.zip'
+            try:
+                decrypt_stream(input_path, zip_path, key)
+                with zipfile.ZipFile(zip_path) as archive:
+                    bad = archive.testzip()
+                    if bad is not None:
+                        raise ValueError(f"CRC 校验失败: {bad}")
+                    _safe_extract(archive, staging)
+                    count = len(archive.infolist())
+            finally:
+                if os.path.exists(zip_path):
+                    os.remove(zip_path)
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(staging, target)
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return os.path.getsize(input_path), count
+
+
+def restore_frames(targets, blob_root):
+    """按归档顺序还原去重上传的截图，返回仍缺失的截图数（其所在归档尚未处理）。"""
+    missing = 0
+    for target in sorted(targets):
+        for root, dirs, names in os.walk(target):
+            if FRAME_INDEX_FILE in names:
+                missing += materialize_frames(root, blob_root)
+    return missing
+
+
+def verify_sessions(targets):
+    """按完整性清单校验解压后的会话，返回不一致或缺失的文件数。"""
+    problems = 0
+    for target in sorted(targets):
+        for root, dirs, names in os.walk(target):
+            if MANIFEST_FILE in names:
+                bad = verify_folder(root)
+                for rel in bad:
+                    print(f"校验失败: {os.path.join(root, rel)}", file=sys.stderr)
+                problems += len(bad)
+    return problems
+
+
+def unpack_sessions(targets):
+    """把会话段文件中的截图导出为散文件，返回导出的截图数。"""
+    count = 0
+    for target in sorted(targets):
+        for root, dirs, names in os.walk(target):
+            if os.path.isdir(os.path.join(root, PACK_DIR)):
+                count += export_loose(root, remove=True)
+    return count
+
+
+def load_state(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_state(path, state):
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)
+
+
+def find_archives(input_dir):
+    """递归查找归档，返回相对于 input_dir 的路径列表（上传路径为 <用户名>/<时间戳>.zip.enc）。"""
+    found = []
+    for root, dirs, names in os.walk(input_dir):
+        for name in names:
+            if archive_stem(name):
+                found.append(os.path.relpath(os.path.join(root, name), input_dir))
+    return sorted(found)
+
+
+def load_encryption(config_path):
+    with open(config_path, 'r', encoding='utf-8') as f:
+        encryption = json.load(f).get('encryption', {})
+    return encryption.get('key'), encryption.get('iv')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="批量解密并解压会话归档（.zip.enc / .bgca）")
+    parser.add_argument('input_dir', help="归档所在目录，递归查找")
+    parser.add_argument('output_dir', help="解压输出目录")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2, help="并行进程数")
+    parser.add_argument('--config', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.json'),
+                        help="读取 encryption.key 的配置文件")
+    parser.add_argument('--key', help="AES 密钥，优先于配置文件")
+    parser.add_argument('--force', action='store_true', help="忽略状态文件，重新处理全部归档")
+    parser.add_argument('--verify', action='store_true', help="按 manifest.jsonl 校验解压后的文件")
+    parser.add_argument('--unpack', action='store_true', help="把段文件中的截图导出为散文件")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    key = args.key or load_encryption(args.config)[0]
+    if not key:
+        print("未找到加密密钥，请使用 --key 或 --config 指定", file=sys.stderr)
+        return 2
+    key_bytes = key.encode('utf-8')
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    state_path = os.path.join(args.output_dir, STATE_FILE)
+    state = {} if args.force else load_state(state_path)
+
+    todo = []
+    for rel in find_archives(args.input_dir):
+        path = os.path.join(args.input_dir, rel)
+        stat = os.stat(path)
+        done = state.get(rel)
+        if done and done.get('status') == 'ok' and done.get('size') == stat.st_size \
+                and done.get('mtime') == int(stat.st_mtime):
+            continue
+        todo.append((rel, path, stat))
+
+    print(f"待处理归档 {len(todo)} 个，使用 {args.workers} 个进程")
+    started = time.time()
+    total_bytes = 0
+    failed = 0
+    extracted = []
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {}
+        for rel, path, stat in todo:
+            output_dir = os.path.join(args.output_dir, os.path.dirname(rel))
+            os.makedirs(output_dir, exist_ok=True)
+            futures[pool.submit(process_archive, path, output_dir, key_bytes)] = (rel, stat)
+        for done_count, future in enumerate(as_completed(futures), 1):
+            rel, stat = futures[future]
+            record = {"size": stat.st_size, "mtime": int(stat.st_mtime), "time": time.time()}
+            try:
+                nbytes, files = future.result()
+                total_bytes += nbytes
+                record.update(status='ok', files=files)
+                extracted.append(os.path.join(args.output_dir, os.path.dirname(rel), archive_stem(os.path.basename(rel))))
+            except Exception as e:
+                failed += 1
+                record.update(status='error', error=str(e))
+                print(f"处理失败: {rel}, 错误: {e}", file=sys.stderr)
+            state[rel] = record
+            save_state(state_path, state)
+            elapsed = max(time.time() - started, 1e-6)
+            print(f"[{done_count}/{len(todo)}] {rel} - "
+                  f"{total_bytes / (1024 * 1024) / elapsed:.1f}MB/s, {done_count / elapsed:.1f} 个/秒")
+
+    missing = restore_frames(extracted, os.path.join(args.output_dir, FRAME_STORE_DIR))
+    if missing:
+        print(f"有 {missing} 张去重截图暂未找到，补齐其所在的归档后使用 --force 重新运行", file=sys.stderr)
+
+    if args.verify:
+        problems = verify_sessions(extracted)
+        print(f"完整性校验: {problems} 个文件不一致或缺失" if problems else "完整性校验通过")
+        if problems:
+            failed += 1
+
+    if args.unpack:
+        print(f"已从段文件导出 {unpack_sessions(extracted)} 张截图")
+
+    elapsed = time.time() - started
+    print(f"完成: 成功 {len(todo) - failed} 个，失败 {failed} 个，"
+          f"共 {total_bytes / (1024 * 1024):.1f}MB，用时 {elapsed:.1f} 秒")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,144 @@
+# display.py
+
+import platform
+import threading
+import time
+from collections import namedtuple
+import pyautogui
+from logger import thread_safe_logging
+
+# 显示器几何信息，坐标与尺寸均为逻辑坐标（与 pynput / pyautogui 的鼠标坐标一致），
+# scale 为像素密度（Retina 为 2.0）
+Monitor = namedtuple('Monitor', ['index', 'left', 'top', 'width', 'height', 'scale'])
+
+
+def _distance_sq(monitor, x, y):
+    """点到显示器矩形的距离平方，点在矩形内时为 0。"""
+    dx = max(monitor.left - x, 0, x - (monitor.left + monitor.width - 1))
+    dy = max(monitor.top - y, 0, y - (monitor.top + monitor.height - 1))
+    return dx * dx + dy * dy
+
+
+class DisplayGeometry:
+    """
+    显示器布局缓存服务。
+    首次使用时查询一次系统显示器布局与缩放比例，之后直接使用缓存；
+    收到系统的显示器变化通知（macOS）或缓存过期时重新查询；坐标落在所有显示器之外时
+    （如右、下边缘坐标或略为负值的坐标）归到最近的显示器，不为单个事件重新查询。
+    """
+
+    _instance = None
+    _initialized = False
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super(DisplayGeometry, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self, refresh_interval=30):
+        if DisplayGeometry._initialized:
+            return
+        self.refresh_interval = refresh_interval
+        self.lock = threading.Lock()
+        self._monitors = None
+        self._primary_size = None
+        self._queried_at = 0.0
+        self._register_change_callback()
+        DisplayGeometry._initialized = True
+
+    # ---------- 查询 ----------
+    def _query_darwin(self):
+        from AppKit import NSScreen
+        screens = NSScreen.screens()
+        primary_height = screens[0].frame().size.height
+        monitors = []
+        for index, screen in enumerate(screens):
+            frame = screen.frame()
+            # NSScreen 原点在主屏左下角，转换为左上角原点
+            top = primary_height - (frame.origin.y + frame.size.height)
+            monitors.append(Monitor(index, int(frame.origin.x), int(top), int(frame.size.width),
+                                    int(frame.size.height), float(screen.backingScaleFactor())))
+        return monitors
+
+    def _query_mss(self):
+        import mss
+        with mss.mss() as sct:
+            return [Monitor(index, m['left'], m['top'], m['width'], m['height'], 1.0)
+                    for index, m in enumerate(sct.monitors[1:])]
+
+    def _query(self):
+        try:
+            if platform.system() == "Darwin":
+                monitors = self._query_darwin()
+            else:
+                monitors = self._query_mss()
+        except Exception as e:
+            thread_safe_logging('warning', f"查询显示器布局失败，按单显示器处理: {e}")
+            width, height = pyautogui.size()
+            monitors = [Monitor(0, 0, 0, width, height, 1.0)]
+        thread_safe_logging('info', f"显示器布局: {monitors}")
+        return monitors
+
+    def _refresh_if_needed(self):
+        with self.lock:
+            expired = time.time() - self._queried_at > self.refresh_interval
+            if self._monitors is not None and not expired:
+                return self._monitors
+        monitors = self._query()
+        primary_size = tuple(pyautogui.size())
+        with self.lock:
+            self._monitors = monitors
+            self._primary_size = primary_size
+            self._queried_at = time.time()
+            return monitors
+
+    def invalidate(self):
+        """丢弃缓存，下一次访问时重新查询显示器布局。"""
+        with self.lock:
+            self._monitors = None
+        thread_safe_logging('info', "显示器布局缓存已失效")
+
+    def _register_change_callback(self):
+        """在 macOS 上注册显示器配置变化回调，其他系统依赖缓存过期时间。"""
+        if platform.system() != "Darwin":
+            return
+        try:
+            import Quartz
+
+            def on_reconfigure(display, flags, user_info):
+                self.invalidate()
+
+            self._change_callback = on_reconfigure  # 保持引用，防止回调被回收
+            Quartz.CGDisplayRegisterReconfigurationCallback(on_reconfigure, None)
+        except Exception as e:
+            thread_safe_logging('warning', f"注册显示器变化通知失败: {e}")
+
+    # ---------- 访问 ----------
+    def monitors(self):
+        return self._refresh_if_needed()
+
+    def primary_size(self):
+        """主显示器尺寸，等同于 pyautogui.size()，但不会每次都查询系统。"""
+        self._refresh_if_needed()
+        return self._primary_size
+
+    def monitor_at(self, x, y):
+        """返回包含该点的显示器；点不在任何显示器内时返回距离最近的显示器。"""
+        monitors = self.monitors()
+        for monitor in monitors:
+            if monitor.left <= x < monitor.left + monitor.width and \
+                    monitor.top <= y < monitor.top + monitor.height:
+                return monitor
+        return min(monitors, key=lambda m: _distance_sq(m, x, y))
+
+    def local_position(self, x, y):
+        """将全局坐标转换为所在显示器内的坐标记录。"""
+        monitor = self.monitor_at(x, y)
+        return {
+            "index": monitor.index,
+            "x": x - monitor.left,
+            "y": y - monitor.top,
+            "max_x": monitor.width,
+            "max_y": monitor.height,
+            "scale": monitor.scale
+        }
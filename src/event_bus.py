@@ -0,0 +1,56 @@
+# event_bus.py
+
+import threading
+import time
+from collections import deque, namedtuple
+
+# 传给界面的轻量事件记录，不做 JSON 序列化。录制的事件对象（events.py）具备同样的属性，直接发布
+EventRecord = namedtuple('EventRecord', ['event_id', 'timestamp', 'action_type', 'active_app', 'screenshots_path'])
+
+
+class EventBus:
+    """
+    录制线程到界面的事件总线。
+    录制线程只把结构化记录追加到缓冲区（不经过 Qt 信号），
+    界面按固定刷新频率一次取走整批记录，单个事件的开销与界面刷新解耦。
+    """
+
+    _instance = None
+    _initialized = False
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super(EventBus, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self, max_pending=10000, rate_window=60):
+        if EventBus._initialized:
+            return
+        self.lock = threading.Lock()
+        self.pending = deque(maxlen=max_pending)  # 界面长时间未取走时丢弃最旧的记录
+        self.recent = deque()                     # 最近 rate_window 秒内的事件时间
+        self.rate_window = rate_window
+        self.total = 0
+        EventBus._initialized = True
+
+    def publish(self, record):
+        """录制线程调用：登记一条事件，不阻塞、不序列化。"""
+        with self.lock:
+            self.pending.append(record)
+            self.recent.append(record.timestamp)
+            self.total += 1
+
+    def drain(self):
+        """界面线程调用：取走自上次以来的全部记录。"""
+        with self.lock:
+            batch = list(self.pending)
+            self.pending.clear()
+        return batch
+
+    def events_per_minute(self, now=None):
+        now = now or time.time()
+        with self.lock:
+            while self.recent and now - self.recent[0] > self.rate_window:
+                self.recent.popleft()
+            count = len(self.recent)
+        return count * 60.0 / self.rate_window
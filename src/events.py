@@ -0,0 +1,129 @@
+# events.py
+
+import json
+
+# 与 json.dumps(..., ensure_ascii=False) 输出一致的编码器，模块级复用
+_encode = json.JSONEncoder(ensure_ascii=False).encode
+
+
+class RecordedEvent:
+    """
+    录制事件的紧凑模型。输入回调只填入原始坐标与参数，handle_event 补充编号、截图与显示器信息后，
+    encode 一次性生成 JSONL 行；同一份字节用于实时日志、完整性清单与会话结束时的汇总文件，
+    事件对象本身（具备 event_id、timestamp、action_type、active_app、screenshots_path 属性）
+    直接交给事件总线，不再为每个输出各构造一次嵌套字典。
+    JSONL 结构与之前的字典版本相同，position 与 mouse_position 由同一段序列化结果填入。
+    """
+
+    __slots__ = ('captured_at', 'x', 'y', 'active_app', 'trajectory',
+                 'event_id', 'timestamp', 'max_x', 'max_y', 'monitor',
+                 'screenshots_path', 'frame_hash', '_line')
+
+    action_type = None
+
+    def __init__(self, captured_at, x, y, active_app, trajectory=None):
+        self.captured_at = captured_at  # 输入发生的时间
+        self.x = x                      # 全局屏幕坐标（左上角为原点）
+        self.y = y
+        self.active_app = active_app
+        self.trajectory = trajectory    # [(时间, x, y)]，事件前的简化鼠标轨迹
+        self.event_id = None
+        self.timestamp = None           # 记录中的时间，取输入发生的时间
+        self.max_x = None
+        self.max_y = None
+        self.monitor = None
+        self.screenshots_path = None
+        self.frame_hash = None
+        self._line = None
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.action_type}, x={self.x}, y={self.y}, app={self.active_app!r})"
+
+    def _point(self, x, y):
+        """记录中的坐标以左下角为原点，附带屏幕尺寸。"""
+        return {"x": x, "y": self.max_y - y, "max_x": self.max_x, "max_y": self.max_y}
+
+    def _content(self):
+        """action_content 中 position 之后的字段，由子类按原有顺序给出。"""
+        raise NotImplementedError
+
+    def encode(self):
+        """返回 JSONL 行（UTF-8 字节，含换行），只序列化一次。"""
+        if self._line is None:
+            position = _encode(self._point(self.x, self.y))
+            content = self._content()
+            if self.trajectory:
+                # 坐标换算方式与 position 一致，时间为相对事件的毫秒偏移
+                content["trajectory"] = [
+                    [round((t - self.captured_at) * 1000), px, self.max_y - py]
+                    for t, px, py in self.trajectory
+                ]
+            content["monitor"] = self.monitor
+            self._line = (
+                f'{{"event_id": {_encode(self.event_id)}, "timestamp": {_encode(self.timestamp)}, '
+                f'"action_type": {_encode(self.action_type)}, '
+                f'"action_content": {{"position": {position}, {_encode(content)[1:]}, '
+                f'"active_app": {_encode(self.active_app)}, '
+                f'"screenshots_path": {_encode(self.screenshots_path)}, '
+                f'"frame_hash": {_encode(self.frame_hash)}, "mouse_position": {position}}}\n'
+            ).encode('utf-8')
+        return self._line
+
+
+class ClickEvent(RecordedEvent):
+    __slots__ = ('button',)
+    action_type = 'mouse_click'
+
+    def __init__(self, captured_at, x, y, active_app, button, trajectory=None):
+        super().__init__(captured_at, x, y, active_app, trajectory)
+        self.button = button  # 如 "Button.left.press"
+
+    def _content(self):
+        return {"button": self.button, "delta": None, "key": None}
+
+
+class DragEvent(RecordedEvent):
+    __slots__ = ('button', 'start_x', 'start_y', 'started_at')
+    action_type = 'mouse_drag'
+
+    def __init__(self, captured_at, x, y, active_app, button, start_x, start_y, started_at, trajectory=None):
+        super().__init__(captured_at, x, y, active_app, trajectory)
+        self.button = button
+        self.start_x = start_x
+        self.start_y = start_y
+        self.started_at = started_at
+
+    def _content(self):
+        return {
+            "start": self._point(self.start_x, self.start_y),
+            "duration": self.captured_at - self.started_at,
+            "button": self.button,
+            "delta": None,
+            "key": None
+        }
+
+
+class ScrollEvent(RecordedEvent):
+    __slots__ = ('dx', 'dy', 'gesture')
+    action_type = 'mouse_scroll'
+
+    def __init__(self, captured_at, x, y, active_app, dx, dy, gesture=None):
+        super().__init__(captured_at, x, y, active_app)
+        self.dx = dx
+        self.dy = dy
+        self.gesture = gesture  # 方向、持续时间、事件数与速度
+
+    def _content(self):
+        return {"button": None, "delta": {"dx": self.dx, "dy": self.dy}, "gesture": self.gesture, "key": None}
+
+
+class KeyEvent(RecordedEvent):
+    __slots__ = ('key',)
+    action_type = 'key_press'
+
+    def __init__(self, captured_at, x, y, active_app, key):
+        super().__init__(captured_at, x, y, active_app)
+        self.key = key  # 一段连续输入，按键之间以空格分隔
+
+    def _content(self):
+        return {"button": None, "delta": None, "key": self.key}
@@ -0,0 +1,20 @@
+# frame_diff.py
+
+import numpy as np
+
+
+def thumbnail(img, factor=16):
+    """将截图按 factor 倍缩小并转为灰度数组，用于低成本的画面变化检测。"""
+    small = img.reduce(factor) if factor > 1 else img
+    return np.asarray(small.convert('L'), dtype=np.int16)
+
+
+def changed_ratio(previous, current, pixel_threshold=16):
+    """
+    计算两张缩略图中发生明显变化的像素比例（0~1）。
+    尺寸不同（如切换显示器）时视为完全变化。
+    """
+    if previous is None or previous.shape != current.shape:
+        return 1.0
+    changed = np.count_nonzero(np.abs(current - previous) > pixel_threshold)
+    return changed / current.size
@@ -0,0 +1,277 @@
+# frame_encoder.py
+
+import io
+import math
+import time
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from functools import lru_cache
+from PIL import Image, ImageDraw, ImageFont
+from frame_pool import frame_from_ref
+from logger import thread_safe_logging
+from tracing import span, now_us, Tracer
+
+# 一次截图的编码任务。frame 可以是 FrameSlot/HeapFrame（线程模式），
+# 也可以是 FrameRef 或 PIL 图像（进程模式，只传递共享内存描述符，不复制像素）。
+FrameJob = namedtuple('FrameJob', [
+    'frame',
+    'unannotated_path',
+    'annotated_path',
+    'star',            # (x, y) 星形标记位置，None 表示不绘制
+    'text',            # 顶部信息文本，None 表示不绘制
+    'font_path',       # None 表示使用默认字体
+    'quality',
+    'target_size_kb',
+    'scale',           # 编码前的缩放比例，1.0 表示原始分辨率
+    'image_format',    # jpeg 或 png
+    'quality_step',    # 超过目标大小时每次降低的 JPEG 质量，资源受限时加大以减少编码次数
+    'event_id',        # 所属事件编号，用于追踪，None 表示定时截图等无事件的截图
+], defaults=(1.0, 'jpeg', 5, None))
+
+
+def encode_jpeg(img, target_size_kb=500, quality=95, step=5):
+    """
+    在内存中将图片编码为 JPEG，每次降低 step 质量直到小于 target_size_kb。
+    返回 (编码后的字节, 实际使用的质量)。
+    """
+    if img.mode not in ('RGB', 'RGBX'):
+        img = img.convert('RGB')  # 确保图像为RGB模式以保存为JPEG
+    while True:
+        buffer = io.BytesIO()
+        img.save(buffer, 'JPEG', quality=quality)
+        data = buffer.getvalue()
+        if len(data) / 1024 <= target_size_kb or quality < 10:
+            return data, quality
+        quality -= step
+
+
+def draw_star(draw, x, y, radius_outer, radius_inner, color_star):
+    """在截图上绘制一个五角星，用于标记鼠标位置。"""
+    num_points = 5
+    points = []
+    for i in range(num_points):
+        angle = math.radians(i * 144)
+        x_outer = x + radius_outer * math.cos(angle)
+        y_outer = y - radius_outer * math.sin(angle)
+        points.append((x_outer, y_outer))
+
+        angle = math.radians(i * 144 + 72)
+        x_inner = x + radius_inner * math.cos(angle)
+        y_inner = y - radius_inner * math.sin(angle)
+        points.append((x_inner, y_inner))
+
+    draw.polygon(points, fill=color_star)
+
+
+def encode_image(img, image_format='jpeg', target_size_kb=500, quality=95, step=5):
+    """按格式编码。PNG 为无损格式，适合文字为主的画面，返回的质量沿用传入值。"""
+    if image_format == 'png':
+        buffer = io.BytesIO()
+        if img.mode == 'RGBX':
+            img = img.convert('RGB')  # 帧缓冲池中的帧为 RGBX，PNG 不支持该模式
+        img.save(buffer, 'PNG', compress_level=6)
+        return buffer.getvalue(), quality
+    return encode_jpeg(img, target_size_kb, quality, step)
+
+
+@lru_cache(maxsize=4)
+def load_font(font_path, size=100):
+    """按路径加载字体并在每个进程内缓存。"""
+    if font_path:
+        try:
+            return ImageFont.truetype(font_path, size)
+        except IOError as e:
+            thread_safe_logging('warning', f"加载字体失败: {font_path}, 错误: {e}")
+    return ImageFont.load_default()
+
+
+def _resolve_image(frame):
+    if hasattr(frame, 'shm_name'):
+        return frame_from_ref(frame)
+    if hasattr(frame, 'image'):
+        return frame.image()
+    return frame
+
+
+def annotate_frame(img, star, job):
+    """在截图上绘制星形标记与顶部信息文本，返回新的 RGB 图像。"""
+    # 带信息的截图只复制一次整帧，半透明背景只在文本区域内合成
+    annotated = img.convert('RGB')
+    draw = ImageDraw.Draw(annotated)
+    if star is not None:
+        draw_star(draw, star[0], star[1], radius_outer=60, radius_inner=20, color_star=(255, 0, 0))
+
+    if job.text:
+        font = load_font(job.font_path)
+        bbox = draw.textbbox((0, 0), job.text, font=font)
+        text_width = bbox[2] - bbox[0]
+        text_height = bbox[3] - bbox[1]
+
+        # 文本位置：顶部居中
+        y_offset = 50
+        position = ((annotated.width - text_width) / 2, y_offset)
+
+        box = (
+            max(0, int(position[0] - 10)),
+            max(0, int(position[1] - 10)),
+            min(annotated.width, int(math.ceil(position[0] + text_width + 10)) + 1),
+            min(annotated.height, int(math.ceil(position[1] + text_height + 10)) + 1),
+        )
+        if box[2] > box[0] and box[3] > box[1]:
+            patch = annotated.crop(box).convert('RGBA')
+            overlay = Image.new('RGBA', patch.size, (0, 0, 0, 128))  # 半透明黑色
+            annotated.paste(Image.alpha_composite(patch, overlay).convert('RGB'), box[:2])
+        draw.text(position, job.text, font=font, fill=(255, 255, 255))
+    return annotated
+
+
+def render_frame(job):
+    """
+    绘制标注并编码一帧截图，返回 [(文件路径, 编码后的字节, 质量), ...]。
+    该函数只做像素处理，不写磁盘，可在线程或子进程中执行。
+    """
+    img = _resolve_image(job.frame)
+    outputs = []
+    star = job.star
+    if job.scale < 1.0:
+        img = img.resize((max(1, int(img.width * job.scale)), max(1, int(img.height * job.scale))),
+                         Image.BILINEAR)
+        if star is not None:
+            star = (star[0] * job.scale, star[1] * job.scale)
+
+    # 不带信息的截图直接从共享内存编码，无需复制；
+    # unannotated_path 为 None 表示存储中已有相同画面，无需再次编码
+    if job.unannotated_path is not None:
+        with span('encode', 'encoder', job.event_id):
+            data, quality = encode_image(img, job.image_format, job.target_size_kb, job.quality, job.quality_step)
+        outputs.append((job.unannotated_path, data, quality))
+
+    # annotated_path 为 None 表示该应用的规则不保存带信息的截图
+    if job.annotated_path is None:
+        return outputs
+
+    with span('annotate', 'encoder', job.event_id):
+        annotated = annotate_frame(img, star, job)
+
+    with span('encode_annotated', 'encoder', job.event_id):
+        data, quality = encode_image(annotated, job.image_format, job.target_size_kb, job.quality, job.quality_step)
+    outputs.append((job.annotated_path, data, quality))
+    return outputs
+
+
+class FrameEncoder:
+    """
+    截图编码工作池。标注与 JPEG 编码在后台线程或子进程中完成，
+    完成后在回调中把编码结果交给存储层写盘。workers 为 0 时同步编码。
+    set_limits 由资源调控调用：线程模式下限制同时编码的数量，并按 CPU 份额在每帧编码后休眠
+    （占空比控制）；进程模式下只调整编码次数，优先级由 initializer 降低。
+    """
+
+    def __init__(self, workers=2, use_processes=False, initializer=None, initargs=()):
+        self.workers = workers
+        self.use_processes = use_processes and workers > 0
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+        self.pending = 0
+        self.gate = threading.Condition()
+        self.active = 0
+        self.max_active = workers
+        self.cpu_share = 0
+        self.quality_step = 5
+        if workers <= 0:
+            self.executor = None
+        elif self.use_processes:
+            self.executor = ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs)
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='frame-encoder',
+                                               initializer=initializer, initargs=initargs)
+        thread_safe_logging('info', f"截图编码池已启动: workers={workers}, 进程模式={self.use_processes}")
+
+    def set_limits(self, max_active=0, cpu_share=0, quality_step=5):
+        """max_active 为 0 时不限制并发；cpu_share 为编码线程合计允许占用单核的比例，0 表示不限制。"""
+        with self.gate:
+            self.max_active = max_active if max_active > 0 else self.workers
+            self.cpu_share = cpu_share
+            self.quality_step = quality_step
+            self.gate.notify_all()
+
+    def _run(self, job):
+        """线程模式的编码入口：按并发上限排队，编码后按 CPU 份额休眠。"""
+        with self.gate:
+            self.gate.wait_for(lambda: self.active < self.max_active)
+            self.active += 1
+        started = time.thread_time()
+        try:
+            return render_frame(job)
+        finally:
+            share = self.cpu_share
+            if 0 < share < 1:
+                # 占空比：编码耗费 t 秒 CPU 后休眠 t * (1/share - 1) 秒，平均占用不超过 share
+                time.sleep((time.thread_time() - started) * (1 / share - 1))
+            with self.gate:
+                self.active -= 1
+                self.gate.notify()
+
+    def submit(self, job, on_done):
+        """
+        提交编码任务。on_done(outputs, error) 在编码完成后调用，
+        调用方持有的帧引用需在 on_done 中释放。
+        """
+        with self.lock:
+            self.pending += 1
+        if Tracer._instance is not None and Tracer._instance.enabled:
+            # 从提交到写盘完成的整段时间，包括排队等待；进程模式下子进程内的区间不回传
+            submitted, event_id, callback = now_us(), job.event_id, on_done
+
+            def on_done(outputs, error):
+                try:
+                    callback(outputs, error)
+                finally:
+                    Tracer._instance.record('frame_job', 'encoder', submitted, event_id)
+        if self.quality_step != job.quality_step:
+            job = job._replace(quality_step=self.quality_step)
+
+        if self.executor is None:
+            try:
+                outputs, error = render_frame(job), None
+            except Exception as e:
+                outputs, error = None, e
+            self._finish(on_done, outputs, error)
+            return
+
+        if self.use_processes:
+            frame = job.frame
+            # 子进程只接收共享内存描述符；普通帧退回为传递图像本身
+            job = job._replace(frame=frame.ref if frame.ref is not None else frame.image())
+
+        future = self.executor.submit(render_frame if self.use_processes else self._run, job)
+        future.add_done_callback(lambda f: self._finish(
+            on_done,
+            None if f.exception() else f.result(),
+            f.exception()
+        ))
+
+    def _finish(self, on_done, outputs, error):
+        try:
+            on_done(outputs, error)
+        except Exception as e:
+            thread_safe_logging('error', f"处理编码结果时出错: {e}")
+        finally:
+            with self.lock:
+                self.pending -= 1
+                if self.pending == 0:
+                    self.idle.notify_all()
+
+    def queued(self):
+        with self.lock:
+            return self.pending
+
+    def wait_idle(self, timeout=None):
+        """等待所有已提交的截图编码并写盘完成。"""
+        with self.lock:
+            return self.idle.wait_for(lambda: self.pending == 0, timeout)
+
+    def shutdown(self, wait=True):
+        if self.executor is not None:
+            self.executor.shutdown(wait=wait)
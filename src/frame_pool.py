@@ -0,0 +1,198 @@
+# frame_pool.py
+
+import threading
+from collections import deque, namedtuple
+from multiprocessing import shared_memory
+import numpy as np
+from PIL import Image
+from logger import thread_safe_logging
+
+# 帧在共享内存中统一使用 RGBX 布局（每像素 4 字节），
+# 这样 Image.frombuffer 可以直接映射内存而不复制，JPEG 编码器也能直接读取。
+FRAME_MODE = 'RGBX'
+BYTES_PER_PIXEL = 4
+
+# 可跨进程传递的帧描述符，只包含共享内存名称和尺寸，不包含像素数据
+FrameRef = namedtuple('FrameRef', ['shm_name', 'width', 'height'])
+
+# 工作进程中已附加的共享内存段缓存：名称 -> SharedMemory
+_attached_segments = {}
+
+
+def frame_from_ref(ref):
+    """在任意进程中根据 FrameRef 获得只读的零拷贝图像视图。"""
+    shm = _attached_segments.get(ref.shm_name)
+    if shm is None:
+        shm = shared_memory.SharedMemory(name=ref.shm_name)
+        _attached_segments[ref.shm_name] = shm
+    nbytes = ref.width * ref.height * BYTES_PER_PIXEL
+    return Image.frombuffer(FRAME_MODE, (ref.width, ref.height), shm.buf[:nbytes], 'raw', FRAME_MODE, 0, 1)
+
+
+def _copy_bgrx(data, stride, width, height, target):
+    """把原生截屏缓冲（BGRX，每行 stride 字节）逐通道写入 RGBX 目标内存，不创建中间图像。"""
+    src = np.frombuffer(data, np.uint8, count=stride * height).reshape(height, stride // 4, 4)[:, :width]
+    dst = np.frombuffer(target, np.uint8, count=width * height * BYTES_PER_PIXEL).reshape(height, width, 4)
+    dst[..., 0] = src[..., 2]
+    dst[..., 1] = src[..., 1]
+    dst[..., 2] = src[..., 0]
+    dst[..., 3] = 255  # 与 PIL 的 RGB -> RGBX 一致，保证相同画面的像素哈希相同
+
+
+def _raw_bytes(img):
+    """将 PIL 图像打包为 RGBX 原始字节（RGBA 的 alpha 通道直接作为填充字节）。"""
+    if img.mode in ('RGB', 'RGBX'):
+        return img.tobytes('raw', 'RGBX')
+    if img.mode == 'RGBA':
+        return img.tobytes('raw', 'RGBA')
+    return img.convert('RGB').tobytes('raw', 'RGBX')
+
+
+class HeapFrame:
+    """共享内存池耗尽或尺寸不匹配时使用的普通堆内存帧，接口与 FrameSlot 一致。"""
+
+    def __init__(self, img):
+        self._img = img
+        self.width, self.height = img.size
+        self.ref = None
+        self.monitor = None
+
+    def image(self):
+        return self._img
+
+    def pixels(self):
+        return _raw_bytes(self._img)
+
+    def retain(self):
+        return self
+
+    def release(self):
+        pass
+
+
+class FrameSlot:
+    """共享内存池中的一个帧缓冲，使用引用计数管理生命周期。"""
+
+    def __init__(self, pool, index, width, height):
+        self.pool = pool
+        self.index = index
+        self.width = width
+        self.height = height
+        self.ref = FrameRef(pool.segments[index].name, width, height)
+        self.monitor = None  # 只截取单个显示器时记录该显示器
+
+    def image(self):
+        """返回映射到共享内存的只读图像，不复制像素。"""
+        nbytes = self.width * self.height * BYTES_PER_PIXEL
+        buf = self.pool.segments[self.index].buf[:nbytes]
+        return Image.frombuffer(FRAME_MODE, (self.width, self.height), buf, 'raw', FRAME_MODE, 0, 1)
+
+    def pixels(self):
+        """返回共享内存中的原始像素视图（RGBX），用于计算内容哈希。"""
+        return self.pool.segments[self.index].buf[:self.width * self.height * BYTES_PER_PIXEL]
+
+    def retain(self):
+        self.pool._retain(self.index)
+        return self
+
+    def release(self):
+        self.pool._release(self.index)
+
+
+class FramePool:
+    """
+    共享内存帧缓冲池。
+    截图写入空闲槽位，编码线程或编码进程通过 FrameRef 直接读取同一块内存，
+    引用计数归零后槽位回到空闲队列，避免每帧重新分配整幅图像。
+    槽位按需创建，最多 slots 个，常驻内存只取决于同时在用的帧数。
+    """
+
+    def __init__(self, slots=8):
+        self.slot_count = slots
+        self.lock = threading.Lock()
+        self.segments = []
+        self.refcounts = []
+        self.free = deque()
+        self.slot_bytes = 0
+
+    def _acquire(self, nbytes):
+        """
+        取得一个空闲槽位并置引用计数为 1，没有可用槽位时返回 None。
+        空闲队列为空时新建槽位；更大的帧在池全部空闲时按新尺寸重建（槽位再按需创建）。
+        """
+        with self.lock:
+            if nbytes > self.slot_bytes and len(self.free) == len(self.segments):
+                self._close_segments()
+                self.refcounts = []
+                self.free.clear()
+                self.slot_bytes = nbytes
+            if nbytes > self.slot_bytes:
+                return None
+            if not self.free and len(self.segments) < self.slot_count:
+                self.segments.append(shared_memory.SharedMemory(create=True, size=self.slot_bytes))
+                self.refcounts.append(0)
+                self.free.append(len(self.segments) - 1)
+                thread_safe_logging('info', f"帧缓冲池新建槽位 {len(self.segments)}/{self.slot_count}，"
+                                            f"每个 {self.slot_bytes / (1024 * 1024):.2f}MB")
+            if not self.free:
+                return None
+            index = self.free.popleft()
+            self.refcounts[index] = 1
+            return index
+
+    def store(self, img):
+        """将 PIL 截图写入空闲槽位，返回引用计数为 1 的帧；无法入池时退回普通帧。"""
+        width, height = img.size
+        nbytes = width * height * BYTES_PER_PIXEL
+        index = self._acquire(nbytes)
+        if index is None:
+            thread_safe_logging('warning', "帧缓冲池无可用槽位，使用普通内存保存截图")
+            return HeapFrame(img)
+        self.segments[index].buf[:nbytes] = _raw_bytes(img)
+        return FrameSlot(self, index, width, height)
+
+    def store_raw(self, width, height, data, stride):
+        """
+        将原生截屏缓冲（BGRX）直接写入空闲槽位，不经过 PIL 图像与 tobytes 的两次整幅分配。
+        data 只需在调用期间有效；无法入池时复制为普通帧。
+        """
+        index = self._acquire(width * height * BYTES_PER_PIXEL)
+        if index is None:
+            thread_safe_logging('warning', "帧缓冲池无可用槽位，使用普通内存保存截图")
+            return HeapFrame(Image.frombuffer('RGB', (width, height), data, 'raw', 'BGRX', stride, 1))
+        try:
+            _copy_bgrx(data, stride, width, height, self.segments[index].buf)
+        except Exception:
+            self._release(index)
+            raise
+        return FrameSlot(self, index, width, height)
+
+    def _retain(self, index):
+        with self.lock:
+            self.refcounts[index] += 1
+
+    def _release(self, index):
+        with self.lock:
+            self.refcounts[index] -= 1
+            if self.refcounts[index] == 0:
+                self.free.append(index)
+
+    def in_use(self):
+        with self.lock:
+            return len(self.segments) - len(self.free)
+
+    def _close_segments(self):
+        for shm in self.segments:
+            try:
+                shm.unlink()
+                shm.close()
+            except (BufferError, FileNotFoundError) as e:
+                # 仍有图像视图引用该内存时无法立即关闭，名称已解除链接，进程退出时自动回收
+                thread_safe_logging('warning', f"释放共享内存失败: {shm.name}, 错误: {e}")
+        self.segments = []
+
+    def close(self):
+        with self.lock:
+            self._close_segments()
+            self.free.clear()
+            self.slot_bytes = 0
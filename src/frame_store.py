@@ -0,0 +1,175 @@
+# frame_store.py
+
+import os
+import json
+import shutil
+import hashlib
+import threading
+import time
+from logger import thread_safe_logging
+
+FRAME_STORE_DIR = '.frames'            # records 目录下的共享截图存储
+UPLOADED_INDEX_FILE = 'uploaded.idx'   # 已上传的截图哈希，每行一个
+FRAME_INDEX_FILE = 'frames_index.json' # 打包时写入会话：截图路径 -> 哈希
+ARCHIVE_FRAMES_DIR = 'frames'          # 归档内随会话上传的截图目录
+
+
+def pixel_hash(frame):
+    """按像素内容计算截图哈希；相同画面在不同会话中得到相同的哈希。"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{frame.width}x{frame.height}:".encode('ascii'))
+    digest.update(frame.pixels())
+    return digest.hexdigest()
+
+
+class FrameStore:
+    """
+    按像素哈希寻址的截图存储，跨会话共享。
+    - 相同画面只编码、只存储一份，会话中的原路径以硬链接指向存储中的文件；
+    - 记录已上传的哈希，打包时只附带尚未上传过的截图。
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+        self.uploaded = set()
+        self._load_uploaded()
+
+    def _load_uploaded(self):
+        try:
+            with open(os.path.join(self.root, UPLOADED_INDEX_FILE), 'r', encoding='utf-8') as f:
+                self.uploaded = {line.strip() for line in f if line.strip()}
+        except FileNotFoundError:
+            self.uploaded = set()
+
+    def blob_path(self, digest):
+        return os.path.join(self.root, digest[:2], digest + '.jpg')
+
+    def has(self, digest):
+        """存储中是否已有该画面；命中时刷新修改时间，避免被回收。"""
+        path = self.blob_path(digest)
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def put(self, digest, data):
+        """写入截图，返回是否为新增（已存在时不重复写入）。"""
+        path = self.blob_path(digest)
+        if os.path.exists(path):
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return True
+
+    def link(self, digest, filepath):
+        """在会话中的原路径建立指向存储的视图，无法硬链接时复制文件。"""
+        source = self.blob_path(digest)
+        if os.path.exists(filepath):
+            return
+        try:
+            os.link(source, filepath)
+        except OSError:
+            shutil.copyfile(source, filepath)
+
+    def size(self, digest):
+        return os.path.getsize(self.blob_path(digest))
+
+    # ---------- 上传 ----------
+    def is_uploaded(self, digest):
+        with self.lock:
+            return digest in self.uploaded
+
+    def mark_uploaded(self, digests):
+        new = [d for d in digests if d not in self.uploaded]
+        if not new:
+            return
+        with self.lock:
+            self.uploaded.update(new)
+            with open(os.path.join(self.root, UPLOADED_INDEX_FILE), 'a', encoding='utf-8') as f:
+                f.write(''.join(d + '\n' for d in new))
+
+    def prepare_session(self, session_folder, frame_hashes):
+        """
+        打包前调用：写入会话的截图索引，把尚未上传的截图链接到会话的 frames/ 目录。
+        返回 (归档文件列表中需追加的相对路径, 本次附带的哈希列表)。
+        """
+        with open(os.path.join(session_folder, FRAME_INDEX_FILE), 'w', encoding='utf-8') as f:
+            json.dump(frame_hashes, f, ensure_ascii=False)
+        frames_dir = os.path.join(session_folder, ARCHIVE_FRAMES_DIR)
+        os.makedirs(frames_dir, exist_ok=True)
+        extra = [FRAME_INDEX_FILE]
+        attached = []
+        for digest in sorted(set(frame_hashes.values())):
+            if self.is_uploaded(digest):
+                continue
+            target = os.path.join(frames_dir, digest + '.jpg')
+            try:
+                self.link(digest, target)
+            except FileNotFoundError:
+                thread_safe_logging('warning', f"存储中缺少截图，无法附带: {digest}")
+                continue
+            extra.append(os.path.join(ARCHIVE_FRAMES_DIR, digest + '.jpg'))
+            attached.append(digest)
+        return extra, attached
+
+    # ---------- 回收 ----------
+    def collect_garbage(self, retention_days):
+        """
+        删除超过保留期限未被引用的截图，返回回收的字节数。
+        仍有会话硬链接指向的截图删除后并不释放磁盘空间，保留到会话被回收、链接数降为 1 之后再删除，
+        以免配额少计实际占用。
+        """
+        cutoff = time.time() - retention_days * 86400
+        freed = 0
+        for root, _, files in os.walk(self.root):
+            for name in files:
+                if not name.endswith('.jpg'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                    if stat.st_mtime < cutoff and stat.st_nlink <= 1:
+                        os.remove(path)
+                        freed += stat.st_size
+                except OSError:
+                    continue
+        if freed:
+            thread_safe_logging('info', f"已回收过期截图 {freed / (1024 * 1024):.2f}MB")
+        return freed
+
+
+def materialize_frames(session_folder, blob_root):
+    """
+    下游还原会话：根据 frames_index.json 把截图放回原路径，保持 screenshots_path 可用。
+    会话附带的截图先移入共享的 blob_root，之前会话已上传的截图也从这里获取。
+    返回缺失的截图数。
+    """
+    index_path = os.path.join(session_folder, FRAME_INDEX_FILE)
+    if not os.path.exists(index_path):
+        return 0
+    store = FrameStore(blob_root)
+    frames_dir = os.path.join(session_folder, ARCHIVE_FRAMES_DIR)
+    if os.path.isdir(frames_dir):
+        for name in os.listdir(frames_dir):
+            digest = name[:-len('.jpg')]
+            target = store.blob_path(digest)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(os.path.join(frames_dir, name), target)
+        os.rmdir(frames_dir)
+    with open(index_path, 'r', encoding='utf-8') as f:
+        frame_hashes = json.load(f)
+    missing = 0
+    for rel, digest in frame_hashes.items():
+        path = os.path.join(session_folder, *rel.replace('\\', '/').split('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            store.link(digest, path)
+        except FileNotFoundError:
+            missing += 1
+    return missing
@@ -0,0 +1,194 @@
+# governor.py
+
+import os
+import sys
+import time
+import threading
+from collections import namedtuple
+import psutil
+from logger import thread_safe_logging
+
+# 资源限制状态，由调控线程定期计算并推送给订阅者
+GovernorState = namedtuple('GovernorState', [
+    'throttled',       # 是否处于限制模式
+    'on_battery',
+    'system_percent',  # 系统整体 CPU 占用（%）
+    'own_percent',     # 本进程及其子进程的 CPU 占用（单核 %）
+    'cpu_share',       # 后台工作允许占用单核的比例，0 表示不限制
+    'encoder_workers', # 允许同时编码的截图数，0 表示不限制
+    'quality_step',    # JPEG 逐步降质的步长，越大编码次数越少
+    'bandwidth_kbps',  # 上传带宽上限，0 表示不限制
+])
+
+
+QOS_CLASS_UTILITY = 0x11             # macOS pthread/qos.h
+THREAD_PRIORITY_BELOW_NORMAL = -1    # Windows winbase.h
+
+
+def _lower_thread_darwin():
+    """macOS 线程没有独立的 nice 值，用 QoS 把当前线程归为 utility 类（后台长任务）。"""
+    import ctypes
+    libc = ctypes.CDLL('/usr/lib/libSystem.dylib')
+    libc.pthread_set_qos_class_self_np.argtypes = [ctypes.c_uint, ctypes.c_int]
+    result = libc.pthread_set_qos_class_self_np(QOS_CLASS_UTILITY, 0)
+    if result != 0:
+        raise OSError(result, "pthread_set_qos_class_self_np 失败")
+
+
+def _lower_thread_windows():
+    import ctypes
+    kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+    kernel32.GetCurrentThread.restype = ctypes.c_void_p
+    kernel32.SetThreadPriority.argtypes = [ctypes.c_void_p, ctypes.c_int]
+    if not kernel32.SetThreadPriority(kernel32.GetCurrentThread(), THREAD_PRIORITY_BELOW_NORMAL):
+        raise ctypes.WinError(ctypes.get_last_error())
+
+
+def lower_priority(nice=10):
+    """
+    降低当前工作线程或当前进程（子进程工作池）的调度优先级，
+    用作线程池 / 进程池的 initializer。
+    """
+    if nice <= 0:
+        return
+    try:
+        if threading.current_thread() is not threading.main_thread():
+            if sys.platform.startswith('linux'):
+                # Linux 上线程有独立的 nice 值，只影响该工作线程
+                os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), nice)
+            elif sys.platform == 'darwin':
+                _lower_thread_darwin()
+            elif sys.platform == 'win32':
+                _lower_thread_windows()
+        else:
+            # 子进程工作池的主线程：降低整个子进程
+            process = psutil.Process()
+            if sys.platform == 'win32':
+                process.nice(psutil.BELOW_NORMAL_PRIORITY_CLASS)
+            else:
+                process.nice(nice)
+    except Exception as e:
+        thread_safe_logging('debug', f"降低工作优先级失败: {e}")
+
+
+class ResourceGovernor:
+    """
+    录制期间的资源调控。定期采样电源状态、系统 CPU 占用和本进程（含编码子进程）的 CPU 占用：
+    使用电池或系统繁忙时进入限制模式，把截图编码的并发、编码次数与 CPU 占空比，
+    以及上传带宽限制到配置的份额，减少风扇噪音与耗电。
+    """
+
+    def __init__(self, config=None):
+        self.lock = threading.Lock()
+        self.subscribers = []
+        self.process = psutil.Process()
+        self.thread = None
+        self.stop_event = threading.Event()
+        self._last_cpu = None
+        self.state = None
+        self.configure(config)
+
+    def configure(self, config=None):
+        config = config or {}
+        self.enabled = config.get('enabled', True)
+        self.interval = config.get('interval', 2.0)
+        self.battery_cpu_share = config.get('battery_cpu_share', 0.15)
+        self.ac_cpu_share = config.get('ac_cpu_share', 0)
+        self.busy_system_percent = config.get('busy_system_percent', 85)
+        self.throttled_workers = config.get('throttled_workers', 1)
+        self.throttled_quality_step = config.get('throttled_quality_step', 15)
+        self.battery_bandwidth_kbps = config.get('battery_bandwidth_kbps', 256)
+        self.nice = config.get('nice', 10)
+        if self.state is not None:
+            self.update()
+
+    def subscribe(self, callback):
+        """callback(state) 在状态变化时于调控线程中调用。"""
+        with self.lock:
+            self.subscribers.append(callback)
+
+    # ---------- 采样 ----------
+    @staticmethod
+    def _on_battery():
+        try:
+            battery = psutil.sensors_battery()
+        except Exception:
+            return False
+        return battery is not None and not battery.power_plugged
+
+    def _own_cpu_seconds(self):
+        """本进程与子进程（编码进程、输入监听进程）累计的 CPU 时间。"""
+        total = 0.0
+        processes = [self.process]
+        try:
+            processes += self.process.children(recursive=True)
+        except Exception:
+            pass
+        for process in processes:
+            try:
+                times = process.cpu_times()
+                total += times.user + times.system
+            except Exception:
+                continue  # 子进程可能已退出
+        return total
+
+    def _own_percent(self):
+        now = time.monotonic()
+        cpu = self._own_cpu_seconds()
+        last, self._last_cpu = self._last_cpu, (now, cpu)
+        if last is None or now <= last[0]:
+            return 0.0
+        return max(0.0, (cpu - last[1]) / (now - last[0]) * 100)
+
+    def sample(self):
+        """采样一次并计算新的限制状态。"""
+        on_battery = self._on_battery()
+        try:
+            system_percent = psutil.cpu_percent(interval=None)
+        except Exception:
+            system_percent = 0.0
+        own_percent = self._own_percent()
+        busy = system_percent >= self.busy_system_percent
+        throttled = self.enabled and (on_battery or busy)
+        if throttled:
+            return GovernorState(True, on_battery, system_percent, own_percent, self.battery_cpu_share,
+                                 self.throttled_workers, self.throttled_quality_step,
+                                 self.battery_bandwidth_kbps)
+        return GovernorState(False, on_battery, system_percent, own_percent,
+                             self.ac_cpu_share if self.enabled else 0, 0, 5, 0)
+
+    def update(self):
+        state = self.sample()
+        previous, self.state = self.state, state
+        if previous is not None and previous[:2] == state[:2] and previous[4:] == state[4:]:
+            return state  # 只有占用数字变化，不必通知
+        if previous is None or previous.throttled != state.throttled:
+            reason = '电池供电' if state.on_battery else f"系统 CPU {state.system_percent:.0f}%"
+            thread_safe_logging('info', f"资源调控: {'进入限制模式（' + reason + '）' if state.throttled else '恢复正常模式'}，"
+                                        f"CPU 份额 {state.cpu_share:.0%}，本进程 CPU {state.own_percent:.0f}%")
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for callback in subscribers:
+            try:
+                callback(state)
+            except Exception as e:
+                thread_safe_logging('error', f"应用资源限制时出错: {e}")
+        return state
+
+    # ---------- 线程 ----------
+    def start(self):
+        if self.thread is not None:
+            return
+        self.update()
+        self.thread = threading.Thread(target=self._run, name='resource-governor', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.update()
+            except Exception as e:
+                thread_safe_logging('error', f"资源调控采样失败: {e}")
+
+    def stop(self):
+        self.stop_event.set()
@@ -0,0 +1,184 @@
+# input_process.py
+
+import threading
+import time
+import multiprocessing
+from collections import deque
+from logger import thread_safe_logging
+
+# 子进程发送给主进程的消息：(类型, 时间戳, 参数元组)
+MOVE = 'move'
+CLICK = 'click'
+SCROLL = 'scroll'
+PRESS = 'press'
+STATS = 'stats'
+
+
+def _listener_main(conn, stop_event, stats_interval, max_pending):
+    """
+    输入监听子进程入口。回调只记录时间戳并追加到本地队列（不做任何其他处理），
+    由子进程主循环批量写入管道，主进程繁忙时回调也不会被阻塞。
+    """
+    from pynput import mouse, keyboard
+
+    pending = deque(maxlen=max_pending)
+    wakeup = threading.Event()
+    stats = {'events': 0, 'total_us': 0.0, 'max_us': 0.0, 'dropped': 0}
+    stats_lock = threading.Lock()
+
+    def record(kind, *args):
+        start = time.perf_counter()
+        full = len(pending) == pending.maxlen
+        pending.append((kind, time.time(), args))
+        wakeup.set()
+        elapsed = (time.perf_counter() - start) * 1e6
+        with stats_lock:
+            stats['dropped'] += full
+            stats['events'] += 1
+            stats['total_us'] += elapsed
+            stats['max_us'] = max(stats['max_us'], elapsed)
+
+    mouse_listener = mouse.Listener(
+        on_move=lambda x, y: record(MOVE, x, y),
+        on_click=lambda x, y, button, pressed: record(CLICK, x, y, button, pressed),
+        on_scroll=lambda x, y, dx, dy: record(SCROLL, x, y, dx, dy),
+    )
+    keyboard_listener = keyboard.Listener(on_press=lambda key: record(PRESS, key))
+    mouse_listener.start()
+    keyboard_listener.start()
+
+    last_stats = time.time()
+    try:
+        while not stop_event.is_set():
+            if not (mouse_listener.is_alive() and keyboard_listener.is_alive()):
+                break  # 监听线程异常退出（如缺少辅助功能权限），退出子进程由主进程处理
+            wakeup.wait(0.05)
+            wakeup.clear()
+            batch = []
+            while pending:
+                batch.append(pending.popleft())
+            now = time.time()
+            if now - last_stats >= stats_interval:
+                with stats_lock:
+                    snapshot = dict(stats)
+                    stats.update(events=0, total_us=0.0, max_us=0.0, dropped=0)
+                batch.append((STATS, now, (snapshot,)))
+                last_stats = now
+            if batch:
+                conn.send(batch)
+    except (BrokenPipeError, EOFError, OSError):
+        pass  # 主进程已退出
+    finally:
+        mouse_listener.stop()
+        keyboard_listener.stop()
+        conn.close()
+
+
+class InputProcess:
+    """
+    在独立子进程中运行 pynput 监听器。
+    子进程只负责打时间戳和转发原始事件，截图、编码、上传与界面都不会拖慢系统事件回调
+    （macOS 在回调过慢时会禁用事件监听）。主进程的分发线程按顺序调用 handlers[类型](时间戳, *参数)。
+    录制中子进程意外退出时自动重启，超过 max_restarts 次后调用 on_failure()，由调用方改用进程内监听。
+    """
+
+    def __init__(self, handlers, stats_interval=10.0, max_pending=100000, on_failure=None, max_restarts=3):
+        self.handlers = handlers
+        self.stats_interval = stats_interval
+        self.max_pending = max_pending
+        self.on_failure = on_failure
+        self.max_restarts = max_restarts
+        self.restarts = 0
+        self.process = None
+        self.stop_event = None
+        self.reader = None
+        self.stats = {}
+        self._max_delivery = 0.0
+
+    def start(self):
+        ctx = multiprocessing.get_context('spawn')
+        receiver, sender = ctx.Pipe(duplex=False)
+        self.stop_event = ctx.Event()
+        self.process = ctx.Process(
+            target=_listener_main,
+            args=(sender, self.stop_event, self.stats_interval, self.max_pending),
+            name='input-listener',
+            daemon=True
+        )
+        self.process.start()
+        sender.close()
+        self.reader = threading.Thread(target=self._read_loop, args=(receiver,), name='input-dispatch', daemon=True)
+        self.reader.start()
+        thread_safe_logging('info', f"输入监听子进程已启动: pid={self.process.pid}")
+
+    def _read_loop(self, conn):
+        while True:
+            try:
+                batch = conn.recv()
+            except (EOFError, OSError):
+                break
+            for kind, t, args in batch:
+                if kind == STATS:
+                    self._report(args[0])
+                    continue
+                self._max_delivery = max(self._max_delivery, time.time() - t)
+                handler = self.handlers.get(kind)
+                if handler is None:
+                    continue
+                try:
+                    handler(t, *args)
+                except Exception as e:
+                    thread_safe_logging('error', f"处理输入事件出错: {kind}, 错误: {e}")
+        conn.close()
+        if self.stop_event.is_set():
+            thread_safe_logging('info', "输入监听子进程的事件管道已关闭")
+            return
+        self._on_exit()
+
+    def _on_exit(self):
+        """录制中管道关闭：子进程崩溃、被系统结束或监听器无法运行，不能静默丢失输入。"""
+        process = self.process
+        if process is not None:
+            process.join(1.0)
+        exitcode = process.exitcode if process is not None else None
+        if self.restarts < self.max_restarts:
+            self.restarts += 1
+            thread_safe_logging('error', f"输入监听子进程意外退出（exitcode={exitcode}），"
+                                         f"第 {self.restarts} 次重启")
+            try:
+                self.start()
+                return
+            except Exception as e:
+                thread_safe_logging('error', f"重启输入监听子进程失败: {e}")
+        thread_safe_logging('error', f"输入监听子进程意外退出（exitcode={exitcode}），不再重启")
+        self.process = None
+        if self.on_failure is not None:
+            self.on_failure()
+
+    def _report(self, child_stats):
+        events = child_stats['events']
+        self.stats = {
+            'events': events,
+            'callback_avg_us': child_stats['total_us'] / events if events else 0.0,
+            'callback_max_us': child_stats['max_us'],
+            'dropped': child_stats['dropped'],
+            'delivery_max_ms': self._max_delivery * 1000,
+        }
+        self._max_delivery = 0.0
+        level = 'warning' if child_stats['dropped'] else 'debug'
+        thread_safe_logging(level, f"输入监听: {events} 个事件，回调平均 {self.stats['callback_avg_us']:.1f}us，"
+                                   f"最大 {self.stats['callback_max_us']:.1f}us，"
+                                   f"分发最大延迟 {self.stats['delivery_max_ms']:.1f}ms，丢弃 {child_stats['dropped']} 个")
+
+    def stop(self, timeout=2.0):
+        if self.process is None:
+            return
+        self.stop_event.set()
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(timeout)
+        if self.reader is not None:
+            self.reader.join(timeout)
+        self.process = None
+        thread_safe_logging('info', "输入监听子进程已停止")
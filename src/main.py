@@ -1,10 +1,14 @@
 import sys
+import multiprocessing
 from PyQt5 import QtWidgets
 from ui import MainWindow
 from logger import setup_logging, thread_safe_logging
 from config import Config
 
 def main():
+    # 打包后的程序启动子进程（输入监听、截图编码）时需要
+    multiprocessing.freeze_support()
+
     # 设置日志
     setup_logging()
     thread_safe_logging('info', "日志系统已初始化。")
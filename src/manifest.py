@@ -0,0 +1,156 @@
+# manifest.py
+
+import os
+import json
+import hashlib
+import threading
+from logger import thread_safe_logging
+
+MANIFEST_FILE = 'manifest.jsonl'
+
+
+def sha256_hex(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class SessionManifest:
+    """
+    会话完整性清单，只追加写入。
+    截图和事件日志在写盘时用内存中刚生成的字节计算 SHA-256，不需要再读一遍文件：
+    - add：一次写完的文件（截图、事件汇总），记录 {path, size, sha256, event_id}；
+    - append：逐行追加的事件日志与截图段文件，每段记录 {path, offset, size, sha256, event_id}
+      （段文件中的截图另带 member，即截图路径），同时累积整个文件的哈希，seal 时写出整文件记录。
+    清单随会话一起打包，打包时用来校验文件，服务端也可用来校验或跳过重复内容。
+    """
+
+    def __init__(self, session_folder):
+        self.folder = session_folder
+        self.path = os.path.join(session_folder, MANIFEST_FILE)
+        self.lock = threading.Lock()
+        self.running = {}  # 追加写入的文件：相对路径 -> [整文件哈希对象, 已写入字节数]
+        self._fh = open(self.path, 'a', encoding='utf-8')
+
+    def _relative(self, filepath):
+        return os.path.relpath(filepath, self.folder).replace(os.sep, '/')
+
+    def _write(self, record):
+        line = json.dumps(record, ensure_ascii=False, separators=(',', ':'))
+        if self._fh.closed:
+            return
+        self._fh.write(line + '\n')
+        self._fh.flush()
+
+    def add(self, filepath, data, event_id=None):
+        """登记一个一次写完的文件。"""
+        record = {"path": self._relative(filepath), "size": len(data), "sha256": sha256_hex(data)}
+        if event_id is not None:
+            record["event_id"] = event_id
+        with self.lock:
+            self._write(record)
+
+    def append(self, filepath, data, event_id=None, member=None):
+        """登记追加到文件末尾的一段数据。member 为写入段文件的截图路径。"""
+        rel = self._relative(filepath)
+        chunk_hash = sha256_hex(data)
+        with self.lock:
+            state = self.running.setdefault(rel, [hashlib.sha256(), 0])
+            record = {"path": rel, "offset": state[1], "size": len(data), "sha256": chunk_hash}
+            if member is not None:
+                record["member"] = self._relative(member)
+            if event_id is not None:
+                record["event_id"] = event_id
+            state[0].update(data)
+            state[1] += len(data)
+            self._write(record)
+
+    def seal(self):
+        """会话结束时为追加写入的文件写出整文件记录。"""
+        with self.lock:
+            for rel, (digest, size) in self.running.items():
+                self._write({"path": rel, "size": size, "sha256": digest.hexdigest()})
+            self.running = {}
+
+    def close(self):
+        with self.lock:
+            if not self._fh.closed:
+                self._fh.close()
+
+    # ---------- 校验 ----------
+    @staticmethod
+    def load(session_folder):
+        """
+        读取清单，返回 相对路径 -> 记录。整文件记录为 {size, sha256}；
+        只有分段记录的文件（会话被中断、未 seal）为 {chunks: [(offset, size, sha256), ...]}。
+        """
+        entries = {}
+        try:
+            with open(os.path.join(session_folder, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # 进程被杀时可能残缺的最后一行
+                    path = record.get('path')
+                    if 'offset' in record:
+                        entry = entries.setdefault(path, {})
+                        entry.setdefault('chunks', []).append(
+                            (record['offset'], record['size'], record['sha256']))
+                    else:
+                        entries[path] = {"size": record['size'], "sha256": record['sha256']}
+        except FileNotFoundError:
+            pass
+        return entries
+
+
+class ManifestVerifier:
+    """打包时用清单校验读入内存的文件内容，复用打包本身的读取，不额外读盘。"""
+
+    def __init__(self, session_folder):
+        self.folder = session_folder
+        self.entries = SessionManifest.load(session_folder)
+        self.verified = 0
+        self.unlisted = 0
+        self.mismatched = []
+
+    def check(self, rel, data):
+        """校验一个文件，返回 True/False；清单中没有记录时返回 None。"""
+        entry = self.entries.get(rel.replace(os.sep, '/'))
+        if entry is None:
+            self.unlisted += 1
+            return None
+        if 'sha256' in entry:
+            ok = entry['size'] == len(data) and entry['sha256'] == sha256_hex(data)
+        else:
+            # 未 seal 的追加文件逐段校验，最后一段之后可能残缺的数据不参与校验
+            view = memoryview(data)
+            ok = all(offset + size <= len(data) and sha256_hex(view[offset:offset + size]) == digest
+                     for offset, size, digest in entry['chunks'])
+        if ok:
+            self.verified += 1
+        else:
+            self.mismatched.append(rel)
+            thread_safe_logging('error', f"文件内容与完整性清单不一致: {rel}")
+        return ok
+
+    def report(self):
+        level = 'error' if self.mismatched else 'info'
+        thread_safe_logging(level, f"完整性校验: 通过 {self.verified} 个，不一致 {len(self.mismatched)} 个，"
+                                   f"未登记 {self.unlisted} 个")
+        return not self.mismatched
+
+
+def verify_folder(session_folder):
+    """离线校验解压后的会话文件夹（解密工具使用），返回不一致或缺失的文件列表。"""
+    verifier = ManifestVerifier(session_folder)
+    problems = []
+    for rel in verifier.entries:
+        path = os.path.join(session_folder, rel)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            problems.append(rel)
+            continue
+        if verifier.check(rel, data) is False:
+            problems.append(rel)
+    return problems
@@ -0,0 +1,194 @@
+# packstore.py
+#
+# 会话截图的打包存储：编码后的截图依次追加到少量大段文件中，偏移量记录在紧凑的二进制索引里，
+# 打包上传时只需处理几个大文件。需要散文件时可以导出：
+#
+#     python packstore.py <会话目录> [--remove]
+#
+# <会话目录> 可以是 records/ 或解密工具的输出目录，会递归查找包含 screenshots/packs 的会话，
+# 把其中的截图还原到 screenshots/original、screenshots/annotated 下的原路径。
+
+import os
+import sys
+import struct
+import argparse
+import threading
+from logger import thread_safe_logging
+
+PACK_DIR = os.path.join('screenshots', 'packs')   # 相对于会话文件夹
+PACK_INDEX_FILE = 'index.bin'
+SEGMENT_FORMAT = 'segment_{:05d}.pack'
+
+# 索引记录：段号、段内偏移、长度、名称长度，后接 UTF-8 名称（相对于会话文件夹的截图路径）
+INDEX_RECORD = struct.Struct('<HQIH')
+
+
+def _member_name(rel):
+    return rel.replace('\\', '/')
+
+
+class PackWriter:
+    """
+    追加写入的截图段文件。先写数据再写索引，进程被杀时索引中只会缺少最后几条记录，
+    已写入的索引始终指向完整的数据。
+    """
+
+    def __init__(self, session_folder, segment_bytes=64 * 1024 * 1024, on_new_file=None):
+        self.folder = session_folder
+        self.root = os.path.join(session_folder, PACK_DIR)
+        self.segment_bytes = segment_bytes
+        self.on_new_file = on_new_file  # on_new_file(路径)：新建段或索引文件时调用，用于登记到会话日志
+        self.lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+        self.index = open(os.path.join(self.root, PACK_INDEX_FILE), 'ab')
+        self._notify(self.index.name)
+        self.segment_id = self._last_segment()
+        self.segment = None
+        self.segment_size = 0
+
+    def _notify(self, path):
+        if self.on_new_file is not None:
+            self.on_new_file(path)
+
+    def _last_segment(self):
+        ids = [int(name[8:13]) for name in os.listdir(self.root)
+               if name.startswith('segment_') and name.endswith('.pack')]
+        return max(ids) if ids else 0
+
+    def _open_segment(self):
+        path = os.path.join(self.root, SEGMENT_FORMAT.format(self.segment_id))
+        self.segment = open(path, 'ab')
+        self.segment_size = self.segment.tell()
+        self._notify(path)
+
+    def append(self, filepath, data, on_written=None):
+        """
+        追加一张截图，filepath 为截图在会话中的（虚拟）路径，返回 (段文件路径, 偏移)。
+        on_written(段文件路径, 偏移) 在写入锁内调用，完整性清单据此按写入顺序登记分段。
+        """
+        name = _member_name(os.path.relpath(filepath, self.folder)).encode('utf-8')
+        with self.lock:
+            if self.segment is None:
+                self._open_segment()
+            elif self.segment_size + len(data) > self.segment_bytes and self.segment_size > 0:
+                self.segment.close()
+                self.segment_id += 1
+                self._open_segment()
+            offset = self.segment_size
+            self.segment.write(data)
+            self.segment.flush()
+            self.segment_size += len(data)
+            self.index.write(INDEX_RECORD.pack(self.segment_id, offset, len(data), len(name)) + name)
+            self.index.flush()
+            if on_written is not None:
+                on_written(self.segment.name, offset)
+            return self.segment.name, offset
+
+    def close(self):
+        with self.lock:
+            if self.segment is not None:
+                self.segment.close()
+                self.segment = None
+            self.index.close()
+
+
+class PackReader:
+    """按截图路径读取段文件中的截图。"""
+
+    def __init__(self, session_folder):
+        self.folder = session_folder
+        self.root = os.path.join(session_folder, PACK_DIR)
+        self.members = {}  # 截图路径 -> (段号, 偏移, 长度)
+        self._segments = {}
+        try:
+            with open(os.path.join(self.root, PACK_INDEX_FILE), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return
+        pos = 0
+        while pos + INDEX_RECORD.size <= len(data):
+            segment, offset, size, name_len = INDEX_RECORD.unpack_from(data, pos)
+            pos += INDEX_RECORD.size
+            if pos + name_len > len(data):
+                break  # 残缺的最后一条记录
+            name = data[pos:pos + name_len].decode('utf-8')
+            pos += name_len
+            self.members[name] = (segment, offset, size)
+
+    def __contains__(self, rel):
+        return _member_name(rel) in self.members
+
+    def names(self):
+        return list(self.members)
+
+    def read(self, rel):
+        """读取截图字节，不存在时返回 None。"""
+        entry = self.members.get(_member_name(rel))
+        if entry is None:
+            return None
+        segment, offset, size = entry
+        f = self._segments.get(segment)
+        if f is None:
+            f = self._segments[segment] = open(os.path.join(self.root, SEGMENT_FORMAT.format(segment)), 'rb')
+        f.seek(offset)
+        data = f.read(size)
+        return data if len(data) == size else None
+
+    def close(self):
+        for f in self._segments.values():
+            f.close()
+        self._segments = {}
+
+
+def read_screenshot(session_folder, rel, reader=None):
+    """读取会话中的截图：散文件优先，其次从段文件读取。rel 为相对于会话文件夹的路径。"""
+    path = os.path.join(session_folder, rel)
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            return f.read()
+    reader = reader or PackReader(session_folder)
+    return reader.read(rel)
+
+
+def export_loose(session_folder, remove=False):
+    """把段文件中的截图导出为原路径下的散文件，返回导出的数量。remove 为 True 时导出后删除段文件。"""
+    reader = PackReader(session_folder)
+    count = 0
+    try:
+        for name in reader.names():
+            data = reader.read(name)
+            if data is None:
+                thread_safe_logging('warning', f"段文件中的截图不完整，跳过: {name}")
+                continue
+            path = os.path.join(session_folder, *name.split('/'))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(data)
+            count += 1
+    finally:
+        reader.close()
+    if remove and count == len(reader.members):
+        import shutil
+        shutil.rmtree(reader.root, ignore_errors=True)
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="把会话段文件中的截图导出为散文件")
+    parser.add_argument('input_dir', help="会话所在目录，递归查找")
+    parser.add_argument('--remove', action='store_true', help="全部导出后删除段文件")
+    args = parser.parse_args(argv)
+
+    total = 0
+    for root, dirs, names in os.walk(args.input_dir):
+        if os.path.basename(root) == 'packs' and PACK_INDEX_FILE in names:
+            session_folder = os.path.dirname(os.path.dirname(root))
+            count = export_loose(session_folder, args.remove)
+            print(f"{session_folder}: 导出 {count} 张截图")
+            total += count
+    print(f"完成: 共导出 {total} 张截图")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+# periodic_capture.py
+
+import threading
+from PyQt5 import QtCore
+from frame_diff import thumbnail, changed_ratio
+from config import ConfigService
+from logger import thread_safe_logging
+
+
+class PeriodicCaptureThread(QtCore.QThread):
+    """
+    后台定时截屏线程。
+    每次截屏先与上一次保存的画面做缩略图比较，变化超过阈值才保存；
+    画面变化时缩短间隔，静止时逐步退避，GUI 线程不参与截屏和编码。
+    """
+
+    def __init__(self, storage_manager, interval=20, config=None):
+        super().__init__()
+        self.storage_manager = storage_manager
+        self.configure(config)
+        self.interval = min(max(interval, self.min_interval), self.max_interval)
+        self.stop_event = threading.Event()
+        self.last_thumbnail = None
+        ConfigService().subscribe(
+            lambda service, changed: self.configure(service.section('periodic_capture'))
+        )
+
+    def configure(self, config=None):
+        """应用定时截屏参数，运行中修改配置时也会调用，下一次截屏即生效。"""
+        config = config or {}
+        self.min_interval = config.get('min_interval', 2)
+        self.max_interval = config.get('max_interval', 60)
+        self.backoff = config.get('backoff', 1.5)
+        self.change_threshold = config.get('change_threshold', 0.01)
+        self.downsample = config.get('downsample', 16)
+        if hasattr(self, 'interval'):
+            self.interval = min(max(self.interval, self.min_interval), self.max_interval)
+
+    def run(self):
+        thread_safe_logging('info', f"定时截屏线程已启动，初始间隔 {self.interval:.1f} 秒")
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.capture_once()
+            except Exception as e:
+                thread_safe_logging('error', f"定时截屏失败: {e}")
+        thread_safe_logging('info', "定时截屏线程已停止")
+
+    def capture_once(self):
+        """截屏一次，仅在画面变化超过阈值时保存，并据此调整下一次的间隔。"""
+        # 按当前前台应用选择截图规则，切换到跳过截图的应用后不再定时截屏
+        active_app = self.storage_manager.current_app()
+        frame = self.storage_manager.capture_frame(active_app=active_app)
+        if frame is None:
+            thread_safe_logging('debug', "当前应用的截图规则不允许截图，跳过定时截屏")
+            return
+        try:
+            current = thumbnail(frame.image(), self.downsample)
+            ratio = changed_ratio(self.last_thumbnail, current)
+            if ratio >= self.change_threshold:
+                self.storage_manager.save_screenshot(screenshot=frame, active_app=active_app)
+                self.last_thumbnail = current
+                self.interval = self.min_interval
+                thread_safe_logging('info', f"画面变化 {ratio:.2%}，已保存定时截图")
+            else:
+                self.interval = min(self.interval * self.backoff, self.max_interval)
+                thread_safe_logging('debug', f"画面变化 {ratio:.2%}，跳过保存，下次间隔 {self.interval:.1f} 秒")
+        finally:
+            frame.release()
+
+    def stop(self):
+        self.stop_event.set()
+        self.wait()
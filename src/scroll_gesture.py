@@ -0,0 +1,119 @@
+# scroll_gesture.py
+
+import threading
+
+
+class ScrollGesture:
+    """一次连续的滚动手势：起点位置、累计位移、持续时间与事件数。"""
+
+    __slots__ = ('x', 'y', 'start_time', 'last_time', 'dx', 'dy', 'ticks', 'frame', 'active_app')
+
+    def __init__(self, x, y, t):
+        self.x = x
+        self.y = y
+        self.start_time = t
+        self.last_time = t
+        self.dx = 0
+        self.dy = 0
+        self.ticks = 0
+        self.frame = None  # 手势开始前的截图
+        self.active_app = None  # 手势开始时的前台应用
+
+    def add(self, dx, dy, t):
+        self.dx += dx
+        self.dy += dy
+        self.ticks += 1
+        self.last_time = t
+
+    @property
+    def duration(self):
+        return self.last_time - self.start_time
+
+    @property
+    def direction(self):
+        if abs(self.dy) >= abs(self.dx):
+            return "up" if self.dy > 0 else "down"
+        return "right" if self.dx > 0 else "left"
+
+    def summary(self):
+        """手势统计，写入事件内容。速度单位为滚动量/秒。"""
+        duration = self.duration
+        return {
+            "direction": self.direction,
+            "duration": round(duration, 3),
+            "ticks": self.ticks,
+            "velocity": {
+                "dx": round(self.dx / duration, 2) if duration > 0 else 0.0,
+                "dy": round(self.dy / duration, 2) if duration > 0 else 0.0
+            }
+        }
+
+
+class ScrollAccumulator:
+    """
+    滚动事件累积器。触控板的滚动事件可达每秒上百次，每次只做加法与比较，不调用系统接口；
+    以下情况结束当前手势并开始新手势：
+    - 主方向上反向滚动；
+    - 滚动位置离手势起点超过 move_threshold（由滚动事件自带的坐标判断）；
+    - 距上一次滚动超过 idle_timeout。
+    """
+
+    def __init__(self, idle_timeout=2.0, move_threshold=20):
+        self.lock = threading.Lock()
+        self.idle_timeout = idle_timeout
+        self.move_threshold = move_threshold
+        self.current = None
+
+    def configure(self, idle_timeout=None, move_threshold=None):
+        if idle_timeout is not None:
+            self.idle_timeout = idle_timeout
+        if move_threshold is not None:
+            self.move_threshold = move_threshold
+
+    def _breaks(self, gesture, x, y, dx, dy, t):
+        if t - gesture.last_time > self.idle_timeout:
+            return True
+        if abs(x - gesture.x) > self.move_threshold or abs(y - gesture.y) > self.move_threshold:
+            return True
+        if abs(gesture.dy) >= abs(gesture.dx):
+            return gesture.dy * dy < 0
+        return gesture.dx * dx < 0
+
+    def feed(self, x, y, dx, dy, t):
+        """
+        登记一次滚动。返回 (结束的手势或 None, 新开始的手势或 None)；
+        调用方为新手势截取手势前的画面，并为结束的手势生成事件。
+        """
+        if dx == 0 and dy == 0:
+            return None, None
+        with self.lock:
+            finished = None
+            started = None
+            if self.current is not None and self._breaks(self.current, x, y, dx, dy, t):
+                finished, self.current = self.current, None
+            if self.current is None:
+                self.current = started = ScrollGesture(x, y, t)
+            self.current.add(dx, dy, t)
+            return finished, started
+
+    def attach_frame(self, gesture, frame):
+        """为手势附加手势前的截图；手势已被其他线程结束时返回 False，由调用方释放截图。"""
+        with self.lock:
+            if gesture is not self.current:
+                return False
+            gesture.frame = frame
+            return True
+
+    def expire(self, now):
+        """空闲超时后结束当前手势（由监控线程定期调用）。"""
+        with self.lock:
+            if self.current is not None and now - self.current.last_time > self.idle_timeout:
+                finished, self.current = self.current, None
+                return finished
+        return None
+
+    def flush(self):
+        """立即结束当前手势，点击、按键或停止录制前调用。"""
+        with self.lock:
+            finished, self.current = self.current, None
+            return finished
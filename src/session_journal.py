@@ -0,0 +1,157 @@
+# session_journal.py
+
+import os
+import json
+import threading
+import time
+from logger import thread_safe_logging
+
+JOURNAL_FILE = 'journal.wal'
+
+# 打包上传阶段，按顺序推进
+STAGE_CLOSED = 'closed'        # 记录已正常结束，所有事件与截图已落盘
+STAGE_ZIPPED = 'zipped'
+STAGE_ENCRYPTED = 'encrypted'
+STAGE_SPOOLED = 'spooled'      # 归档已移入上传队列，后续上传与清理由队列负责
+STAGE_UPLOADED = 'uploaded'
+STAGE_DONE = 'done'
+
+
+class JournalState:
+    """重放日志得到的会话状态。"""
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.files = []           # 会话内已写入文件的相对路径（按写入顺序）
+        self.frame_hashes = {}    # 存入共享截图存储的截图：相对路径 -> 像素哈希
+        self.frame_count = 0
+        self.event_count = 0
+        self.last_event_id = 0
+        self.stages = {}          # 阶段名 -> 附加信息
+
+    @property
+    def completed(self):
+        return STAGE_DONE in self.stages or STAGE_SPOOLED in self.stages or STAGE_UPLOADED in self.stages
+
+
+class SessionJournal:
+    """
+    会话预写日志。每次截图写盘、事件追加和打包上传进度都追加一行记录，
+    程序被强制结束后，只需重放该文件即可恢复打包与上传，无需重新扫描会话中的所有文件。
+    """
+
+    def __init__(self, session_folder):
+        self.folder = session_folder
+        self.path = os.path.join(session_folder, JOURNAL_FILE)
+        self.lock = threading.Lock()
+        self.files = []
+        self.frame_hashes = {}
+        self._known_files = set()
+        self._fh = open(self.path, 'a', encoding='utf-8')
+
+    def _append(self, record, sync=False):
+        line = json.dumps(record, ensure_ascii=False, separators=(',', ':'))
+        with self.lock:
+            if self._fh.closed:
+                return
+            self._fh.write(line + '\n')
+            self._fh.flush()
+            if sync:
+                os.fsync(self._fh.fileno())
+
+    def _relative(self, filepath):
+        return os.path.relpath(filepath, self.folder)
+
+    def frame(self, filepath, size, digest=None, packed=False):
+        """
+        记录一帧截图已写盘；digest 为截图在共享存储中的像素哈希。
+        packed 表示截图写入了段文件，段文件另行以 file 记录，截图路径不进入打包列表。
+        """
+        rel = self._relative(filepath)
+        record = {"t": "frame", "path": rel, "size": size}
+        with self.lock:
+            if packed:
+                record["pack"] = 1
+            else:
+                self.files.append(rel)
+            if digest is not None:
+                self.frame_hashes[rel] = digest
+                record["hash"] = digest
+        self._append(record)
+
+    def file(self, filepath):
+        """记录会话内的其他文件（事件日志等），同一文件只记录一次。"""
+        rel = self._relative(filepath)
+        with self.lock:
+            if rel in self._known_files:
+                return
+            self._known_files.add(rel)
+            self.files.append(rel)
+        self._append({"t": "file", "path": rel})
+
+    def event(self, event_id):
+        self._append({"t": "event", "id": event_id})
+
+    def stage(self, name, **info):
+        """记录打包上传阶段完成，立即同步到磁盘。"""
+        record = {"t": "stage", "stage": name, "time": time.time()}
+        record.update(info)
+        self._append(record, sync=True)
+
+    def close(self):
+        with self.lock:
+            if not self._fh.closed:
+                self._fh.close()
+
+    # ---------- 恢复 ----------
+    @staticmethod
+    def replay(session_folder):
+        """重放会话日志，日志不存在时返回 None；进程被杀时可能残缺的最后一行会被忽略。"""
+        path = os.path.join(session_folder, JOURNAL_FILE)
+        if not os.path.exists(path):
+            return None
+        state = JournalState(session_folder)
+        known_files = set()
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                kind = record.get('t')
+                if kind == 'frame':
+                    if not record.get('pack'):
+                        state.files.append(record['path'])
+                    state.frame_count += 1
+                    if 'hash' in record:
+                        state.frame_hashes[record['path']] = record['hash']
+                elif kind == 'file':
+                    if record['path'] not in known_files:
+                        known_files.add(record['path'])
+                        state.files.append(record['path'])
+                elif kind == 'event':
+                    state.event_count += 1
+                    state.last_event_id = max(state.last_event_id, record.get('id', 0))
+                elif kind == 'stage':
+                    state.stages[record['stage']] = record
+        return state
+
+    @staticmethod
+    def find_interrupted(records_path, exclude=None):
+        """返回 records 目录中未完成上传的会话状态列表。"""
+        interrupted = []
+        try:
+            entries = [entry for entry in os.scandir(records_path) if entry.is_dir()]
+        except FileNotFoundError:
+            return interrupted
+        for entry in sorted(entries, key=lambda e: e.name):
+            if entry.name == exclude or entry.name.startswith('.'):
+                continue
+            try:
+                state = SessionJournal.replay(entry.path)
+            except Exception as e:
+                thread_safe_logging('error', f"读取会话日志失败: {entry.path}, 错误: {e}")
+                continue
+            if state is not None and not state.completed:
+                interrupted.append(state)
+        return interrupted
@@ -0,0 +1,141 @@
+# settle.py
+
+import os
+import json
+import time
+import queue
+import threading
+from frame_diff import thumbnail, changed_ratio
+from capture_profiles import MODE_SKIP
+from logger import thread_safe_logging
+
+SETTLED_LOG_FILE = 'settled_frames.jsonl'  # 会话 log 目录下，事件编号 -> 操作后稳定画面
+
+
+class SettleCapture:
+    """
+    操作后的稳定画面截图。事件记录完成后登记到队列，由独立的截图线程处理，不阻塞输入回调：
+    等待 min_delay 后按 poll_interval 截屏并比较缩略图，连续 stable_polls 次变化低于阈值即视为画面稳定，
+    超时或下一个事件到来时使用最后一帧。每个事件只保存一张截图，
+    与事件编号、稳定耗时一起追加到 log/settled_frames.jsonl。
+    """
+
+    def __init__(self, storage_manager, config=None):
+        self.storage_manager = storage_manager
+        self.queue = queue.Queue()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.log_file = None
+        self.configure(config)
+
+    def configure(self, config=None):
+        """应用稳定截图参数，运行中修改配置时也会调用。"""
+        config = config or {}
+        self.enabled = config.get('enabled', False)
+        self.min_delay = config.get('min_delay', 0.1)
+        self.poll_interval = config.get('poll_interval', 0.1)
+        self.timeout = config.get('timeout', 2.0)
+        self.stable_polls = config.get('stable_polls', 2)
+        self.change_threshold = config.get('change_threshold', 0.002)
+        self.downsample = config.get('downsample', 16)
+
+    def watch(self, event):
+        """登记一个已记录的事件（events.py 中的事件对象），立即返回。"""
+        if not self.enabled or self.stop_event.is_set():
+            return
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name='settle-capture', daemon=True)
+            self.thread.start()
+        self.queue.put((event.event_id, event.active_app, event.x, event.y, event.captured_at))
+
+    def _run(self):
+        while True:
+            request = self.queue.get()
+            if request is None:
+                break
+            try:
+                self._settle(*request)
+            except Exception as e:
+                thread_safe_logging('error', f"操作后截图失败: 事件 {request[0]}, 错误: {e}")
+
+    def _interrupted(self):
+        """下一个事件已到来或正在停止：不再等待，使用当前画面。"""
+        return not self.queue.empty() or self.stop_event.is_set()
+
+    def _settle(self, event_id, active_app, x, y, acted_at):
+        """
+        acted_at 为输入发生的时间，稳定耗时与超时都从这里算起。
+        操作可能切换了前台应用，开始轮询与保存前都重新查询，切换到跳过截图的应用时放弃本次截图。
+        """
+        storage = self.storage_manager
+        if storage.profiles.resolve(active_app).mode == MODE_SKIP:
+            return
+        delay = acted_at + self.min_delay - time.time()
+        if delay > 0 and not self._interrupted():
+            self.stop_event.wait(delay)
+        active_app = storage.current_app()
+        if storage.profiles.resolve(active_app).mode == MODE_SKIP:
+            return
+
+        frame = None
+        previous = None
+        stable = polls = 0
+        reason = 'timeout'
+        try:
+            while True:
+                # 轮询截图不受应用帧率上限限制，只保存最终的一帧
+                current = storage.capture_frame(x, y, active_app, admit=False)
+                polls += 1
+                if frame is not None:
+                    frame.release()
+                frame = current
+                small = thumbnail(frame.image(), self.downsample)
+                if previous is not None and changed_ratio(previous, small) < self.change_threshold:
+                    stable += 1
+                    if stable >= self.stable_polls:
+                        reason = 'settled'
+                        break
+                else:
+                    stable = 0
+                previous = small
+                if self._interrupted():
+                    reason = 'interrupted'
+                    break
+                if time.time() - acted_at >= self.timeout:
+                    break
+                time.sleep(self.poll_interval)
+
+            settle_ms = round((time.time() - acted_at) * 1000)
+            active_app = storage.current_app()
+            path = storage.save_screenshot(screenshot=frame, active_app=active_app, event_id=event_id,
+                                           annotate=False)
+        finally:
+            if frame is not None:
+                frame.release()
+        if not path or not path.endswith(('.jpg', '.png')):
+            return  # 规则不允许截图、磁盘配额拒绝或截图失败
+        self._record(event_id, path, settle_ms, reason, polls)
+
+    def _record(self, event_id, path, settle_ms, reason, polls):
+        storage = self.storage_manager
+        if self.log_file is None:
+            self.log_file = os.path.join(storage.getLogPath(), SETTLED_LOG_FILE)
+        record = {
+            "event_id": event_id,
+            "screenshots_path": path,  # 与事件中的 screenshots_path 格式相同
+            "settle_ms": settle_ms,
+            "reason": reason,   # settled / timeout / interrupted
+            "polls": polls
+        }
+        line = (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+        with open(self.log_file, 'ab') as f:
+            f.write(line)
+        storage.journal_append(self.log_file, line, event_id)
+        thread_safe_logging('debug', f"事件 {event_id} 的操作后画面: {reason}，{settle_ms}ms，截图 {polls} 次")
+
+    def stop(self, timeout=None):
+        """停止截图线程，正在等待的事件立即使用当前画面。"""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join(timeout)
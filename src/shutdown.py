@@ -0,0 +1,90 @@
+# shutdown.py
+
+import time
+import threading
+from collections import namedtuple
+
+# 结束会话的阶段，按顺序推进
+STAGE_STOPPING = 'stopping'      # 停止录制，等待截图写盘
+STAGE_ARCHIVING = 'archiving'    # 打包会话文件（单位：文件）
+STAGE_ENCRYPTING = 'encrypting'  # 加密归档（单位：字节）
+STAGE_UPLOADING = 'uploading'    # 上传归档（单位：字节）
+STAGE_DONE = 'done'              # 上传完成
+STAGE_DEFERRED = 'deferred'      # 已取消或上传未成功，归档与进度保存在本地，下次启动后继续
+STAGE_FAILED = 'failed'
+
+FINAL_STAGES = (STAGE_DONE, STAGE_DEFERRED, STAGE_FAILED)
+
+STAGE_LABELS = {
+    STAGE_STOPPING: '正在停止录制',
+    STAGE_ARCHIVING: '正在打包',
+    STAGE_ENCRYPTING: '正在加密',
+    STAGE_UPLOADING: '正在上传',
+    STAGE_DONE: '上传完成',
+    STAGE_DEFERRED: '已保存到本地，下次启动时继续上传',
+    STAGE_FAILED: '处理失败',
+}
+
+# 界面轮询得到的进度快照。eta 为当前阶段的剩余秒数，无法估计时为 None
+ShutdownStatus = namedtuple('ShutdownStatus', ['stage', 'done', 'total', 'eta', 'cancelled'])
+
+
+class ShutdownCancelled(Exception):
+    """用户取消了结束流程，已完成的阶段记录在会话日志中，下次启动时继续。"""
+
+
+class ShutdownProgress:
+    """
+    结束会话时各阶段的进度，由后台线程推进、界面线程定时读取快照，不经过 Qt 信号。
+    打包、加密与上传的循环调用 advance 登记进度，并通过 check 响应取消。
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cancel_event = threading.Event()
+        self.stage = STAGE_STOPPING
+        self.done = 0
+        self.total = 0
+        self.started = time.monotonic()
+
+    def begin(self, stage, total=0):
+        with self.lock:
+            self.stage = stage
+            self.done = 0
+            self.total = total
+            self.started = time.monotonic()
+
+    def advance(self, amount=1):
+        with self.lock:
+            self.done += amount
+
+    def update(self, done):
+        with self.lock:
+            self.done = done
+
+    def finish(self, stage):
+        with self.lock:
+            self.stage = stage
+
+    # ---------- 取消 ----------
+    def cancel(self):
+        self.cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def check(self):
+        """在可中断的位置调用，已取消时抛出 ShutdownCancelled。"""
+        if self.cancel_event.is_set():
+            raise ShutdownCancelled()
+
+    # ---------- 快照 ----------
+    def snapshot(self):
+        with self.lock:
+            stage, done, total, started = self.stage, self.done, self.total, self.started
+        eta = None
+        elapsed = time.monotonic() - started
+        if 0 < done < total and elapsed > 0.5:
+            eta = (total - done) * elapsed / done
+        return ShutdownStatus(stage, done, total, eta, self.cancelled)
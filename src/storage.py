@@ -5,9 +5,9 @@ import sys
 import zipfile
 from datetime import datetime
 from logger import thread_safe_logging
-import pyautogui
-from PIL import Image, ImageDraw, ImageFont
-import math
+from PIL import Image, ImageFont
+import time
+import threading
 import platform
 import string  # 引入 string 模块用于字符过滤
 from frozen_dir import app_path
@@ -15,7 +15,23 @@ from PIL import Image as PILImage
 from Crypto.Cipher import AES
 from Crypto.Util.Padding import pad
 from modelscope.hub.api import HubApi
-import json
+from storage_budget import StorageBudget
+from frame_pool import FramePool, HeapFrame
+from frame_encoder import FrameEncoder, FrameJob, encode_jpeg
+from frame_encoder import draw_star as _draw_star
+from display import DisplayGeometry
+from config import ConfigService
+from chunked_archive import ChunkedArchiveWriter
+from frame_store import FrameStore, FRAME_STORE_DIR, pixel_hash
+from session_journal import SessionJournal, STAGE_CLOSED, STAGE_ZIPPED, STAGE_ENCRYPTED, STAGE_SPOOLED, STAGE_UPLOADED
+from upload_spool import UploadSpool, ThrottledReader, SPOOL_DIR
+from capture import create_backend, PyAutoGUIBackend
+from governor import ResourceGovernor, lower_priority
+from capture_profiles import CaptureProfiles, MODE_MONITOR, MODE_FULL, MODE_SKIP, UNKNOWN_APP
+from manifest import SessionManifest, ManifestVerifier
+from packstore import PackWriter
+from tracing import Tracer, span, traced, TRACE_FILE, TRACE_DIR
+from shutdown import ShutdownCancelled, STAGE_STOPPING, STAGE_ARCHIVING, STAGE_ENCRYPTING, STAGE_UPLOADING
 
 def resource_path(relative_path):
     if getattr(sys, 'frozen', False):      # 是否Bundle Resource
@@ -24,22 +40,18 @@ def resource_path(relative_path):
         base_path = os.path.abspath(".")
     return os.path.join(base_path, relative_path)
 
+@traced('compress_image', 'encoder')
 def compress_image(input_path, output_path, target_size_kb=500):
     """
     压缩图片到指定大小（KB），确保压缩后的图片小于 target_size_kb。
     使用逐步降低质量的方法进行压缩。
     """
     try:
-        img = Image.open(input_path)
-        img = img.convert('RGB')  # 确保图像为RGB模式以保存为JPEG
-        quality = 95
-
-        while True:
-            img.save(output_path, 'JPEG', quality=quality)
-            size_kb = os.path.getsize(output_path) / 1024
-            if size_kb <= target_size_kb or quality < 10:
-                break
-            quality -= 5
+        with Image.open(input_path) as img:
+            data, quality = encode_jpeg(img, target_size_kb)
+        with open(output_path, 'wb') as f:
+            f.write(data)
+        size_kb = len(data) / 1024
         thread_safe_logging('info', f"压缩图片: {output_path}，大小: {size_kb:.2f}KB，质量: {quality}")
     except Exception as e:
         thread_safe_logging('error', f"压缩图片失败: {input_path}, 错误: {e}")
@@ -62,7 +74,7 @@ class StorageManager:
         # 获取基础路径
         base_path = app_path()
         thread_safe_logging('info', f"StorageManager初始化 - 基础路径: {base_path}")
-        self.config = self.load_config()
+        self.config_service = ConfigService()
 
         # 初始化变量，但不立即创建文件夹
         self.base_path = base_path
@@ -71,6 +83,33 @@ class StorageManager:
         self.original_path = None
         self.annotated_path = None
         self.log_path = None
+        self.journal = None
+        self.manifest = None
+        self.pack = None  # frame_storage 为 pack 时本会话的截图段文件
+        self.pack_lock = threading.Lock()
+        self.upload_watchers = {}  # 队列条目编号 -> 结束流程的进度，上传时按字节推进
+        self.upload_state = 'idle'  # idle / packaging / queued / uploading / uploaded / failed，供界面显示
+        self.foreground_app = None  # 查询前台应用名称的函数，由 ActionRecorder 设置
+
+        # 磁盘配额：按会话增量统计占用，并在启动时回收旧会话
+        self.budget = StorageBudget(os.path.join(base_path, "records"), self.config_service.section('storage_budget'))
+
+        # 跨会话共享的截图存储：相同画面只编码、存储和上传一次
+        self.frame_store = FrameStore(os.path.join(base_path, "records", FRAME_STORE_DIR))
+        self.frame_hashes = {}  # 本会话截图相对路径 -> 像素哈希
+
+        # 资源调控：电池供电或系统繁忙时限制截图编码与上传，工作线程以较低优先级运行
+        self.governor = ResourceGovernor(self.config_service.section('governor'))
+
+        # 可选的流水线追踪：各环节的起止时间写成 Chrome trace，用于分析单个事件的延迟
+        self.tracer = Tracer(self.config_service.section('tracing'))
+
+        # 持久化上传队列：打包好的归档在后台限速上传，失败后重试，重启后继续
+        self.spool = UploadSpool(
+            os.path.join(base_path, "records"), self._upload_spooled, self._on_spool_uploaded,
+            self.config_service.section('upload')
+        )
+        self.spool.start(lower_priority, (self.governor.nice,))
 
         # 定义不可打印字符到组合键的映射（针对macOS的Command键）
         self.unicode_key_map = {
@@ -120,12 +159,14 @@ class StorageManager:
         system = platform.system()
         font_paths = common_fonts.get(system)
         self.font = None
+        self.font_path = None  # 编码进程按路径重新加载字体
 
         if system == "Darwin" and isinstance(font_paths, list):
             for path in font_paths:
                 if os.path.exists(path):
                     try:
                         self.font = ImageFont.truetype(path, 100)  # 设置字体大小为100
+                        self.font_path = path
                         thread_safe_logging('info', f"已加载字体: {path}，字体大小: 100")
                         break
                     except IOError as e:
@@ -141,6 +182,7 @@ class StorageManager:
                     if os.path.exists(path):
                         try:
                             self.font = ImageFont.truetype(path, 100)
+                            self.font_path = path
                             thread_safe_logging('info', f"已加载字体: {path}，字体大小: 100")
                             break
                         except IOError as e:
@@ -155,6 +197,7 @@ class StorageManager:
                 if font_path and os.path.exists(font_path):
                     try:
                         self.font = ImageFont.truetype(font_path, 100)
+                        self.font_path = font_path
                         thread_safe_logging('info', f"已加载字体: {font_path}，字体大小: 100")
                     except IOError as e:
                         thread_safe_logging('warning', f"加载字体失败: {font_path}, 错误: {e}")
@@ -176,40 +219,128 @@ class StorageManager:
             # 可以根据需要添加更多特殊键
         }
 
+        # 显示器布局缓存：只截取事件所在的显示器
+        self.display = DisplayGeometry(self.config_service.get_float('display.refresh_interval'))
+
+        # 共享内存帧缓冲池与截图编码池
+        # 编码池规模在启动时确定，修改后需重启生效
+        self.frame_pool = FramePool(slots=self.config_service.get_int('frame_encoder.pool_slots'))
+        self.encoder = FrameEncoder(
+            workers=self.config_service.get_int('frame_encoder.workers'),
+            use_processes=self.config_service.get_bool('frame_encoder.use_processes'),
+            initializer=lower_priority,
+            initargs=(self.governor.nice,)
+        )
+        self.governor.subscribe(self.apply_governor)
+        self.governor.start()
+
+        # 按前台应用选择截图方式的规则表
+        self.profiles = CaptureProfiles()
+
+        # 截屏后端：优先使用平台原生接口，不可用时退回 pyautogui
+        self.capture_backend_name = self.config_service.get('capture.backend', 'auto')
+        self.capture_backend = create_backend(self.capture_backend_name)
+
+        # 可热更新的截图参数
+        self.apply_config(self.config_service)
+        self.config_service.subscribe(self.apply_config)
+
         StorageManager._initialized = True
 
+    @property
+    def config(self):
+        """当前生效的配置，随配置文件热更新。"""
+        return self.config_service.data
+
     def load_config(self):
         """
         加载配置文件。
         """
-        try:
-            with open(resource_path('config.json'), 'r', encoding='utf-8') as f:
-                config = json.load(f)
-            thread_safe_logging('info', "存储管理器配置已加载。")
-            return config
-        except Exception as e:
-            thread_safe_logging('error', f"加载存储管理器配置失败: {e}")
-            return {}
+        return self.config_service.data
+
+    def apply_config(self, service, changed=None):
+        """应用可在运行中调整的截图与配额参数。"""
+        self.jpeg_quality = service.get_int('capture.jpeg_quality')
+        self.target_size_kb = service.get_int('capture.target_size_kb')
+        self.capture_monitor_only = service.get_bool('display.capture_monitor_only')
+        self.frame_storage = service.get('capture.frame_storage', 'files')
+        self.pack_segment_bytes = service.get_int('capture.pack_segment_mb') * 1024 * 1024
+        backend_name = service.get('capture.backend', 'auto')
+        if backend_name != self.capture_backend_name:
+            self.capture_backend_name = backend_name
+            self.capture_backend = create_backend(backend_name)
+        self.display.refresh_interval = service.get_float('display.refresh_interval')
+        self.profiles.configure(service.get('capture_profiles.rules', []), {
+            'mode': MODE_MONITOR if self.capture_monitor_only else MODE_FULL,
+            'quality': self.jpeg_quality,
+            'target_size_kb': self.target_size_kb
+        })
+        self.budget.configure(service.section('storage_budget'))
+        self.spool.configure(service.section('upload'))
+        self.governor.configure(service.section('governor'))
+        self.tracer.configure(service.section('tracing'))
+        if changed:
+            thread_safe_logging('info', f"存储管理器已应用新配置: JPEG质量 {self.jpeg_quality}，"
+                                        f"目标大小 {self.target_size_kb}KB")
+
+    def apply_governor(self, state):
+        """应用资源调控给出的编码并发、CPU 份额、编码次数与上传带宽限制。"""
+        self.encoder.set_limits(state.encoder_workers, state.cpu_share, state.quality_step)
+        self.spool.set_rate_cap(state.bandwidth_kbps)
 
     def getLogPath(self):
         return self.log_path
 
     def draw_star(self, draw, x, y, radius_outer, radius_inner, color_star):
         """在截图上绘制一个五角星，用于标记鼠标位置。"""
-        num_points = 5
-        points = []
-        for i in range(num_points):
-            angle = math.radians(i * 144)
-            x_outer = x + radius_outer * math.cos(angle)
-            y_outer = y - radius_outer * math.sin(angle)
-            points.append((x_outer, y_outer))
+        _draw_star(draw, x, y, radius_outer, radius_inner, color_star)
 
-            angle = math.radians(i * 144 + 72)
-            x_inner = x + radius_inner * math.cos(angle)
-            y_inner = y - radius_inner * math.sin(angle)
-            points.append((x_inner, y_inner))
+    def current_app(self):
+        """
+        截图前查询当前的前台应用，供没有输入事件的截图（定时截图、操作后截图）选择截图规则；
+        无法获取时返回 None，由截图规则按未知应用处理。
+        """
+        if self.foreground_app is None:
+            return None
+        active_app = self.foreground_app()
+        return None if active_app == UNKNOWN_APP else active_app
 
-        draw.polygon(points, fill=color_star)
+    def capture_frame(self, x=None, y=None, active_app=None, admit=True):
+        """
+        截屏并写入共享内存帧缓冲池，调用方用完后需调用 release()。
+        截图前先查询 active_app 的截图规则：规则为不截图或超过帧率上限时返回 None；
+        admit 为 False 时不检查规则（操作后稳定画面的轮询截图，只保存其中一帧）。
+        规则为只截取所在显示器且提供坐标时只截取该显示器，返回的帧带有 monitor 属性。
+        """
+        profile = self.profiles.resolve(active_app)
+        if admit and not self.profiles.admit(profile):
+            return None
+        monitor = None
+        if profile.mode == MODE_MONITOR and x is not None and y is not None:
+            monitor = self.display.monitor_at(x, y)
+        if monitor is None or len(self.display.monitors()) <= 1:
+            monitor = None
+        with span('capture', 'capture'):
+            frame = self._grab(monitor)
+        frame.monitor = monitor
+        return frame
+
+    def _grab(self, monitor):
+        """
+        通过截屏后端截图并写入帧缓冲池：原生后端把像素缓冲直接写入槽位，其余后端经过 PIL 图像。
+        原生后端出错（如权限被撤销）时改用 pyautogui。
+        """
+        backend = self.capture_backend
+        try:
+            if backend.native:
+                return backend.grab_into(self.frame_pool.store_raw, monitor)
+            return self.frame_pool.store(backend.grab(monitor))
+        except Exception as e:
+            if isinstance(backend, PyAutoGUIBackend):
+                raise
+            thread_safe_logging('error', f"截屏后端 {backend.name} 出错，改用 pyautogui: {e}")
+            self.capture_backend = PyAutoGUIBackend()
+            return self.frame_pool.store(self.capture_backend.grab(monitor))
 
     def convert_key_name(self, key_name):
         """
@@ -230,60 +361,71 @@ class StorageManager:
                 converted.append(f"U+{ord(key):04X}")
         return ' '.join(converted)
 
-    def save_screenshot(self, x=None, y=None, dx=None, dy=None, button=None, key_name=None, screenshot=None, filename=None):
-        """保存截图"""
+    def save_screenshot(self, x=None, y=None, dx=None, dy=None, button=None, key_name=None, screenshot=None,
+                        filename=None, active_app=None, event_id=None, annotate=True):
+        """
+        保存截图。screenshot 可以是 capture_frame() 返回的帧或 PIL 图像，未提供时立即截屏。
+        标注和编码交给编码池异步完成，这里立即返回不带信息截图的相对路径。
+        缩放、格式、质量以及是否保存带信息的截图由 active_app 的截图规则决定，annotate 为 False 时不保存；
+        规则不允许截图时返回 None，事件照常记录。event_id 随截图记入完整性清单。
+        """
         if not self._session_started:
             thread_safe_logging('warning', "尝试保存截图但会话尚未开始")
             return False
-            
+
+        profile = self.profiles.resolve(active_app)
+        if profile.mode == MODE_SKIP:
+            return None
+
+        if not self.budget.allow_frame():
+            thread_safe_logging('warning', "磁盘占用超过高水位，丢弃本次截图")
+            return None
+
+        frame = None
         try:
+            quality, target_size_kb = self.budget.capture_quality(profile.quality, profile.target_size_kb)
             base_path = app_path()
-            screen_size = pyautogui.size()
-            screen_width, screen_height = screen_size
+            screen_width, screen_height = self.display.primary_size()
+
+            # 使用调用方提供的截图（事件发生前的画面），未提供时才重新截屏
+            if screenshot is None:
+                frame = self.capture_frame(active_app=active_app)
+                if frame is None:
+                    return None  # 超过该应用的帧率上限
+            elif hasattr(screenshot, 'retain'):
+                frame = screenshot.retain()
+            else:
+                frame = HeapFrame(screenshot)
 
-            # 捕获截图如果没有提供
-            if screenshot and filename:
-                img = screenshot
+            if filename:
                 # 从文件名中提取时间戳（假设文件名格式为 screenshot_TIMESTAMP.png）
                 timestamp = os.path.splitext(filename)[0].split('_')[-1]
             else:
-                img = pyautogui.screenshot()
                 timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S_%f")
 
             # 定义文件名
-            unannotated_filename = f"screenshot_{timestamp}_no_info.jpg"
-            annotated_filename = f"screenshot_{timestamp}_with_info.jpg"
+            extension = '.png' if profile.format == 'png' else '.jpg'
+            unannotated_filename = f"screenshot_{timestamp}_no_info{extension}"
+            annotated_filename = f"screenshot_{timestamp}_with_info{extension}"
 
             unannotated_filepath = os.path.join(self.original_path, unannotated_filename)
-            annotated_filepath = os.path.join(self.annotated_path, annotated_filename)
-            #print(unannotated_filepath, annotated_filepath)
+            annotated_filepath = os.path.join(self.annotated_path, annotated_filename) \
+                if profile.annotated and annotate else None
 
-            # 保存不带信息的截图（仅绘制鼠标位置）
-            img_unannotated = img.copy()
-            draw_unannotated = ImageDraw.Draw(img_unannotated)
+            star = None
+            text = ""
 
             if x is not None and y is not None:
                 percent_x = (x / screen_width) * 100
                 percent_y = (y / screen_height) * 100
 
-                star_x = percent_x * img_unannotated.width / 100
-                star_y = (100 - percent_y) * img_unannotated.height / 100
-
-            # 转换为RGB并保存为JPEG
-            img_unannotated_rgb = img_unannotated.convert('RGB')
-            img_unannotated_rgb.save(unannotated_filepath, 'JPEG', quality=95)
-            compress_image(unannotated_filepath, unannotated_filepath, target_size_kb=500)
-
-            # 保存带信息的截图（绘制鼠标位置和附加信息）
-            img_annotated = img.copy()
-            draw_annotated = ImageDraw.Draw(img_annotated)
-
-            has_info = False  # 标记是否有附加信息
-            text = ""
-
-            if x is not None and y is not None:
-                # 绘制鼠标位置
-                self.draw_star(draw_annotated, star_x, star_y, radius_outer=60, radius_inner=20, color_star=(255, 0, 0))
+                monitor = getattr(frame, 'monitor', None)
+                if monitor is not None:
+                    # 只截取了单个显示器，星形标记使用该显示器内的坐标
+                    star = ((x - monitor.left) / monitor.width * frame.width,
+                            (screen_height - y - monitor.top) / monitor.height * frame.height)
+                else:
+                    star = (percent_x * frame.width / 100, (100 - percent_y) * frame.height / 100)
 
                 # 准备文本信息
                 text = f"Mouse: ({x}, {y}) | X: {percent_x:.2f}% | Y: {percent_y:.2f}%"
@@ -292,138 +434,291 @@ class StorageManager:
                 if dx is not None or dy is not None:
                     text += f" | Scroll delta: ({dx}, {dy})"
 
-                has_info = True
-
             if key_name is not None:
                 key_name_processed = self.convert_key_name(key_name)
-                if has_info and text:
+                if text:
                     text += " | "
-                elif not has_info:
-                    text = ""
                 text += f"Key: {key_name_processed}"
                 thread_safe_logging('debug', f"Key name processed: {key_name_processed}")
 
-                has_info = True
-
-            if has_info and text:
-                # 获取文本大小
-                bbox = draw_annotated.textbbox((0, 0), text, font=self.font)
-                text_width = bbox[2] - bbox[0]
-                text_height = bbox[3] - bbox[1]
-
-                # 文本位置：顶部居中
-                y_offset = 50  # 根据需要调整
-                position = ((img_annotated.width - text_width) / 2, y_offset)
-
-                # 绘制半透明背景
-                background = (0, 0, 0, 128)  # 半透明黑色
-                # 创建一个透明层
-                overlay = Image.new('RGBA', img_annotated.size, (0, 0, 0, 0))
-                overlay_draw = ImageDraw.Draw(overlay)
-                overlay_draw.rectangle(
-                    [position[0] - 10, position[1] - 10, position[0] + text_width + 10, position[1] + text_height + 10],
-                    fill=background
-                )
-                # 合并图层
-                img_with_overlay = Image.alpha_composite(img_annotated.convert('RGBA'), overlay)
-
-                # 绘制文本
-                draw_final = ImageDraw.Draw(img_with_overlay)
-                draw_final.text(position, text, font=self.font, fill=(255, 255, 255))
-                thread_safe_logging('debug', f"绘制信息文本的位置: {position}")
-
-                # 转换为RGB并保存为JPEG
-                img_with_overlay_rgb = img_with_overlay.convert('RGB')
-                img_with_overlay_rgb.save(annotated_filepath, 'JPEG', quality=95)
-                compress_image(annotated_filepath, annotated_filepath, target_size_kb=500)
-            else:
-                # 如果没有附加信息，仅保存带有鼠标位置的截图
-                img_annotated_rgb = img_annotated.convert('RGB')
-                img_annotated_rgb.save(annotated_filepath, 'JPEG', quality=95)
-                compress_image(annotated_filepath, annotated_filepath, target_size_kb=500)
-
-            # 获取相对路径
-            relative_unannotated_path = os.path.relpath(unannotated_filepath, base_path)
-            relative_annotated_path = os.path.relpath(annotated_filepath, base_path)
-
-            # 记录日志
-            thread_safe_logging('info', f"已保存无信息截图: {relative_unannotated_path}")
-            thread_safe_logging('info', f"已保存有信息截图: {relative_annotated_path}")
+            digests = None
+            encode_original = True
+            # 共享存储只保存原始分辨率的 JPEG，其他规则的截图按会话写入
+            if self.frame_storage == 'cas' and profile.format == 'jpeg' and profile.scale == 1.0:
+                digest = pixel_hash(frame)
+                digests = {unannotated_filepath: digest}
+                self.frame_hashes[os.path.relpath(unannotated_filepath, base_path)] = digest
+                if self.frame_store.has(digest):
+                    # 相同画面已在存储中，只建立链接，不再编码
+                    self._link_frame(digest, unannotated_filepath)
+                    encode_original = False
+
+            if not encode_original and annotated_filepath is None:
+                return os.path.relpath(unannotated_filepath, base_path)
+
+            job = FrameJob(
+                frame=frame,
+                unannotated_path=unannotated_filepath if encode_original else None,
+                annotated_path=annotated_filepath,
+                star=star,
+                text=text or None,
+                font_path=self.font_path,
+                quality=quality,
+                target_size_kb=target_size_kb,
+                scale=profile.scale,
+                image_format=profile.format,
+                event_id=event_id
+            )
+            self.encoder.submit(job, lambda outputs, error, frame=frame, digests=digests:
+                                self._on_frame_encoded(frame, outputs, error, digests, event_id))
+            frame = None  # 帧引用已交给编码回调释放
 
             # 返回不带信息的截图相对路径
-            return relative_unannotated_path
+            return os.path.relpath(unannotated_filepath, base_path)
 
         except Exception as e:
             thread_safe_logging('error', f"截屏失败: {e}")
             return "截屏失败"
+        finally:
+            if frame is not None:
+                frame.release()
+
+    def _on_frame_encoded(self, frame, outputs, error, digests=None, event_id=None):
+        """编码池回调：释放帧引用并把编码结果写入磁盘。digests 为需存入共享存储的路径 -> 哈希。"""
+        frame.release()
+        if error is not None:
+            thread_safe_logging('error', f"截图编码失败: {error}")
+            return
+        base_path = app_path()
+        for filepath, data, quality in outputs:
+            with span('write_frame', 'storage', event_id):
+                self._write_frame(filepath, data, quality, (digests or {}).get(filepath), event_id)
+            thread_safe_logging('info', f"已保存截图: {os.path.relpath(filepath, base_path)}")
 
-    def zip_folder(self, folder_path, zip_path):
+    def _write_frame(self, filepath, data, quality, digest=None, event_id=None):
+        """
+        将编码后的 JPEG 字节写入磁盘，向磁盘配额登记字节数并写入会话日志，
+        同时用内存中的字节计算哈希并记入完整性清单。
+        提供 digest 时写入共享截图存储，会话中的路径只是指向存储的链接；
+        pack 模式下追加到会话的段文件，路径只作为段索引中的名称。
+        """
+        if digest is None and self.frame_storage == 'pack' and self.session_folder is not None:
+            manifest = self.manifest
+            self._session_pack().append(
+                filepath, data,
+                None if manifest is None else
+                lambda segment, offset: manifest.append(segment, data, event_id, member=filepath))
+            self.budget.add(len(data))
+            if self.journal is not None:
+                self.journal.frame(filepath, len(data), packed=True)
+        elif digest is None:
+            if self.manifest is not None:
+                self.manifest.add(filepath, data, event_id)
+            with open(filepath, 'wb') as f:
+                f.write(data)
+            self.budget.add(len(data))
+            if self.journal is not None:
+                self.journal.frame(filepath, len(data))
+        else:
+            if self.manifest is not None:
+                self.manifest.add(filepath, data, event_id)
+            if self.frame_store.put(digest, data):
+                self.budget.add(len(data), FRAME_STORE_DIR)
+            self._link_frame(digest, filepath, len(data))
+        thread_safe_logging('info', f"压缩图片: {filepath}，大小: {len(data) / 1024:.2f}KB，质量: {quality}")
+        return len(data)
+
+    def _session_pack(self):
+        """本会话的截图段文件，首次写入时创建；段文件与索引记入会话日志以便打包。"""
+        with self.pack_lock:
+            if self.pack is None:
+                self.pack = PackWriter(self.session_folder, self.pack_segment_bytes, self.journal_file)
+            return self.pack
+
+    def _link_frame(self, digest, filepath, size=None):
+        """在会话中建立指向共享存储的截图，并以哈希记入会话日志。"""
+        self.frame_store.link(digest, filepath)
+        if self.journal is not None:
+            self.journal.frame(filepath, size or self.frame_store.size(digest), digest)
+
+    def frame_hash(self, relpath):
+        """返回 save_screenshot 所返回路径对应的像素哈希，未启用共享存储时为 None。"""
+        return self.frame_hashes.get(relpath)
+
+    def journal_event(self, event_id, log_file, data=None):
+        """记录一条事件已追加到 JSONL 日志；data 为追加的字节，记入完整性清单。"""
+        self.journal_append(log_file, data, event_id)
+        if self.journal is not None:
+            self.journal.event(event_id)
+
+    def journal_append(self, filepath, data=None, event_id=None):
+        """记录向会话内追加写入的文件（如操作后截图的索引）；data 为追加的字节，记入完整性清单。"""
+        if self.manifest is not None and data is not None:
+            self.manifest.append(filepath, data, event_id)
+        if self.journal is not None:
+            self.journal.file(filepath)
+
+    def journal_file(self, filepath, data=None):
+        """记录会话内新写入的文件，打包时据此生成文件列表；data 为写入的字节，记入完整性清单。"""
+        if self.manifest is not None and data is not None:
+            self.manifest.add(filepath, data)
+        if self.journal is not None:
+            self.journal.file(filepath)
+
+    def flush_frames(self, timeout=None, progress=None):
+        """等待编码池中的截图全部写盘，打包前调用。progress 为结束流程的进度，按已写盘的帧数推进。"""
+        if progress is None:
+            idle = self.encoder.wait_idle(timeout)
+        else:
+            total = self.encoder.queued()
+            progress.begin(STAGE_STOPPING, total)
+            deadline = None if timeout is None else time.monotonic() + timeout
+            idle = self.encoder.wait_idle(0.2)
+            while not idle and (deadline is None or time.monotonic() < deadline):
+                progress.update(max(0, total - self.encoder.queued()))
+                idle = self.encoder.wait_idle(0.2)
+        if not idle:
+            thread_safe_logging('warning', f"等待截图编码超时，仍有 {self.encoder.queued()} 帧未写盘")
+
+    @traced('zip', 'package')
+    def zip_folder(self, folder_path, zip_path, files=None, progress=None):
         """
         将指定文件夹打包成 ZIP 文件，排除之前生成的压缩包和加密文件。
+        提供 files（相对于会话文件夹的路径列表，来自会话日志）时直接按列表打包，不再遍历目录。
+        压缩时读入的内容同时按完整性清单校验，不额外读盘。
+        progress 为结束流程的进度，按文件数推进；取消时删除未完成的 ZIP。
         """
         try:
             thread_safe_logging('info', f"开始压缩文件夹 - 源文件夹: {folder_path}")
             thread_safe_logging('info', f"ZIP文件将保存至: {zip_path}")
-            
+            verifier = ManifestVerifier(folder_path)
+            if progress is not None:
+                progress.begin(STAGE_ARCHIVING, len(files) if files is not None else 0)
+
             with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
                 file_count = 0
-                for root, dirs, files in os.walk(folder_path):
+                if files is not None:
+                    session_name = os.path.basename(folder_path)
+                    for rel in files:
+                        if progress is not None:
+                            progress.check()
+                            progress.advance()
+                        abs_file_path = os.path.join(folder_path, rel)
+                        if not os.path.exists(abs_file_path):
+                            thread_safe_logging('warning', f"日志中记录的文件不存在，跳过: {rel}")
+                            continue
+                        self._zip_member(zipf, abs_file_path, os.path.join(session_name, rel), rel, verifier)
+                        file_count += 1
+                    files_to_walk = []
+                else:
+                    files_to_walk = os.walk(folder_path)
+                for root, dirs, files in files_to_walk:
                     thread_safe_logging('info', f"正在处理子目录: {root}")
                     # 过滤掉不需要的文件
                     files = [f for f in files if not (f.endswith('.zip') or f.endswith('.enc'))]
                     thread_safe_logging('info', f"发现文件数量: {len(files)}")
                     
                     for file in files:
+                        if progress is not None:
+                            progress.check()
+                            progress.advance()
                         abs_file_path = os.path.join(root, file)
                         relative_path = os.path.relpath(abs_file_path, os.path.dirname(folder_path))
-                        zipf.write(abs_file_path, relative_path)
+                        self._zip_member(zipf, abs_file_path, relative_path,
+                                         os.path.relpath(abs_file_path, folder_path), verifier)
                         file_count += 1
                         thread_safe_logging('info', f"已添加文件: {relative_path}")
             
             zip_size = os.path.getsize(zip_path) / (1024 * 1024)  # Convert to MB
             thread_safe_logging('info', f"压缩完成 - 文件数: {file_count}, ZIP大小: {zip_size:.2f}MB")
-            
+            verifier.report()
+
+        except ShutdownCancelled:
+            thread_safe_logging('info', f"压缩已取消，删除未完成的ZIP文件: {zip_path}")
+            if os.path.exists(zip_path):
+                os.remove(zip_path)
+            raise
         except Exception as e:
             thread_safe_logging('error', f"压缩失败 - 文件夹: {folder_path}, 错误: {str(e)}")
             raise
 
-    def encrypt_file(self, input_file, output_file, key, iv):
+    @staticmethod
+    def _zip_member(zipf, abs_file_path, arcname, rel, verifier):
+        """读入文件并写入 ZIP，读入的字节同时用于完整性校验。截图段文件已是压缩数据，直接存储。"""
+        with open(abs_file_path, 'rb') as f:
+            data = f.read()
+        verifier.check(rel, data)
+        info = zipfile.ZipInfo.from_file(abs_file_path, arcname)
+        info.compress_type = zipfile.ZIP_STORED if abs_file_path.endswith('.pack') else zipfile.ZIP_DEFLATED
+        zipf.writestr(info, data)
+
+    @traced('encrypt', 'package')
+    def encrypt_file(self, input_file, output_file, key, iv, progress=None, block_size=4 * 1024 * 1024):
         """
-        使用 AES 加密文件。
+        使用 AES 加密文件。按块流式加密（CBC 在块之间延续状态，结果与整体加密相同），
+        progress 为结束流程的进度，按已加密的字节数推进；取消时删除未完成的加密文件。
         """
         try:
             thread_safe_logging('info', f"开始加密文件 - 源文件: {input_file}")
             thread_safe_logging('info', f"加密文件将保存至: {output_file}")
             
-            input_size = os.path.getsize(input_file) / (1024 * 1024)  # Convert to MB
-            thread_safe_logging('info', f"源文件大小: {input_size:.2f}MB")
+            input_size = os.path.getsize(input_file)
+            thread_safe_logging('info', f"源文件大小: {input_size / (1024 * 1024):.2f}MB")
+            if progress is not None:
+                progress.begin(STAGE_ENCRYPTING, input_size)
 
             cipher = AES.new(key.encode('utf-8'), AES.MODE_CBC, iv.encode('utf-8'))
-            with open(input_file, 'rb') as f:
-                plaintext = f.read()
-                thread_safe_logging('info', f"已读取源文件，准备加密")
-
-            # 使用 PKCS7 填充数据
-            padded_data = pad(plaintext, AES.block_size)
-            ciphertext = cipher.encrypt(padded_data)
-
             # 保存 IV + 加密后的数据
-            with open(output_file, 'wb') as f:
-                f.write(iv.encode('utf-8') + ciphertext)
+            with open(input_file, 'rb') as src, open(output_file, 'wb') as out:
+                out.write(iv.encode('utf-8'))
+                block = src.read(block_size)
+                while True:
+                    if progress is not None:
+                        progress.check()
+                    following = src.read(block_size)
+                    if not following:
+                        # 最后一块使用 PKCS7 填充
+                        out.write(cipher.encrypt(pad(block, AES.block_size)))
+                        break
+                    out.write(cipher.encrypt(block))
+                    if progress is not None:
+                        progress.advance(len(block))
+                    block = following
+            if progress is not None:
+                progress.update(input_size)
 
             output_size = os.path.getsize(output_file) / (1024 * 1024)  # Convert to MB
             thread_safe_logging('info', f"加密完成 - 加密后文件大小: {output_size:.2f}MB")
             
+        except ShutdownCancelled:
+            thread_safe_logging('info', f"加密已取消，删除未完成的加密文件: {output_file}")
+            if os.path.exists(output_file):
+                os.remove(output_file)
+            raise
         except Exception as e:
             thread_safe_logging('error', f"加密失败 - 文件: {input_file}, 错误: {str(e)}")
             raise
 
-    def upload_file(self, file_path):
+    def _path_in_repo(self, suffix):
+        """仓库内路径：用户名作为文件夹，时间戳作为文件名。"""
+        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        try:
+            with open(os.path.join(app_path(), 'username.txt'), 'r', encoding='utf-8') as f:
+                username = f.read().strip()
+                path_in_repo = f"{username}/{timestamp}{suffix}"
+                print(f"上传路径: {path_in_repo}")
+        except:
+            print("未找到用户名文件")
+            path_in_repo = f"{timestamp}{suffix}"
+        return path_in_repo
+
+    def upload_file(self, file_path, suffix='.zip.enc', path_in_repo=None, reader=None):
         """
         使用 ModelScope API 上传打包后的 ZIP 文件。
+        suffix 为仓库内文件的扩展名，分块归档使用 .bgca。
+        path_in_repo 在入队时确定，重试时保持不变；reader 为限速读取归档的 ThrottledReader，
+        提供时按 _upload_streamed 流式上传。
         """
-        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-
         config = self.config.get('modelscope', {})
         access_token = config.get('access_token')
         owner_name = config.get('owner_name')
@@ -431,20 +726,13 @@ class StorageManager:
         commit_message = config.get('commit_message', 'upload dataset folder to repo')
         repo_type = config.get('repo_type', 'dataset')
         print('\n' + access_token, owner_name, dataset_name, commit_message, repo_type)
-        
-        # 读取用户名并构建上传路径（用户名作为文件夹，时间戳作为文件名）
-        try:
-            with open(os.path.join(app_path(), 'username.txt'), 'r', encoding='utf-8') as f:
-                username = f.read().strip()
-                path_in_repo = f"{username}/{timestamp}.zip.enc"
-                print(f"上传路径: {path_in_repo}")
-        except:
-            print("未找到用户名文件")
-            path_in_repo = f"{timestamp}.zip.enc"
+
+        if path_in_repo is None:
+            path_in_repo = self._path_in_repo(suffix)
 
         if not os.path.exists(file_path):
             thread_safe_logging('error', f"错误: 文件 {file_path} 不存在。上传失败。")
-            return
+            return False
 
         api = HubApi()
         api.login(access_token)
@@ -455,6 +743,43 @@ class StorageManager:
             print(f"文件路径: {file_path}")
             print(f"仓库内路径: {path_in_repo}")
             
+            if reader is not None:
+                self._upload_streamed(api, repo_id, file_path, path_in_repo, commit_message, repo_type, reader)
+            else:
+                api.upload_file(
+                    repo_id=repo_id,
+                    path_or_fileobj=file_path,
+                    path_in_repo=path_in_repo,
+                    commit_message=commit_message,
+                    repo_type=repo_type
+                )
+            thread_safe_logging('info', f"成功: 文件已上传到 {repo_id}/{path_in_repo}")
+            print(f"文件已上传到: {repo_id}/{path_in_repo}")
+            return True
+        except Exception as e:
+            thread_safe_logging('error', f"错误: 上传文件时出错: {e}")
+            print(f"上传错误: {str(e)}")
+            return False
+
+    @staticmethod
+    def _upload_streamed(api, repo_id, file_path, path_in_repo, commit_message, repo_type, reader):
+        """
+        与 HubApi.upload_file 相同的两步上传：先上传 blob，再提交引用它的 commit。
+        HubApi.upload_file 只接受路径，传入文件对象时会先整体读入内存；这里让 blob 的分块 PUT
+        直接从 reader 读取，限速、进度与取消都发生在数据发送的过程中。服务端已有相同 blob 时不读取 reader；
+        小于 LFS 阈值的文件提交时由 ModelScope 再读一次文件内嵌在 commit 请求中，这部分不限速。
+        blob 上传依赖 ModelScope 的内部接口（版本见 requirements.txt），不可用时按文件限速：
+        先经 reader 读完整个文件（推进进度、响应取消），再由 HubApi.upload_file 上传。
+        """
+        try:
+            from modelscope.utils.file_utils import get_file_hash
+            from modelscope.utils.repo_utils import CommitOperationAdd
+            checker = api.upload_checker
+            upload_blob = api._upload_blob
+        except (ImportError, AttributeError) as e:
+            thread_safe_logging('warning', f"ModelScope 不支持流式上传，改为按文件限速后上传: {e}")
+            while reader.read(1024 * 1024):
+                pass
             api.upload_file(
                 repo_id=repo_id,
                 path_or_fileobj=file_path,
@@ -462,56 +787,293 @@ class StorageManager:
                 commit_message=commit_message,
                 repo_type=repo_type
             )
-            thread_safe_logging('info', f"成功: 文件已上传到 {repo_id}/{path_in_repo}")
-            print(f"文件已上传到: {repo_id}/{path_in_repo}")
-        except Exception as e:
-            thread_safe_logging('error', f"错误: 上传文件时出错: {e}")
-            print(f"上传错误: {str(e)}")
+            return
 
-    def process_session(self):
+        checker.check_file(file_path)
+        checker.check_normal_files(file_path_list=[file_path], repo_type=repo_type)
+        hash_info = get_file_hash(file_path_or_obj=file_path)
+        blob = upload_blob(
+            repo_id=repo_id,
+            repo_type=repo_type,
+            sha256=hash_info['file_hash'],
+            size=hash_info['file_size'],
+            data=reader,
+            disable_tqdm=True
+        )
+        operation = CommitOperationAdd(path_in_repo=path_in_repo, path_or_fileobj=file_path,
+                                       file_hash_info=hash_info)
+        operation._upload_mode = 'lfs' if checker.is_lfs(file_path, repo_type) else 'normal'
+        operation._is_uploaded = blob['is_uploaded']
+        api.create_commit(
+            repo_id=repo_id,
+            operations=[operation],
+            commit_message=commit_message,
+            repo_type=repo_type
+        )
+
+    @traced('upload', 'upload')
+    def _upload_spooled(self, path, entry, bucket):
+        """上传队列的上传函数，在上传线程中运行，按令牌桶限速读取归档。"""
+        thread_safe_logging('info', f"开始上传加密文件: {entry['file']}")
+        self.upload_state = 'uploading'
+        progress = self.upload_watchers.get(os.path.basename(entry['session_folder']))
+        if progress is not None:
+            progress.begin(STAGE_UPLOADING, entry['size'])
+        with ThrottledReader(open(path, 'rb'), bucket, progress, self.spool.abort_event) as reader:
+            ok = self.upload_file(path, entry['suffix'], entry['path_in_repo'], reader)
+        if not ok:
+            self.upload_state = 'failed'
+        return ok
+
+    def stop_uploads(self, timeout=5.0):
+        """程序退出前调用：中断后台上传并限时等待，未完成的归档留在队列中。"""
+        self.spool.stop(timeout)
+
+    def _on_spool_uploaded(self, entry):
+        """上传接口确认成功后调用：标记共享截图已上传，并删除会话文件夹。"""
+        self.frame_store.mark_uploaded(entry.get('frames', []))
+        self.budget.add(-entry['size'], SPOOL_DIR)
+        session_folder = entry['session_folder']
+        session_name = os.path.basename(session_folder)
+        if os.path.isdir(session_folder):
+            journal = SessionJournal(session_folder)
+            journal.stage(STAGE_UPLOADED)
+            journal.close()
+            self.budget.mark_uploaded(session_folder)
+
+            # 在所有处理完成后，删除会话文件夹
+            try:
+                import shutil
+                shutil.rmtree(session_folder)
+                self.budget.remove_session(session_name)
+                print(f"\n会话文件夹已删除: {session_folder}")
+                thread_safe_logging('info', f"会话文件夹已删除: {session_folder}")
+            except Exception as e:
+                thread_safe_logging('error', f"删除文件夹失败: {str(e)}")
+                print(f"\n删除文件夹失败: {str(e)}")
+        self.upload_state = 'uploaded'
+        thread_safe_logging('info', f"会话处理完成 - 文件夹: {session_folder}")
+
+    def process_session(self, progress=None):
         """
-        压缩、加密并上传当前会话的文件夹。
+        压缩、加密当前会话的文件夹并加入上传队列，等待第一次上传尝试结束，上传成功时返回 True。
+        上传失败时归档留在队列中，由后台（包括下次启动后）继续重试。
+        progress 为结束流程的进度（界面轮询显示）；取消时抛出 ShutdownCancelled：
+        打包中取消由下次启动时的会话恢复继续，上传中取消则中断本次上传，归档留在队列中。
         """
+        thread_safe_logging('info', f"开始处理会话文件夹: {self.session_folder}")
+        self.flush_frames(progress=progress)
+        self.frame_pool.close()
+        with self.pack_lock:
+            if self.pack is not None:
+                self.pack.close()
+                self.pack = None
+        self.write_trace(os.path.join(self.log_path, TRACE_FILE), journal=True)
+        if self.manifest is not None:
+            self.manifest.seal()
+            self.manifest.close()
+        self.journal.stage(STAGE_CLOSED)
+        # 队列条目编号即会话名，入队前登记，上传线程据此推进进度
+        session_name = os.path.basename(self.session_folder)
+        if progress is not None:
+            self.upload_watchers[session_name] = progress
         try:
-            thread_safe_logging('info', f"开始处理会话文件夹: {self.session_folder}")
-            
-            zip_path = os.path.join(self.session_folder, f"session_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip")
-            encrypted_zip_path = zip_path + ".enc"
-            
-            thread_safe_logging('info', f"计划生成的ZIP文件路径: {zip_path}")
-            thread_safe_logging('info', f"计划生成的加密文件路径: {encrypted_zip_path}")
-
-            self.zip_folder(self.session_folder, zip_path)
+            entry_id = self.package_and_upload(self.session_folder, self.journal, progress=progress)
+            if entry_id is None:
+                return False
+            uploaded = self.spool.wait(entry_id, cancel=None if progress is None else progress.cancel_event)
+            if progress is not None:
+                progress.check()
+            if not uploaded:
+                thread_safe_logging('warning', f"上传未成功，归档保留在上传队列中: {entry_id}")
+            return uploaded
+        finally:
+            self.upload_watchers.pop(session_name, None)
+            self.journal.close()
+            self.write_trace(os.path.join(self.base_path, "records", TRACE_DIR, f"{session_name}_upload.json"))
+
+    def write_trace(self, path, journal=False):
+        """
+        写出流水线追踪（未开启时不写）。会话关闭时写入会话 log 目录并记入会话日志，随会话上传；
+        打包上传阶段的区间在之后写入 records/.traces，保留在本地。
+        """
+        if not self.tracer.enabled:
+            return
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            data = self.tracer.write(path)
+            if journal and data is not None:
+                self.journal_file(path, data)
+        except Exception as e:
+            thread_safe_logging('error', f"写出流水线追踪失败: {path}, 错误: {e}")
 
+    def package_and_upload(self, session_folder, journal, state=None, progress=None):
+        """
+        按会话日志推进打包、加密阶段，然后把归档交给上传队列，返回队列条目编号。
+        state 为重放日志得到的状态，已完成的阶段会被跳过，
+        因此同一方法既用于正常结束，也用于恢复中断的会话。
+        progress 为结束流程的进度；取消时抛出 ShutdownCancelled，已完成的阶段保留在日志中。
+        """
+        session_name = os.path.basename(session_folder)
+        if self.spool.has(session_name):
+            # 归档已移入队列但日志尚未记录（入队后被中断）
+            journal.stage(STAGE_SPOOLED, entry=session_name)
+            journal.close()
+            return session_name
+        stages = state.stages if state is not None else {}
+        files = list(state.files if state is not None else journal.files) or None
+        frame_hashes = state.frame_hashes if state is not None else journal.frame_hashes
+        try:
             encryption_config = self.config.get('encryption', {})
             key = encryption_config.get('key')
             iv = encryption_config.get('iv')
-            
+
             if not key or not iv:
                 thread_safe_logging('error', "加密失败 - 配置缺失: key 或 iv 未配置")
                 return
 
-            thread_safe_logging('info', "开始加密ZIP文件")
-            self.encrypt_file(zip_path, encrypted_zip_path, key, iv)
-
-            thread_safe_logging('info', "开始上传加密文件")
-            self.upload_file(encrypted_zip_path)
+            attached = []
+            if frame_hashes and files is not None:
+                # 共享存储中的截图不按会话路径打包，只附带尚未上传过的画面和路径索引
+                extra, attached = self.frame_store.prepare_session(session_folder, dict(frame_hashes))
+                files = [f for f in files if f not in frame_hashes] + extra
 
-            thread_safe_logging('info', f"会话处理完成 - 文件夹: {self.session_folder}")
+            self.upload_state = 'packaging'
+            if self.config_service.get('archive.format', 'zip') == 'chunked':
+                upload_path = self._build_chunked_archive(session_folder, journal, stages, files, key, progress)
+                suffix = '.bgca'
+            else:
+                upload_path = self._build_zip_archive(session_folder, journal, stages, files, key, iv, progress)
+                suffix = '.zip.enc'
+
+            # 归档移入上传队列后，占用从会话转到队列目录；会话文件夹在上传确认后才删除
+            size = os.path.getsize(upload_path)
+            entry_id = self.spool.enqueue(
+                upload_path, session_folder,
+                suffix=suffix, path_in_repo=self._path_in_repo(suffix), frames=attached
+            )
+            self.budget.add(-size, session_name)
+            self.budget.add(size, SPOOL_DIR)
+            journal.stage(STAGE_SPOOLED, entry=entry_id)
+            journal.close()
+            self.upload_state = 'queued'
+            return entry_id
+
+        except ShutdownCancelled:
+            thread_safe_logging('info', f"会话打包已取消，下次启动时继续 - 文件夹: {session_folder}")
+            self.upload_state = 'idle'
+            raise
+        except Exception as e:
+            thread_safe_logging('error', f"会话处理失败 - 文件夹: {session_folder}, 错误: {str(e)}")
+            self.upload_state = 'failed'
+            raise
 
-            # 在所有处理完成后，删除会话文件夹
-            try:
-                import shutil
-                shutil.rmtree(self.session_folder)
-                print(f"\n会话文件夹已删除: {self.session_folder}")
-                thread_safe_logging('info', f"会话文件夹已删除: {self.session_folder}")
-            except Exception as e:
-                thread_safe_logging('error', f"删除文件夹失败: {str(e)}")
-                print(f"\n删除文件夹失败: {str(e)}")
+    def _build_zip_archive(self, session_folder, journal, stages, files, key, iv, progress=None):
+        """压缩并整体加密为 .zip.enc，返回待上传的文件路径。"""
+        session_name = os.path.basename(session_folder)
+        zip_info = stages.get(STAGE_ZIPPED)
+        if zip_info and os.path.exists(os.path.join(session_folder, zip_info['archive'])):
+            zip_path = os.path.join(session_folder, zip_info['archive'])
+            thread_safe_logging('info', f"跳过已完成的压缩阶段: {zip_path}")
+        else:
+            zip_path = os.path.join(session_folder, f"session_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip")
+            thread_safe_logging('info', f"计划生成的ZIP文件路径: {zip_path}")
+            self.zip_folder(session_folder, zip_path, files, progress)
+            self.budget.add(os.path.getsize(zip_path), session_name)
+            journal.stage(STAGE_ZIPPED, archive=os.path.basename(zip_path))
 
-        except Exception as e:
-            thread_safe_logging('error', f"会话处理失败 - 文件夹: {self.session_folder}, 错误: {str(e)}")
+        encrypted_zip_path = zip_path + ".enc"
+        if STAGE_ENCRYPTED in stages and os.path.exists(encrypted_zip_path):
+            thread_safe_logging('info', f"跳过已完成的加密阶段: {encrypted_zip_path}")
+        else:
+            thread_safe_logging('info', f"开始加密ZIP文件，加密文件路径: {encrypted_zip_path}")
+            self.encrypt_file(zip_path, encrypted_zip_path, key, iv, progress)
+            self.budget.add(os.path.getsize(encrypted_zip_path), session_name)
+            journal.stage(STAGE_ENCRYPTED, archive=os.path.basename(encrypted_zip_path))
+        return encrypted_zip_path
+
+    @traced('chunked_archive', 'package')
+    def _build_chunked_archive(self, session_folder, journal, stages, files, key, progress=None):
+        """
+        直接生成分块加密归档（.bgca），跳过 ZIP 阶段。
+        每个数据块独立加密和认证，下游读取单帧时只需解密对应的块。
+        """
+        session_name = os.path.basename(session_folder)
+        archive_info = stages.get(STAGE_ENCRYPTED)
+        if archive_info and os.path.exists(os.path.join(session_folder, archive_info['archive'])):
+            archive_path = os.path.join(session_folder, archive_info['archive'])
+            thread_safe_logging('info', f"跳过已完成的归档阶段: {archive_path}")
+            return archive_path
+
+        archive_path = os.path.join(session_folder, f"session_{datetime.now().strftime('%Y%m%d_%H%M%S')}.bgca")
+        thread_safe_logging('info', f"开始生成分块加密归档: {archive_path}")
+        if files is None:
+            files = self._collect_files(session_folder)
+        writer = ChunkedArchiveWriter(
+            archive_path, key,
+            chunk_size=self.config_service.get_int('archive.chunk_size_kb') * 1024,
+            workers=self.config_service.get_int('archive.workers') or None
+        )
+        verifier = ManifestVerifier(session_folder)
+        if progress is not None:
+            progress.begin(STAGE_ARCHIVING, len(files))
+        try:
+            writer.write_files(session_folder, files, arc_prefix=session_name, verify=verifier.check,
+                               progress=progress)
+        except ShutdownCancelled:
+            thread_safe_logging('info', f"归档已取消，删除未完成的归档: {archive_path}")
+            if os.path.exists(archive_path):
+                os.remove(archive_path)
             raise
+        verifier.report()
+        self.budget.add(os.path.getsize(archive_path), session_name)
+        journal.stage(STAGE_ENCRYPTED, archive=os.path.basename(archive_path))
+        return archive_path
+
+    @staticmethod
+    def _collect_files(session_folder):
+        """没有会话日志时遍历会话文件夹，排除已生成的归档文件。"""
+        files = []
+        for root, dirs, names in os.walk(session_folder):
+            for name in names:
+                if name.endswith(('.zip', '.enc', '.bgca')):
+                    continue
+                files.append(os.path.relpath(os.path.join(root, name), session_folder))
+        return files
+
+    def recover_sessions(self):
+        """
+        恢复被中断的会话：只重放各会话的日志，从中断的阶段继续打包和上传。
+        在后台守护线程中运行，不阻塞启动。
+        """
+        def run():
+            records_path = os.path.join(self.base_path, "records")
+            exclude = os.path.basename(self.session_folder) if self.session_folder else None
+            started = time.time()
+            interrupted = SessionJournal.find_interrupted(records_path, exclude)
+            thread_safe_logging('info', f"发现 {len(interrupted)} 个未完成上传的会话，"
+                                        f"读取日志耗时 {time.time() - started:.2f}s")
+            for state in interrupted:
+                name = os.path.basename(state.folder)
+                # 启动时尚未开始会话，扫描期间才创建的当前会话在这里排除
+                if self.session_folder and name == os.path.basename(self.session_folder):
+                    continue
+                # 开始会话时的回收可能与恢复同时进行，恢复中的会话不被回收
+                if not self.budget.pin(name):
+                    thread_safe_logging('info', f"会话已被回收，跳过恢复: {state.folder}")
+                    continue
+                thread_safe_logging('info', f"恢复会话: {state.folder}，截图 {state.frame_count} 张，"
+                                            f"事件 {state.event_count} 条，已完成阶段: {list(state.stages)}")
+                journal = SessionJournal(state.folder)
+                try:
+                    self.package_and_upload(state.folder, journal, state)
+                except Exception as e:
+                    thread_safe_logging('error', f"恢复会话失败: {state.folder}, 错误: {e}")
+                finally:
+                    journal.close()
+                    self.budget.unpin(name)
+
+        threading.Thread(target=run, name='session-recovery', daemon=True).start()
 
     def start_session(self):
         """在用户同意后启动会话"""
@@ -520,7 +1082,14 @@ class StorageManager:
             timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
             self.session_folder = os.path.join(os.path.join(self.base_path, "records"), timestamp)
             thread_safe_logging('info', f"StorageManager - 创建会话文件夹: {self.session_folder}")
-            
+            self.budget.begin_session(timestamp)
+            self.budget.collect_garbage()
+            # 共享截图存储按最近引用时间回收，回收的字节从配额中扣除
+            freed = self.frame_store.collect_garbage(self.budget.retention_days)
+            if freed:
+                self.budget.add(-freed, FRAME_STORE_DIR)
+            self.frame_hashes = {}
+
             # 创建所需的文件夹
             os.makedirs(self.session_folder, exist_ok=True)
             self.save_path = os.path.join(self.session_folder, 'screenshots')
@@ -533,6 +1102,12 @@ class StorageManager:
             
             self.log_path = os.path.join(self.session_folder, 'log')
             os.makedirs(self.log_path, exist_ok=True)
+
+            # 会话预写日志：记录截图、事件与打包上传进度，用于崩溃后恢复
+            self.journal = SessionJournal(self.session_folder)
+            # 完整性清单：写盘时记录每个文件的哈希，随会话一起打包
+            self.manifest = SessionManifest(self.session_folder)
+            self.journal.file(self.manifest.path)
             
             StorageManager._session_started = True
             return True
@@ -0,0 +1,236 @@
+# storage_budget.py
+
+import os
+import json
+import shutil
+import threading
+import time
+from datetime import datetime
+from logger import thread_safe_logging
+from frame_store import FRAME_STORE_DIR
+from upload_spool import SPOOL_DIR
+
+USAGE_INDEX_FILE = 'usage.json'      # records 目录下的会话占用索引
+UPLOADED_MARKER = '.uploaded'        # 会话上传成功后写入的标记文件
+SESSION_NAME_FORMAT = "%Y-%m-%d_%H-%M-%S"
+
+
+class StorageBudget:
+    """
+    records 目录的磁盘配额管理器。
+    - 每次写入文件时按会话增量累计字节数，不重复遍历目录；
+    - 超过低水位时降低截图质量，超过高水位时拒绝新截图，回落到低水位以下后恢复；
+    - 回收已上传或超过保留期限的旧会话。
+    """
+
+    NORMAL = 'normal'
+    DEGRADED = 'degraded'
+    REFUSING = 'refusing'
+
+    def __init__(self, records_path, config=None):
+        self.records_path = records_path
+        self.lock = threading.Lock()
+        self.usage = {}                # 会话名 -> 已使用字节数
+        self.total = 0
+        self.state = self.NORMAL
+        self.current_session = None
+        self.pinned = set()            # 正在恢复（打包、上传）的会话，回收时跳过
+        self.gc_lock = threading.Lock()
+        self._last_flush = time.time()
+        self._last_gc = 0.0
+        self.configure(config)
+
+        os.makedirs(self.records_path, exist_ok=True)
+        self._load_index()
+
+    def configure(self, config=None):
+        """应用配额配置，运行中修改配置时也会调用。"""
+        config = config or {}
+        with self.lock:
+            self.low_watermark = int(config.get('low_watermark_mb', 2048) * 1024 * 1024)
+            self.high_watermark = int(config.get('high_watermark_mb', 4096) * 1024 * 1024)
+            self.retention_days = config.get('retention_days', 7)
+            self.degraded_quality = config.get('degraded_quality', 60)
+            self.degraded_target_size_kb = config.get('degraded_target_size_kb', 200)
+            self.flush_interval = config.get('flush_interval', 30)  # 索引落盘间隔（秒）
+            self.gc_interval = config.get('gc_interval', 60)        # 拒绝状态下回收的最短间隔（秒）
+            self._update_state()
+
+    # ---------- 索引 ----------
+    def _index_path(self):
+        return os.path.join(self.records_path, USAGE_INDEX_FILE)
+
+    def _load_index(self):
+        """读取占用索引；索引中缺失的会话只在此时补算一次。"""
+        try:
+            with open(self._index_path(), 'r', encoding='utf-8') as f:
+                self.usage = {k: int(v) for k, v in json.load(f).items()}
+        except FileNotFoundError:
+            self.usage = {}
+        except Exception as e:
+            thread_safe_logging('warning', f"读取磁盘占用索引失败，将重新统计: {e}")
+            self.usage = {}
+
+        sessions = set(self._list_sessions())
+        for shared in (FRAME_STORE_DIR, SPOOL_DIR):
+            if os.path.isdir(os.path.join(self.records_path, shared)):
+                sessions.add(shared)  # 共享截图存储与上传队列也计入配额，但不参与会话回收
+        for name in list(self.usage):
+            if name not in sessions:
+                del self.usage[name]
+        for name in sessions - set(self.usage):
+            self.usage[name] = self._measure(os.path.join(self.records_path, name))
+            thread_safe_logging('info', f"补算会话占用: {name}, {self.usage[name] / (1024 * 1024):.2f}MB")
+
+        self.total = sum(self.usage.values())
+        self._update_state()
+        self.flush()
+
+    def flush(self):
+        """将占用索引写回磁盘。"""
+        with self.lock:
+            snapshot = dict(self.usage)
+            self._last_flush = time.time()
+        tmp_path = self._index_path() + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_path, self._index_path())
+        except Exception as e:
+            thread_safe_logging('error', f"保存磁盘占用索引失败: {e}")
+
+    def _list_sessions(self):
+        try:
+            return [entry.name for entry in os.scandir(self.records_path)
+                    if entry.is_dir() and not entry.name.startswith('.')]
+        except FileNotFoundError:
+            return []
+
+    @staticmethod
+    def _measure(folder):
+        total = 0
+        for root, _, files in os.walk(folder):
+            for file in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, file))
+                except OSError:
+                    pass
+        return total
+
+    # ---------- 会话 ----------
+    def begin_session(self, session_name):
+        with self.lock:
+            self.current_session = session_name
+            self.usage.setdefault(session_name, 0)
+
+    def add(self, nbytes, session_name=None):
+        """登记一次写入的字节数，并根据水位更新状态。"""
+        should_flush = False
+        with self.lock:
+            name = session_name or self.current_session
+            if name is None:
+                return
+            self.usage[name] = self.usage.get(name, 0) + nbytes
+            self.total += nbytes
+            self._update_state()
+            should_flush = time.time() - self._last_flush > self.flush_interval
+        if should_flush:
+            self.flush()
+
+    def pin(self, session_name):
+        """
+        登记正在处理的会话，回收时跳过；会话已被回收时返回 False。
+        与 collect_garbage 共用 gc_lock，不会在回收删除目录的过程中登记。
+        """
+        with self.gc_lock:
+            if not os.path.isdir(os.path.join(self.records_path, session_name)):
+                return False
+            self.pinned.add(session_name)
+            return True
+
+    def unpin(self, session_name):
+        with self.gc_lock:
+            self.pinned.discard(session_name)
+
+    def remove_session(self, session_name):
+        """会话文件夹被删除后调用，扣除其占用。"""
+        with self.lock:
+            self.total -= self.usage.pop(session_name, 0)
+            self._update_state()
+        self.flush()
+
+    def mark_uploaded(self, session_folder):
+        """写入上传成功标记，即使随后删除失败，垃圾回收也会处理该会话。"""
+        try:
+            with open(os.path.join(session_folder, UPLOADED_MARKER), 'w', encoding='utf-8') as f:
+                f.write(datetime.now().isoformat())
+        except Exception as e:
+            thread_safe_logging('warning', f"写入上传标记失败: {session_folder}, 错误: {e}")
+
+    # ---------- 水位 ----------
+    def _update_state(self):
+        old_state = self.state
+        if self.total >= self.high_watermark:
+            self.state = self.REFUSING
+        elif self.state == self.REFUSING and self.total > self.low_watermark:
+            pass  # 拒绝状态需回落到低水位以下才解除
+        elif self.total >= self.low_watermark:
+            self.state = self.DEGRADED
+        else:
+            self.state = self.NORMAL
+        if self.state != old_state:
+            thread_safe_logging('warning', f"磁盘配额状态变化: {old_state} -> {self.state}，"
+                                           f"当前占用: {self.total / (1024 * 1024):.2f}MB")
+
+    def allow_frame(self):
+        """是否允许写入新的截图；处于拒绝状态时先尝试回收旧会话。"""
+        if self.state != self.REFUSING:
+            return True
+        if time.time() - self._last_gc > self.gc_interval:
+            self.collect_garbage()
+        return self.state != self.REFUSING
+
+    def capture_quality(self, quality, target_size_kb):
+        """根据当前水位返回实际使用的 JPEG 质量与目标大小。"""
+        if self.state == self.NORMAL:
+            return quality, target_size_kb
+        return min(quality, self.degraded_quality), min(target_size_kb, self.degraded_target_size_kb)
+
+    # ---------- 垃圾回收 ----------
+    def _session_age_days(self, name, folder):
+        try:
+            created = datetime.strptime(name, SESSION_NAME_FORMAT).timestamp()
+        except ValueError:
+            created = os.path.getmtime(folder)
+        return (time.time() - created) / 86400
+
+    def collect_garbage(self):
+        """删除已上传或超过保留期限的会话（当前会话与正在恢复的会话除外），返回回收的字节数。"""
+        with self.gc_lock:
+            return self._collect_garbage()
+
+    def _collect_garbage(self):
+        freed = 0
+        self._last_gc = time.time()
+        for name in self._list_sessions():
+            if name == self.current_session or name in self.pinned:
+                continue
+            folder = os.path.join(self.records_path, name)
+            uploaded = os.path.exists(os.path.join(folder, UPLOADED_MARKER))
+            try:
+                expired = self._session_age_days(name, folder) > self.retention_days
+            except OSError:
+                continue
+            if not (uploaded or expired):
+                continue
+            try:
+                shutil.rmtree(folder)
+            except Exception as e:
+                thread_safe_logging('error', f"回收会话失败: {folder}, 错误: {e}")
+                continue
+            size = self.usage.get(name, 0)
+            freed += size
+            self.remove_session(name)
+            thread_safe_logging('info', f"已回收会话: {name}（{'已上传' if uploaded else '超过保留期限'}），"
+                                        f"释放 {size / (1024 * 1024):.2f}MB")
+        return freed
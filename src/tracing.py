@@ -0,0 +1,155 @@
+# tracing.py
+
+import os
+import json
+import time
+import threading
+import functools
+from collections import deque
+from logger import thread_safe_logging
+
+TRACE_FILE = 'trace.json'  # 会话 log 目录下，Chrome trace-event 格式，可用 Perfetto / chrome://tracing 打开
+TRACE_DIR = '.traces'      # records 目录下，会话关闭后的打包、加密与上传区间（此时归档已生成，无法随会话上传）
+
+
+def now_us():
+    """追踪使用的单调时钟（微秒）。"""
+    return time.perf_counter_ns() // 1000
+
+
+class _NullSpan:
+    """追踪关闭时使用的空区间，进入与退出都不做任何事。"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('tracer', 'name', 'cat', 'event_id', 'start')
+
+    def __init__(self, tracer, name, cat, event_id):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.event_id = event_id
+
+    def __enter__(self):
+        self.start = now_us()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.record(self.name, self.cat, self.start, self.event_id)
+        return False
+
+
+class Tracer:
+    """
+    录制流水线的可选追踪。开启后记录各环节的起止时间（所在线程、事件编号），
+    会话结束时写成 Chrome trace-event JSON，放在会话的 log 目录中随会话上传，
+    用于分析单个事件的延迟（如某次点击的截图为何 3 秒后才写盘）。
+    关闭时 span() 只做一次属性判断；开启时每个区间只追加一个元组到固定容量的环形缓冲区，
+    超出 max_events 时丢弃最早的记录。
+    """
+
+    _instance = None
+    _initialized = False
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super(Tracer, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self, config=None):
+        if Tracer._initialized:
+            return
+        self.enabled = False
+        self.events = deque()
+        self.thread_names = {}  # 线程 id -> 线程名
+        self.recorded = 0
+        self.origin_us = now_us()
+        self.origin_time = time.time()
+        self.configure(config)
+        Tracer._initialized = True
+
+    def configure(self, config=None):
+        config = config or {}
+        max_events = config.get('max_events', 200000)
+        if self.events.maxlen != max_events:
+            self.events = deque(self.events, maxlen=max_events)
+        enabled = config.get('enabled', False)
+        if enabled and not self.enabled:
+            thread_safe_logging('info', f"已开启流水线追踪，最多保留 {max_events} 个区间")
+        self.enabled = enabled
+
+    def record(self, name, cat, start, event_id=None):
+        """登记一个从 start（now_us() 的返回值）到现在的区间，可在任意线程中调用。"""
+        end = now_us()
+        tid = threading.get_ident()
+        if tid not in self.thread_names:
+            self.thread_names[tid] = threading.current_thread().name
+        self.events.append((name, cat, start, end - start, tid, event_id))
+        self.recorded += 1
+
+    def write(self, path):
+        """把缓冲区中的区间写成 Chrome trace-event JSON 并清空缓冲区，返回写入的字节；没有记录时返回 None。"""
+        events = list(self.events)
+        if not events:
+            return None
+        self.events.clear()
+        pid = os.getpid()
+        trace = [{"name": "process_name", "ph": "M", "pid": pid, "tid": 0, "args": {"name": "recorder"}}]
+        for tid, thread_name in list(self.thread_names.items()):
+            trace.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": thread_name}})
+        for name, cat, start, dur, tid, event_id in events:
+            record = {"name": name, "cat": cat, "ph": "X", "ts": start - self.origin_us, "dur": dur,
+                      "pid": pid, "tid": tid}
+            if event_id is not None:
+                record["args"] = {"event_id": event_id}
+            trace.append(record)
+        data = json.dumps({
+            "traceEvents": trace,
+            "displayTimeUnit": "ms",
+            "otherData": {
+                "origin_time": self.origin_time,  # ts 为 0 时对应的 Unix 时间
+                "recorded": self.recorded,
+                "dropped": max(0, self.recorded - len(events))
+            }
+        }, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        self.recorded = 0
+        with open(path, 'wb') as f:
+            f.write(data)
+        thread_safe_logging('info', f"已写出流水线追踪: {path}，{len(events)} 个区间")
+        return data
+
+
+def span(name, cat='recorder', event_id=None):
+    """with span('capture', 'capture', event_id): ... 记录一个区间；追踪未开启时几乎没有开销。"""
+    tracer = Tracer._instance
+    if tracer is None or not tracer.enabled:
+        return _NULL_SPAN
+    return _Span(tracer, name, cat, event_id)
+
+
+def traced(name, cat='recorder'):
+    """函数装饰器版本的 span。"""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            tracer = Tracer._instance
+            if tracer is None or not tracer.enabled:
+                return func(*args, **kwargs)
+            start = now_us()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                tracer.record(name, cat, start)
+        return wrapper
+    return decorate
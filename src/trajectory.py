@@ -0,0 +1,107 @@
+# trajectory.py
+
+import threading
+import time
+from array import array
+
+
+def simplify_path(points, tolerance):
+    """Ramer–Douglas–Peucker 路径简化（非递归），points 为 [(t, x, y), ...]。"""
+    if len(points) < 3 or tolerance <= 0:
+        return list(points)
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    tolerance_sq = tolerance * tolerance
+    while stack:
+        first, last = stack.pop()
+        _, x1, y1 = points[first]
+        _, x2, y2 = points[last]
+        dx, dy = x2 - x1, y2 - y1
+        length_sq = dx * dx + dy * dy
+        max_dist, index = -1.0, first
+        for i in range(first + 1, last):
+            _, px, py = points[i]
+            if length_sq == 0:
+                dist = (px - x1) ** 2 + (py - y1) ** 2
+            else:
+                cross = dx * (py - y1) - dy * (px - x1)
+                dist = cross * cross / length_sq
+            if dist > max_dist:
+                max_dist, index = dist, i
+        if max_dist > tolerance_sq:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return [p for p, k in zip(points, keep) if k]
+
+
+class TrajectoryBuffer:
+    """
+    鼠标轨迹缓冲区。
+    on_move 每秒可能触发上千次，这里只做一次距离判断和数组追加：
+    与上一个保留点距离小于 min_distance 且间隔不超过 max_gap 的移动只更新当前位置，不保存。
+    取出轨迹时再用 RDP 简化，附加到点击、拖拽事件上。
+    """
+
+    def __init__(self, min_distance=3, max_gap=0.25, capacity=4096):
+        self.lock = threading.Lock()
+        self.min_distance = min_distance
+        self.max_gap = max_gap
+        self.capacity = capacity
+        self.t = array('d')
+        self.x = array('d')
+        self.y = array('d')
+        self.current = None   # 最近一次移动的位置 (x, y)，不论是否被保留
+        self.current_time = 0.0
+
+    def configure(self, min_distance=None, max_gap=None):
+        if min_distance is not None:
+            self.min_distance = min_distance
+        if max_gap is not None:
+            self.max_gap = max_gap
+
+    def add(self, x, y, t=None):
+        """登记一次鼠标移动（监听线程调用）。"""
+        t = t or time.time()
+        with self.lock:
+            self.current = (x, y)
+            self.current_time = t
+            if self.t:
+                dx, dy = x - self.x[-1], y - self.y[-1]
+                if dx * dx + dy * dy < self.min_distance * self.min_distance \
+                        and t - self.t[-1] < self.max_gap:
+                    return
+                if dx == 0 and dy == 0:
+                    return
+            self.t.append(t)
+            self.x.append(x)
+            self.y.append(y)
+            if len(self.t) > self.capacity:
+                # 长时间没有事件取走轨迹时丢弃较旧的一半
+                half = self.capacity // 2
+                del self.t[:half]
+                del self.x[:half]
+                del self.y[:half]
+
+    def position(self):
+        """当前光标位置，尚未收到移动事件时返回 None。"""
+        with self.lock:
+            return self.current
+
+    def take(self, tolerance=2.0):
+        """
+        取出自上次取出以来的轨迹（含当前位置）并简化，返回 [(t, x, y), ...]。
+        最后一个点保留在缓冲区中，作为下一段轨迹的起点。
+        """
+        with self.lock:
+            points = list(zip(self.t, self.x, self.y))
+            if self.current is not None and (not points or points[-1][1:] != self.current):
+                points.append((self.current_time, self.current[0], self.current[1]))
+            del self.t[:], self.x[:], self.y[:]
+            if points:
+                last = points[-1]
+                self.t.append(last[0])
+                self.x.append(last[1])
+                self.y.append(last[2])
+        return simplify_path(points, tolerance)
@@ -1,31 +1,65 @@
-from PyQt5 import QtWidgets, QtGui, QtCore
+from PyQt5 import QtWidgets, QtGui
 from PyQt5.QtCore import Qt, QTimer, pyqtSignal, QThread
 from permission import request_permission
 from storage import StorageManager
 from logger import thread_safe_logging
 from action_recorder_thread import ActionRecorderThread
-import pyautogui
+from periodic_capture import PeriodicCaptureThread
+from event_bus import EventBus
+from shutdown import (ShutdownProgress, ShutdownCancelled, STAGE_LABELS, STAGE_STOPPING, STAGE_ARCHIVING,
+                      STAGE_DONE, STAGE_DEFERRED, STAGE_FAILED)
 import os
 import sys
-from datetime import datetime
 
 
-class ProcessSessionThread(QThread):
+class ShutdownThread(QThread):
+    """
+    结束会话的后台流程：停止定时截屏与动作记录、等待截图写盘，再打包、加密并上传。
+    所有等待都在本线程中进行，界面线程只轮询 progress 显示进度；
+    取消后已完成的阶段保留在会话日志与上传队列中，下次启动时继续。
+    """
     error_occurred = pyqtSignal(str)
-    finished_signal = pyqtSignal()
+    finished_signal = pyqtSignal(str)  # 最终阶段：done / deferred
 
-    def __init__(self, storage_manager):
+    def __init__(self, storage_manager, capture_thread=None, action_recorder_thread=None):
         super().__init__()
         self.storage_manager = storage_manager
-    
+        self.capture_thread = capture_thread
+        self.action_recorder_thread = action_recorder_thread
+        self.progress = ShutdownProgress()
+
     def run(self):
         try:
-            self.storage_manager.process_session()
+            if self.capture_thread:
+                self.capture_thread.stop()
+                thread_safe_logging('info', "定时截屏线程已停止")
+            if self.action_recorder_thread:
+                thread_safe_logging('info', "准备停止动作记录线程")
+                self.action_recorder_thread.stop()
+                thread_safe_logging('info', "动作记录线程已停止")
+            uploaded = self.storage_manager.process_session(self.progress)
+            stage = STAGE_DONE if uploaded else STAGE_DEFERRED
             thread_safe_logging('info', "会话处理完成，准备退出。")
-            self.finished_signal.emit()
+        except ShutdownCancelled:
+            stage = STAGE_DEFERRED
+            thread_safe_logging('info', "用户取消了结束流程，会话将在下次启动时继续处理。")
         except Exception as e:
             thread_safe_logging('error', f"会话处理过程中出错: {e}")
+            self.progress.finish(STAGE_FAILED)
             self.error_occurred.emit(f"会话处理出错: {e}")
+            return
+        self.progress.finish(stage)
+        self.finished_signal.emit(stage)
+
+
+UPLOAD_STATE_LABELS = {
+    'idle': '未开始',
+    'packaging': '打包中',
+    'queued': '排队上传',
+    'uploading': '上传中',
+    'uploaded': '已上传',
+    'failed': '上传失败（下次启动时重试）',
+}
 
 
 class MainWindow(QtWidgets.QWidget):
@@ -38,9 +72,20 @@ class MainWindow(QtWidgets.QWidget):
         self.storage_manager = StorageManager(config.get('save_path', 'screenshots'))
         self.action_recorder_thread = None
         self.process_thread = None
+        self.capture_thread = None
         self.is_processing = False
+        self.shutdown_failed = False  # 结束流程出错后可直接关闭，会话在下次启动时恢复
         self.should_quit = False
-        self.upload_in_progress_msg = None  # 添加上传提示框变量
+        self.upload_in_progress_msg = None  # 结束流程的进度对话框
+        self.event_bus = EventBus()
+
+        # 按固定频率批量取走录制事件并刷新会话统计
+        self.stats_timer = QTimer(self)
+        self.stats_timer.timeout.connect(self.refresh_stats)
+
+        # 结束流程中轮询进度，不阻塞界面线程
+        self.shutdown_timer = QTimer(self)
+        self.shutdown_timer.timeout.connect(self.refresh_shutdown_progress)
         
         # 设置窗口属性
         self.setWindowTitle('熊猫实习生')
@@ -52,27 +97,50 @@ class MainWindow(QtWidgets.QWidget):
         # 初始化UI和动作记录器
         self.init_ui()
         self.init_action_recorder()
+
+        # 后台恢复上次被中断的会话（继续打包和上传）
+        self.storage_manager.recover_sessions()
         
         # 连接信号
         self.error_signal.connect(self.show_error)
         self.quit_signal.connect(QtWidgets.QApplication.quit)
-        
-        # 初始化定时器
-        self.timer = QtCore.QTimer()
-        self.timer.timeout.connect(self.capture_screenshot)
-        self.storage_manager.app_timer = self.timer
+        # 退出前中断后台上传，避免上传线程在窗口关闭后继续运行
+        QtWidgets.QApplication.instance().aboutToQuit.connect(self.storage_manager.stop_uploads)
     
     def init_action_recorder(self):
         if self.config.get('record_user_actions', True):
             self.action_recorder_thread = ActionRecorderThread(
                 log_file=self.config.get('user_actions_log', 'log/user_actions.log')
             )
-            self.action_recorder_thread.action_recorded.connect(self.handle_action_recorded)
             self.action_recorder_thread.start()
     
-    def handle_action_recorded(self, action):
-        thread_safe_logging('debug', f"接收到用户操作: {action}")
+    def refresh_stats(self):
+        """取走自上次刷新以来的事件批次，更新事件速率、待编码截图、磁盘占用与上传状态。"""
+        batch = self.event_bus.drain()
+        if batch:
+            last = batch[-1]
+            thread_safe_logging('debug', f"界面收到 {len(batch)} 条事件，最新: {last.event_id} {last.action_type}")
+
+        service = self.storage_manager.config_service
+        queued = self.storage_manager.encoder.queued()
+        behind = queued >= service.get_int('ui.behind_threshold')
+        self.stats_label.setText(
+            f"事件: {self.event_bus.events_per_minute():.0f} 条/分钟（共 {self.event_bus.total} 条）\n"
+            f"待编码截图: {queued}{'（录制落后）' if behind else ''}\n"
+            f"磁盘占用: {self.storage_manager.budget.total / (1024 * 1024):.1f}MB\n"
+            f"上传状态: {UPLOAD_STATE_LABELS.get(self.storage_manager.upload_state, self.storage_manager.upload_state)}"
+            f"（队列 {self.storage_manager.spool.pending_count()} 个）"
+            f"{self._governor_text()}"
+        )
+        self.stats_label.setStyleSheet("color: #d32f2f;" if behind else "color: #555555;")
     
+    def _governor_text(self):
+        state = self.storage_manager.governor.state
+        if state is None:
+            return ""
+        mode = f"限制（{'电池供电' if state.on_battery else '系统繁忙'}）" if state.throttled else "正常"
+        return f"\n资源模式: {mode}，本程序 CPU {state.own_percent:.0f}%，系统 {state.system_percent:.0f}%"
+
     def init_ui(self):
         self.layout = QtWidgets.QVBoxLayout()
     
@@ -104,6 +172,12 @@ class MainWindow(QtWidgets.QWidget):
         self.stop_close_btn.clicked.connect(self.on_stop_and_close)
         self.layout.addWidget(self.stop_close_btn)
         self.stop_close_btn.hide()  # 初始隐藏
+
+        # 会话统计面板，会话开始后显示
+        self.stats_label = QtWidgets.QLabel()
+        self.stats_label.setAlignment(Qt.AlignLeft)
+        self.layout.addWidget(self.stats_label)
+        self.stats_label.hide()
     
         self.setLayout(self.layout)
        
@@ -117,8 +191,12 @@ class MainWindow(QtWidgets.QWidget):
                     f"程序已启动，将自动截取屏幕，并记录用户操作。"
                 )
                 interval = self.config.get('screenshot_interval', 20)
-                self.timer.start(interval * 1000)  # 毫秒
-                thread_safe_logging('info', f"启动截屏定时器，每{interval}秒进行一次截屏。")
+                self.capture_thread = PeriodicCaptureThread(
+                    self.storage_manager, interval, self.storage_manager.config_service.section('periodic_capture')
+                )
+                self.capture_thread.start()
+                self.stats_timer.start(self.storage_manager.config_service.get_int('ui.refresh_interval_ms'))
+                thread_safe_logging('info', f"启动后台定时截屏，初始间隔{interval}秒，画面静止时自动退避。")
                 self.show_stop_close_button()
         else:
             self.on_decline()
@@ -133,8 +211,10 @@ class MainWindow(QtWidgets.QWidget):
         self.label.hide()
         self.accept_btn.hide()
         self.decline_btn.hide()
-        # 显示停止记录并关闭按钮
+        # 显示停止记录并关闭按钮和会话统计
         self.stop_close_btn.show()
+        self.refresh_stats()
+        self.stats_label.show()
     
     def on_stop_and_close(self):
         if self.is_processing:
@@ -144,56 +224,93 @@ class MainWindow(QtWidgets.QWidget):
         self.should_quit = True
         thread_safe_logging('info', "用户点击'停止记录并关闭'按钮")
         
-        # 显示上传进度提示
-        self.upload_in_progress_msg = QtWidgets.QMessageBox(self)
-        self.upload_in_progress_msg.setWindowTitle("上传中")
-        self.upload_in_progress_msg.setText("数据文件正在上传中，请勿关闭窗口...")
-        self.upload_in_progress_msg.setStandardButtons(QtWidgets.QMessageBox.NoButton)
-        self.upload_in_progress_msg.setIcon(QtWidgets.QMessageBox.Information)
-        self.upload_in_progress_msg.show()
-        
-        # 停止定时器
-        if self.timer.isActive():
-            self.timer.stop()
-            thread_safe_logging('info', "定时器已停止")
-    
         # 禁用按钮防止重复点击
         self.stop_close_btn.setEnabled(False)
-        
-        # 停止动作记录线程
-        if self.action_recorder_thread:
-            thread_safe_logging('info', "准备停止动作记录线程")
-            self.action_recorder_thread.stop()
-            thread_safe_logging('info', "动作记录线程已停止")
-    
-        # 处理会话并退出
-        thread_safe_logging('info', "准备启动处理会话线程")
-        self.process_thread = ProcessSessionThread(self.storage_manager)
+        self.stats_timer.stop()
+
+        # 停止录制、打包与上传都在后台线程中进行
+        thread_safe_logging('info', "准备启动结束会话线程")
+        self.process_thread = ShutdownThread(self.storage_manager, self.capture_thread, self.action_recorder_thread)
         self.process_thread.error_occurred.connect(self.show_error)
         self.process_thread.finished_signal.connect(self.on_upload_finished)
+        self.process_thread.finished.connect(self.on_shutdown_thread_finished)
+
+        # 显示各阶段进度，取消时把剩余工作留到下次启动
+        self.upload_in_progress_msg = QtWidgets.QProgressDialog(self)
+        self.upload_in_progress_msg.setWindowTitle("上传中")
+        self.upload_in_progress_msg.setLabelText(STAGE_LABELS[STAGE_STOPPING])
+        self.upload_in_progress_msg.setCancelButtonText("稍后上传")
+        self.upload_in_progress_msg.setAutoClose(False)
+        self.upload_in_progress_msg.setAutoReset(False)
+        self.upload_in_progress_msg.setMinimumDuration(0)
+        self.upload_in_progress_msg.setRange(0, 0)
+        self.upload_in_progress_msg.canceled.connect(self.on_cancel_shutdown)
+        self.upload_in_progress_msg.show()
+
         self.process_thread.start()
-    
-    def on_upload_finished(self):
-        """上传完成后的处理"""
+        self.shutdown_timer.start(200)
+
+    def shutdown_running(self):
+        return self.process_thread is not None and self.process_thread.isRunning()
+
+    def on_cancel_shutdown(self):
+        """取消结束流程：中断当前阶段，已完成的部分保存在本地，下次启动时继续。"""
+        if not self.shutdown_running():
+            return
+        thread_safe_logging('info', "用户选择稍后上传")
+        self.process_thread.progress.cancel()
+        dialog = self.upload_in_progress_msg
+        if dialog:
+            # 取消会隐藏对话框，重新显示为不可取消的等待状态
+            dialog.setCancelButton(None)
+            dialog.setRange(0, 0)
+            dialog.setLabelText("正在保存进度，请稍候...")
+            dialog.show()
+
+    def refresh_shutdown_progress(self):
+        if self.process_thread is None or self.upload_in_progress_msg is None:
+            return
+        status = self.process_thread.progress.snapshot()
+        if status.cancelled:
+            return
+        dialog = self.upload_in_progress_msg
+        text = STAGE_LABELS.get(status.stage, status.stage)
+        if status.total:
+            dialog.setRange(0, 1000)
+            dialog.setValue(int(min(status.done, status.total) * 1000 / status.total))
+            if status.stage in (STAGE_STOPPING, STAGE_ARCHIVING):
+                text += f"：{status.done}/{status.total} 个"
+            else:
+                text += f"：{status.done / (1024 * 1024):.1f}/{status.total / (1024 * 1024):.1f}MB"
+            if status.eta is not None:
+                text += f"，预计剩余 {int(status.eta) // 60} 分 {int(status.eta) % 60} 秒"
+        else:
+            dialog.setRange(0, 0)  # 总量未知时显示忙碌状态
+        dialog.setLabelText(text)
+
+    def on_upload_finished(self, stage):
+        """结束流程完成（上传成功，或已保存到本地等待下次上传）后退出。"""
+        self.shutdown_timer.stop()
         if self.upload_in_progress_msg:
             self.upload_in_progress_msg.close()
-        thread_safe_logging('info', "会话处理完成，程序将退出。")
-        QtWidgets.QMessageBox.information(self, '完成', '上传完成，程序将退出。')
+        thread_safe_logging('info', f"会话处理结束（{stage}），程序将退出。")
+        if stage == STAGE_DONE:
+            QtWidgets.QMessageBox.information(self, '完成', '上传完成，程序将退出。')
+        else:
+            QtWidgets.QMessageBox.information(self, '完成', f"{STAGE_LABELS[STAGE_DEFERRED]}，程序将退出。")
         self.final_quit()
     
-    def capture_screenshot(self):
-        try:
-            timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-            screenshot = pyautogui.screenshot()
-            filename = f"screenshot_{timestamp}.png"
-            self.storage_manager.save_screenshot(screenshot=screenshot, filename=filename)
-            thread_safe_logging('info', f"已保存截图: {filename}")
-        except Exception as e:
-            thread_safe_logging('error', f"截屏失败: {e}")
-    
     def closeEvent(self, event):
         thread_safe_logging('info', "触发窗口关闭事件")
-        if hasattr(self, 'stop_close_btn') and self.stop_close_btn.isVisible():
+        if self.shutdown_running():
+            # 结束流程进行中：视为稍后上传，等待当前阶段保存后退出
+            self.on_cancel_shutdown()
+            event.ignore()
+        elif self.shutdown_failed:
+            # 结束流程出错后直接退出，会话日志保留，下次启动时恢复打包与上传
+            thread_safe_logging('info', "结束流程出错后关闭窗口，会话将在下次启动时恢复")
+            event.accept()
+        elif hasattr(self, 'stop_close_btn') and self.stop_close_btn.isVisible():
             reply = QtWidgets.QMessageBox.question(
                 self, '确认退出',
                 "确定要退出应用程序吗？",
@@ -210,10 +327,29 @@ class MainWindow(QtWidgets.QWidget):
             # 如果还没开始记录，直接退出
             event.accept()
     
-    def show_error(self, message):
-        QtWidgets.QMessageBox.critical(self, '错误', message)
+    def on_shutdown_thread_finished(self):
+        """
+        结束流程线程退出后调用。出错时线程发出 error_occurred 后才结束，
+        要等到这里再释放线程引用，之后才允许重试或直接关闭窗口。
+        """
+        thread = self.process_thread
+        if thread is None or thread.progress.snapshot().stage != STAGE_FAILED:
+            return
+        self.process_thread = None
+        thread.deleteLater()
+        self.is_processing = False
+        self.shutdown_failed = True
         # Re-enable stop and close button in case of error
         self.stop_close_btn.setEnabled(True)
+
+    def show_error(self, message):
+        self.shutdown_timer.stop()
+        if self.upload_in_progress_msg:
+            self.upload_in_progress_msg.close()
+            self.upload_in_progress_msg = None
+        QtWidgets.QMessageBox.critical(self, '错误', message)
+        if not self.is_processing:
+            self.stop_close_btn.setEnabled(True)
     
     def final_quit(self):
         thread_safe_logging('info', "会话处理完成，准备退出。")
@@ -0,0 +1,331 @@
+# upload_spool.py
+
+import io
+import os
+import json
+import threading
+import time
+from logger import thread_safe_logging
+
+SPOOL_DIR = '.spool'             # records 目录下的上传队列目录
+SPOOL_STATE_FILE = 'spool.json'
+
+PENDING = 'pending'
+UPLOADING = 'uploading'
+
+
+class UploadAborted(Exception):
+    """上传队列停止（程序退出）时中断正在进行的传输，条目留在队列中，下次启动后重新上传。"""
+
+
+class TokenBucket:
+    """多个上传线程共享的带宽限制，rate 为每秒字节数，0 表示不限速。"""
+
+    def __init__(self, rate=0):
+        self.lock = threading.Lock()
+        self.rate = rate
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+
+    def consume(self, nbytes):
+        if self.rate <= 0:
+            return
+        with self.lock:
+            now = time.monotonic()
+            # 最多积累 1 秒的额度，避免空闲后瞬间突发
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= nbytes
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+
+class ThrottledReader(io.BufferedIOBase):
+    """
+    按令牌桶限速读取文件，作为流式上传的数据源：上传接口边读边发送，
+    读取的节奏即网络发送的节奏，带宽限制作用在实际传输上。
+    progress 提供 check() 与 advance(n)：按读出的字节推进进度，取消时让上传接口以异常结束本次尝试；
+    abort 为上传队列的停止事件，设置后同样以 UploadAborted 结束本次传输。
+    """
+
+    def __init__(self, fileobj, bucket, progress=None, abort=None):
+        super().__init__()
+        self.fileobj = fileobj
+        self.bucket = bucket
+        self.progress = progress
+        self.abort = abort
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        if self.abort is not None and self.abort.is_set():
+            raise UploadAborted()
+        if self.progress is not None:
+            self.progress.check()
+        data = self.fileobj.read(size)
+        self.bucket.consume(len(data))
+        if self.progress is not None:
+            self.progress.advance(len(data))
+        return data
+
+    def read1(self, size=-1):
+        return self.read(size)
+
+    def close(self):
+        self.fileobj.close()
+        super().close()
+
+
+class UploadSpool:
+    """
+    持久化的上传队列。打包好的归档移入 records/.spool，条目记录在 spool.json 中；
+    后台上传线程以有限并发上传，失败后指数退避重试，程序重启后继续上传。
+    只有上传接口确认成功后才删除归档，并通过 on_uploaded 回调清理会话数据。
+    上传线程为守护线程，退出时由 stop 中断传输并限时等待，不会让进程在后台继续上传。
+    """
+
+    def __init__(self, records_path, uploader, on_uploaded=None, config=None):
+        self.root = os.path.join(records_path, SPOOL_DIR)
+        self.uploader = uploader          # uploader(归档路径, 条目, 令牌桶) -> bool
+        self.on_uploaded = on_uploaded    # on_uploaded(条目)，上传确认后调用
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.entries = {}
+        self.bucket = TokenBucket()
+        self.thread = None
+        self.uploads = {}  # 条目编号 -> 上传线程
+        self.initializer = None
+        self.initargs = ()
+        self.stopping = False
+        self.abort_event = threading.Event()
+        self.rate_cap = 0  # 资源调控给出的带宽上限（字节/秒），0 表示不限制
+        os.makedirs(self.root, exist_ok=True)
+        self.configure(config)
+        self._load()
+
+    def configure(self, config=None):
+        config = config or {}
+        self.workers = config.get('workers', 2)
+        self.retry_base = config.get('retry_base', 30)
+        self.retry_max = config.get('retry_max', 3600)
+        self.rate = config.get('bandwidth_kbps', 0) * 1024
+        self._apply_rate()
+        with self.lock:
+            self.changed.notify_all()
+
+    def set_rate_cap(self, kbps):
+        """资源调控使用：在配置的带宽之外再加一个上限，0 表示取消。"""
+        self.rate_cap = kbps * 1024
+        self._apply_rate()
+
+    def _apply_rate(self):
+        rates = [r for r in (self.rate, self.rate_cap) if r > 0]
+        self.bucket.rate = min(rates) if rates else 0
+
+    # ---------- 状态文件 ----------
+    def _state_path(self):
+        return os.path.join(self.root, SPOOL_STATE_FILE)
+
+    def _load(self):
+        try:
+            with open(self._state_path(), 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            self.entries = {}
+        except Exception as e:
+            thread_safe_logging('error', f"读取上传队列状态失败: {e}")
+            self.entries = {}
+        for entry_id, entry in list(self.entries.items()):
+            if not os.path.exists(os.path.join(self.root, entry['file'])):
+                thread_safe_logging('warning', f"上传队列中的归档已不存在，移除条目: {entry_id}")
+                del self.entries[entry_id]
+                continue
+            entry['status'] = PENDING  # 上次退出时正在上传的条目重新上传
+        # 移入队列目录后、登记前被中断的归档没有条目，会话恢复时会重新生成
+        known = {entry['file'] for entry in self.entries.values()}
+        for name in os.listdir(self.root):
+            if name not in known and not name.startswith(SPOOL_STATE_FILE):
+                try:
+                    os.remove(os.path.join(self.root, name))
+                    thread_safe_logging('warning', f"删除未登记的队列文件: {name}")
+                except OSError:
+                    pass
+        if self.entries:
+            thread_safe_logging('info', f"上传队列中有 {len(self.entries)} 个待上传的归档")
+        self._save()
+
+    def _save(self):
+        tmp_path = self._state_path() + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self._state_path())
+
+    # ---------- 入队 ----------
+    def enqueue(self, archive_path, session_folder, **info):
+        """把归档移入队列目录并登记，返回条目编号（即会话名，重复入队时返回已有条目）。"""
+        entry_id = os.path.basename(session_folder)
+        with self.lock:
+            if entry_id in self.entries:
+                return entry_id
+            filename = entry_id + '_' + os.path.basename(archive_path)
+            os.replace(archive_path, os.path.join(self.root, filename))
+            entry = {
+                "file": filename,
+                "session_folder": session_folder,
+                "size": os.path.getsize(os.path.join(self.root, filename)),
+                "created": time.time(),
+                "attempts": 0,
+                "next_attempt": 0,
+                "status": PENDING,
+            }
+            entry.update(info)
+            self.entries[entry_id] = entry
+            self._save()
+            self.changed.notify_all()
+        thread_safe_logging('info', f"归档已加入上传队列: {filename}，{entry['size'] / (1024 * 1024):.2f}MB")
+        return entry_id
+
+    def has(self, entry_id):
+        with self.lock:
+            return entry_id in self.entries
+
+    def pending_count(self):
+        with self.lock:
+            return len(self.entries)
+
+    def uploading_count(self):
+        with self.lock:
+            return sum(1 for e in self.entries.values() if e['status'] == UPLOADING)
+
+    def wait(self, entry_id, timeout=None, cancel=None):
+        """
+        等待条目完成一次上传尝试，成功返回 True；失败时返回 False，
+        条目留在队列中由后台重试（包括下次启动后）。
+        cancel 为 threading.Event，设置后不再等待，立即返回。
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.lock:
+            entry = self.entries.get(entry_id)
+            if entry is None:
+                return True
+            attempts = entry['attempts']
+            while entry_id in self.entries and self.entries[entry_id]['attempts'] <= attempts:
+                if cancel is not None and cancel.is_set():
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                # 有取消事件时分段等待，以便及时响应
+                if cancel is not None:
+                    remaining = 0.2 if remaining is None else min(remaining, 0.2)
+                self.changed.wait(remaining)
+            return entry_id not in self.entries
+
+    # ---------- 上传 ----------
+    def start(self, initializer=None, initargs=()):
+        """启动分发线程。initializer(*initargs) 在每个上传线程开始时调用（如降低优先级）。"""
+        if self.thread is not None:
+            return
+        self.initializer = initializer
+        self.initargs = initargs
+        self.thread = threading.Thread(target=self._dispatch_loop, name='upload-spool', daemon=True)
+        self.thread.start()
+
+    def _next_due(self):
+        """在锁内调用：返回可以开始上传的条目，以及距离下一个条目到期的秒数。"""
+        now = time.time()
+        in_flight = sum(1 for e in self.entries.values() if e['status'] == UPLOADING)
+        due = []
+        wait = None
+        for entry_id, entry in sorted(self.entries.items(), key=lambda item: item[1]['created']):
+            if entry['status'] != PENDING:
+                continue
+            if entry['next_attempt'] <= now:
+                if in_flight + len(due) < self.workers:
+                    due.append(entry_id)
+            else:
+                delay = entry['next_attempt'] - now
+                wait = delay if wait is None else min(wait, delay)
+        return due, wait
+
+    def _dispatch_loop(self):
+        while True:
+            with self.lock:
+                due, wait = self._next_due()
+                while not due and not self.stopping:
+                    self.changed.wait(wait)
+                    due, wait = self._next_due()
+                if self.stopping:
+                    return
+                for entry_id in due:
+                    self.entries[entry_id]['status'] = UPLOADING
+                    # 分发时已按 workers 限制同时上传的条目数，每个条目使用一个上传线程
+                    thread = threading.Thread(target=self._run_upload, args=(entry_id,),
+                                              name='spool-upload', daemon=True)
+                    self.uploads[entry_id] = thread
+                    thread.start()
+                self._save()
+
+    def _run_upload(self, entry_id):
+        try:
+            if self.initializer is not None:
+                self.initializer(*self.initargs)
+            self._upload(entry_id)
+        finally:
+            with self.lock:
+                self.uploads.pop(entry_id, None)
+
+    def _upload(self, entry_id):
+        with self.lock:
+            entry = dict(self.entries[entry_id])
+        path = os.path.join(self.root, entry['file'])
+        try:
+            ok = self.uploader(path, entry, self.bucket)
+        except Exception as e:
+            thread_safe_logging('error', f"上传队列条目失败: {entry_id}, 错误: {e}")
+            ok = False
+
+        if ok:
+            # 先完成清理再移除条目，等待该条目的调用方返回时会话数据已处理完毕
+            try:
+                os.remove(path)
+            except OSError as e:
+                thread_safe_logging('warning', f"删除已上传的归档失败: {path}, 错误: {e}")
+            if self.on_uploaded is not None:
+                try:
+                    self.on_uploaded(entry)
+                except Exception as e:
+                    thread_safe_logging('error', f"上传完成后清理失败: {entry_id}, 错误: {e}")
+
+        with self.lock:
+            current = self.entries[entry_id]
+            current['attempts'] += 1
+            if ok:
+                del self.entries[entry_id]
+                thread_safe_logging('info', f"上传队列条目已完成: {entry_id}")
+            else:
+                delay = min(self.retry_base * 2 ** (current['attempts'] - 1), self.retry_max)
+                current['status'] = PENDING
+                current['next_attempt'] = time.time() + delay
+                thread_safe_logging('warning', f"上传失败，{delay:.0f} 秒后重试: {entry_id}（第 {current['attempts']} 次）")
+            self._save()
+            self.changed.notify_all()
+
+    def stop(self, timeout=5.0):
+        """
+        停止分发并中断正在进行的传输，最多等待 timeout 秒让上传线程记录结果。
+        仍未结束的线程（如正在提交）随进程退出，条目在下次启动时重新上传。
+        """
+        with self.lock:
+            self.stopping = True
+            self.abort_event.set()
+            self.changed.notify_all()
+            threads = list(self.uploads.values())
+        deadline = time.monotonic() + timeout
+        for thread in threads:
+            thread.join(max(0, deadline - time.monotonic()))
+        remaining = sum(1 for thread in threads if thread.is_alive())
+        if remaining:
+            thread_safe_logging('warning', f"{remaining} 个上传未在 {timeout} 秒内结束，下次启动时重新上传")